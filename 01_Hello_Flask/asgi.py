@@ -0,0 +1,14 @@
+import os
+
+from asgiref.wsgi import WsgiToAsgi
+from dotenv import load_dotenv
+
+dotenv_path = os.path.join(os.path.dirname(__file__), '.env')
+if os.path.exists(dotenv_path):
+    load_dotenv(dotenv_path)
+
+from watchlist import create_app
+
+# ASGI 入口：uvicorn asgi:app --workers 4
+# 连接由 ASGI 服务器的事件循环管理，只有正在处理的请求占用线程
+app = WsgiToAsgi(create_app(os.getenv('FLASK_CONFIG', 'production')))
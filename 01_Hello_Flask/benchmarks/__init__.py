@@ -0,0 +1,6 @@
+"""
+性能基准测试
+
+    python -m benchmarks endpoints --sizes 100,10000 --output before.json
+    python -m benchmarks compare before.json after.json
+"""
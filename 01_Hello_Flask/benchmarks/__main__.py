@@ -0,0 +1,72 @@
+import json
+import sys
+
+import click
+
+from benchmarks.compression import compression
+from benchmarks.endpoints import endpoints
+from benchmarks.login import login
+from benchmarks.replica import replica
+from benchmarks.serving import serving
+from benchmarks.sessions import sessions
+from benchmarks.sqlite import sqlite
+from benchmarks.startup import startup
+from benchmarks.streaming import streaming
+from benchmarks.templates import templates
+from benchmarks.writes import writes
+
+
+@click.group()
+def cli():
+    """
+    Watchlist benchmarks.
+    """
+
+
+@cli.command()
+@click.argument('baseline', type=click.File())
+@click.argument('current', type=click.File())
+@click.option('--metric', default='p95_ms', show_default=True, help='Metric to compare.')
+@click.option('--threshold', default=10.0, show_default=True, help='Allowed slowdown in percent.')
+def compare(baseline, current, metric, threshold):
+    """
+    Compare two JSON reports and fail on regressions.
+    """
+    def key(row):
+        return tuple(sorted((k, v) for k, v in row.items()
+                            if isinstance(v, str) or k in ('size', 'users', 'other_movies', 'writers', 'readers')))
+
+    old = {key(row): row for row in json.load(baseline)['results']}
+    regressions = 0
+    for row in json.load(current)['results']:
+        before = old.get(key(row))
+        if before is None or metric not in row or not before.get(metric):
+            continue
+        change = (row[metric] - before[metric]) / before[metric] * 100
+        # 吞吐量越大越好，其余指标越小越好
+        worse = -change if metric.endswith('_rps') else change
+        flag = ''
+        if worse > threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        label = ' '.join(str(v) for k, v in key(row))
+        click.echo('%-40s %10s -> %10s %+7.1f%%%s' % (label, before[metric], row[metric], change, flag))
+    if regressions:
+        click.echo('%d regression(s) above %.0f%%.' % (regressions, threshold))
+        sys.exit(1)
+
+
+cli.add_command(compression)
+cli.add_command(endpoints)
+cli.add_command(login)
+cli.add_command(replica)
+cli.add_command(serving)
+cli.add_command(sessions)
+cli.add_command(sqlite)
+cli.add_command(startup)
+cli.add_command(streaming)
+cli.add_command(templates)
+cli.add_command(writes)
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,166 @@
+import datetime
+import json
+import math
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import click
+
+# 让 python -m benchmarks 在项目目录外运行时也能导入 watchlist
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+USERNAME = 'bench'
+PASSWORD = 'bench-password'
+
+
+def load_app(db_path=None, config_name='production', **config):
+    """
+    创建指向临时数据库的程序实例，返回 (app, db)
+    """
+    from watchlist import create_app, db
+
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix='watchlist-bench-'), 'bench.db')
+    # 基准测试会从同一地址反复登录，放宽登录限流
+    config.setdefault('WATCHLIST_LOGIN_LIMIT', 10 ** 9)
+    app = create_app(config_name, SQLALCHEMY_DATABASE_URI='sqlite:///' + db_path, **config)
+    return app, db
+
+
+def seed(db, size, users=1, other_movies=0):
+    """
+    重建数据库并给第一个用户写入 size 部电影，第一个用户可以用 USERNAME/PASSWORD 登录
+
+    other_movies 部电影轮流分配给其他用户，用来验证按用户查询的代价与电影总数无关。
+    """
+    from sqlalchemy import insert
+    from watchlist.cache import invalidate
+    from watchlist.models import Movie, User
+
+    db.drop_all()
+    db.create_all()
+    owner = User(name='Bench', username=USERNAME)
+    owner.set_password(PASSWORD)
+    db.session.add(owner)
+    db.session.flush()
+    if users > 1:
+        db.session.execute(insert(User.__table__), [
+            {'name': 'User %d' % i, 'username': 'user%d' % i, 'password_hash': owner.password_hash}
+            for i in range(1, users)])
+    others = max(users - 1, 1)
+    batch = []
+    for i in range(size + other_movies):
+        # 第一个用户的电影 id 为 1..size，其余的属于其他用户（只有一个用户时也归第一个用户）
+        user_id = owner.id if i < size or users == 1 else owner.id + 1 + (i - size) % others
+        batch.append({'title': 'Benchmark Movie %d' % i, 'year': 1950 + i % 70, 'user_id': user_id})
+        if len(batch) == 10000:
+            db.session.execute(insert(Movie.__table__), batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(Movie.__table__), batch)
+    db.session.commit()
+    invalidate('Movie', 'User')
+
+
+def percentile(values, pct):
+    """
+    最近秩法计算百分位数，values 需已排序
+    """
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, int(math.ceil(pct / 100.0 * len(values))) - 1))
+    return values[index]
+
+
+def summarize(latencies, elapsed):
+    latencies = sorted(latencies)
+    return {
+        'n': len(latencies),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed > 0 else 0.0,
+    }
+
+
+def measure(func, iterations, warmup=5):
+    """
+    运行 func 若干次，返回延迟统计和 Python 堆内存峰值
+
+    延迟与内存分两轮测量，避免 tracemalloc 的开销影响延迟数据。
+    """
+    for i in range(warmup):
+        func(i)
+    latencies = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        func(warmup + i)
+        latencies.append(time.perf_counter() - t0)
+    result = summarize(latencies, time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        for i in range(min(iterations, 20)):
+            func(warmup + iterations + i)
+        result['peak_kb'] = round(tracemalloc.get_traced_memory()[1] / 1024.0, 1)
+    finally:
+        tracemalloc.stop()
+    return result
+
+
+def metadata():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                         stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'time': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+    }
+
+
+def max_rss_kb():
+    # resource 模块只在 Unix 上有，Windows 上不统计峰值内存
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Linux 上 ru_maxrss 的单位是 KB，macOS 上是字节
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def write_report(name, results, output):
+    report = {'benchmark': name, 'meta': metadata(), 'max_rss_kb': max_rss_kb(), 'results': results}
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
+        click.echo('Wrote %s' % output)
+    else:
+        click.echo(text)
+
+
+def print_table(results, columns):
+    header = ' '.join('%12s' % c for c in columns)
+    click.echo(header, err=True)
+    for row in results:
+        click.echo(' '.join('%12s' % (row.get(c, ''),) for c in columns), err=True)
+
+
+def parse_sizes(value):
+    return [int(v) for v in value.split(',') if v.strip()]
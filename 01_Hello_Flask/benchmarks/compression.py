@@ -0,0 +1,64 @@
+import time
+
+import click
+
+from benchmarks.common import load_app, parse_sizes, print_table, seed, summarize, write_report
+
+PAGES = ['index', 'api_list']
+
+
+def _encodings():
+    from watchlist import compress
+
+    encodings = ['identity', 'gzip']
+    if compress.brotli is not None:
+        encodings.append('br')
+    return encodings
+
+
+@click.command()
+@click.option('--per-page', 'sizes', default='20,200,1000', show_default=True,
+              help='Comma separated movies per page.')
+@click.option('--iterations', '-n', default=200, show_default=True, help='Requests per encoding.')
+@click.option('--level', default=6, show_default=True, help='gzip compression level.')
+@click.option('--quality', default=5, show_default=True, help='brotli quality.')
+@click.option('--output', '-o', type=click.Path(dir_okay=False), help='Write the JSON report to a file.')
+def compression(sizes, iterations, level, quality, output):
+    """
+    Measure bytes on the wire and CPU time per request for each encoding.
+
+    The index page comes from the page cache, so the difference to
+    'identity' is the cost of compressing the response.
+    """
+    encodings = _encodings()
+    results = []
+    for per_page in parse_sizes(sizes):
+        app, db = load_app(WATCHLIST_PER_PAGE=per_page, WATCHLIST_API_MAX_PAGE=per_page,
+                           WATCHLIST_COMPRESS_LEVEL=level, WATCHLIST_BROTLI_QUALITY=quality)
+        with app.app_context():
+            seed(db, per_page * 2)
+            client = app.test_client()
+            urls = {'index': '/', 'api_list': '/api/v1/movies?limit=%d' % per_page}
+            for page in PAGES:
+                identity = None
+                for encoding in encodings:
+                    click.echo('Running %s with %d movies per page, %s...' % (page, per_page, encoding), err=True)
+                    headers = {'Accept-Encoding': encoding}
+                    response = client.get(urls[page], headers=headers)
+                    wire = len(response.get_data())
+                    if identity is None:
+                        identity = wire
+                    latencies = []
+                    started, cpu = time.perf_counter(), time.process_time()
+                    for i in range(iterations):
+                        t0 = time.perf_counter()
+                        client.get(urls[page], headers=headers).get_data()
+                        latencies.append(time.perf_counter() - t0)
+                    cpu = time.process_time() - cpu
+                    result = summarize(latencies, time.perf_counter() - started)
+                    result.update(page=page, size=per_page, encoding=encoding, bytes=wire,
+                                  ratio=round(float(wire) / identity, 3),
+                                  cpu_ms=round(cpu / iterations * 1000, 3))
+                    results.append(result)
+    print_table(results, ['page', 'size', 'encoding', 'bytes', 'ratio', 'p50_ms', 'cpu_ms'])
+    write_report('compression', results, output)
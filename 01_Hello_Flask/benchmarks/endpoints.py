@@ -0,0 +1,93 @@
+import click
+
+from benchmarks.common import (PASSWORD, USERNAME, load_app, measure, parse_sizes, print_table, seed,
+                               write_report)
+
+SCENARIOS = ['index', 'index_page', 'index_sorted', 'index_decade', 'facets', 'edit_get', 'edit_get_hot', 'edit_post',
+             'delete', 'login', 'settings_get', 'settings_post']
+
+
+def _check(response, status=200):
+    if response.status_code != status:
+        raise click.ClickException('unexpected status %d' % response.status_code)
+    return response
+
+
+def _scenarios(client, size):
+    """
+    返回 {场景名: func(i)}，每次调用发出一个请求
+    """
+    middle = max(1, size // 2)
+
+    def index(i):
+        _check(client.get('/'))
+
+    def index_page(i):
+        _check(client.get('/?after=%d' % middle))
+
+    def index_sorted(i):
+        _check(client.get('/?sort=title&after=%d' % middle))
+
+    def index_decade(i):
+        _check(client.get('/?decade=1980&sort=year_desc&after=%d' % middle))
+
+    def facets(i):
+        _check(client.get('/api/v1/movies/facets'))
+
+    def edit_get(i):
+        _check(client.get('/movie/edit/%d' % (i % size + 1)))
+
+    def edit_get_hot(i):
+        # 反复打开同样几部电影的编辑页，命中记录缓存
+        _check(client.get('/movie/edit/%d' % (i % 10 + 1)))
+
+    def edit_post(i):
+        _check(client.post('/movie/edit/%d' % (i % size + 1), data={'title': 'Edited %d' % i, 'year': '2000'}), 302)
+
+    def delete(i):
+        # 从后往前删除，每次删除不同的记录
+        _check(client.post('/movie/delete/%d' % (size - i)), 302)
+
+    def login(i):
+        _check(client.post('/login', data={'username': USERNAME, 'password': PASSWORD}), 302)
+
+    def settings_get(i):
+        _check(client.get('/settings'))
+
+    def settings_post(i):
+        _check(client.post('/settings', data={'name': 'Bench %d' % (i % 10)}), 302)
+
+    return {name: func for name, func in locals().items() if name in SCENARIOS}
+
+
+@click.command()
+@click.option('--sizes', default='100,10000', show_default=True, help='Comma separated movie counts.')
+@click.option('--iterations', '-n', default=200, show_default=True, help='Requests per scenario.')
+@click.option('--scenario', '-s', 'scenarios', multiple=True, type=click.Choice(SCENARIOS),
+              help='Scenarios to run, all by default.')
+@click.option('--other-movies', default=0, show_default=True,
+              help='Movies owned by other users, should not change the results.')
+@click.option('--users', default=10, show_default=True, help='Users sharing --other-movies.')
+@click.option('--output', '-o', type=click.Path(dir_okay=False), help='Write the JSON report to a file.')
+def endpoints(sizes, iterations, scenarios, other_movies, users, output):
+    """
+    Benchmark the watchlist HTTP endpoints with the test client.
+    """
+    app, db = load_app()
+    scenarios = scenarios or SCENARIOS
+    results = []
+    for size in parse_sizes(sizes):
+        # 删除场景每次删除一条记录，数据量至少要覆盖所有请求
+        size = max(size, iterations + 50)
+        with app.app_context():
+            seed(db, size, users=users, other_movies=other_movies)
+            client = app.test_client()
+            _check(client.post('/login', data={'username': USERNAME, 'password': PASSWORD}), 302)
+            funcs = _scenarios(client, size)
+            for name in scenarios:
+                click.echo('Running %s with %d movies...' % (name, size), err=True)
+                result = measure(funcs[name], iterations)
+                result.update(scenario=name, size=size, other_movies=other_movies)
+                results.append(result)
+    print_table(results, ['scenario', 'size', 'p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps', 'peak_kb'])
+    write_report('endpoints', results, output)
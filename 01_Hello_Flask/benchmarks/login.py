@@ -0,0 +1,70 @@
+import click
+
+from benchmarks.common import PASSWORD, USERNAME, load_app, measure, parse_sizes, print_table, seed, write_report
+
+SCENARIOS = ['lookup', 'valid', 'wrong_password', 'unknown_user']
+
+
+def _query_plan(db, username):
+    from sqlalchemy import text
+
+    rows = db.session.execute(text('EXPLAIN QUERY PLAN SELECT * FROM user WHERE username = :u'), {'u': username})
+    return '; '.join(row[-1] for row in rows)
+
+
+def _scenarios(client, users):
+    from watchlist.models import User
+
+    # 查找排在最后的用户，没有索引时需要扫描整张表
+    last = 'user%d' % (users - 1) if users > 1 else USERNAME
+
+    def lookup(i):
+        if User.query.filter_by(username=last).first() is None:
+            raise click.ClickException('user %s not found' % last)
+
+    def valid(i):
+        _check(client.post('/login', data={'username': USERNAME, 'password': PASSWORD}))
+
+    def wrong_password(i):
+        _check(client.post('/login', data={'username': last, 'password': 'wrong'}))
+
+    def unknown_user(i):
+        _check(client.post('/login', data={'username': 'nobody%d' % i, 'password': 'wrong'}))
+
+    return {name: func for name, func in locals().items() if name in SCENARIOS}
+
+
+def _check(response):
+    if response.status_code != 302:
+        raise click.ClickException('unexpected status %d' % response.status_code)
+
+
+@click.command()
+@click.option('--users', default='1000,10000', show_default=True, help='Comma separated user counts.')
+@click.option('--iterations', '-n', default=100, show_default=True, help='Requests per scenario.')
+@click.option('--hash-method', help='PASSWORD_HASH_METHOD to use, the production default if omitted.')
+@click.option('--output', '-o', type=click.Path(dir_okay=False), help='Write the JSON report to a file.')
+def login(users, iterations, hash_method, output):
+    """
+    Benchmark the login path against many user rows.
+
+    wrong_password and unknown_user should take the same time: unknown
+    users are rejected after a full password check against a dummy hash.
+    """
+    config = {'PASSWORD_HASH_METHOD': hash_method} if hash_method else {}
+    app, db = load_app(**config)
+    results = []
+    for count in parse_sizes(users):
+        with app.app_context():
+            seed(db, 10, users=count)
+            plan = _query_plan(db, USERNAME)
+            click.echo('Query plan with %d users: %s' % (count, plan), err=True)
+            funcs = _scenarios(app.test_client(), count)
+            for name in SCENARIOS:
+                click.echo('Running %s with %d users...' % (name, count), err=True)
+                result = measure(funcs[name], iterations)
+                result.update(scenario=name, users=count, plan=plan,
+                              hash_method=app.config['PASSWORD_HASH_METHOD'])
+                results.append(result)
+    print_table(results, ['scenario', 'users', 'p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps'])
+    write_report('login', results, output)
@@ -0,0 +1,91 @@
+import concurrent.futures
+import os
+import tempfile
+import time
+
+import click
+
+from benchmarks.common import PASSWORD, USERNAME, load_app, percentile, print_table, seed, write_report
+
+MODES = ['primary', 'readonly', 'snapshot']
+PROFILES = ['default', 'production']
+
+
+def _worker(args):
+    """
+    模拟一个 worker 进程：写进程不停地编辑电影，读进程不停地请求只读页面，持续 duration 秒
+    """
+    path, profile, mode, duration, url, writer = args
+    app, db = load_app(path, WATCHLIST_DB_PROFILE=profile, WATCHLIST_READ_REPLICA='' if mode == 'primary' else mode,
+                       WATCHLIST_SNAPSHOT_INTERVAL=1, WATCHLIST_PAGE_CACHE_SIZE=0)
+    latencies = []
+    errors = 0
+    with app.app_context():
+        client = app.test_client()
+        if writer:
+            client.post('/login', data={'username': USERNAME, 'password': PASSWORD})
+        replica = app.extensions.get('watchlist_replica')
+        if hasattr(replica, 'refresh'):
+            replica.refresh()
+        deadline = time.perf_counter() + duration
+        i = 0
+        while time.perf_counter() < deadline:
+            i += 1
+            started = time.perf_counter()
+            if writer:
+                response = client.post('/movie/edit/%d' % (i % 100 + 1),
+                                       data={'title': 'Edited %d' % i, 'year': '2000'})
+                ok = response.status_code == 302
+            else:
+                response = client.get(url)
+                ok = response.status_code == 200
+            if ok:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+        if replica is not None:
+            # 删除快照文件
+            replica.close()
+    return latencies, errors
+
+
+@click.command()
+@click.option('--readers', '-r', default=4, show_default=True, help='Reader processes.')
+@click.option('--duration', '-d', default=5.0, show_default=True, help='Seconds per scenario.')
+@click.option('--url', default='/all', show_default=True, help='Page requested by the readers.')
+@click.option('--rows', default=10000, show_default=True, help='Movies in the database.')
+@click.option('--output', '-o', type=click.Path(dir_okay=False), help='Write the JSON report to a file.')
+def replica(readers, duration, url, rows, output):
+    """
+    Compare reading from the primary with read-only and snapshot replicas.
+
+    One writer process keeps editing movies while reader processes request
+    a read-only page (the streamed /all view by default); the snapshot is refreshed every second.
+    """
+    results = []
+    for profile in PROFILES:
+        for mode in MODES:
+            path = os.path.join(tempfile.mkdtemp(prefix='watchlist-bench-'), 'bench.db')
+            app, db = load_app(path, WATCHLIST_DB_PROFILE=profile)
+            with app.app_context():
+                seed(db, rows)
+                db.session.remove()
+                db.engine.dispose()
+
+            click.echo('Running %s reads with %s profile and %d readers...' % (mode, profile, readers), err=True)
+            tasks = [(path, profile, mode, duration, url, i == 0) for i in range(readers + 1)]
+            with concurrent.futures.ProcessPoolExecutor(len(tasks)) as executor:
+                counts = list(executor.map(_worker, tasks))
+            reads = sorted(t for latencies, errors in counts[1:] for t in latencies)
+            results.append({
+                'profile': profile,
+                'mode': mode,
+                'readers': readers,
+                'reads_per_s': round(len(reads) / duration, 1),
+                'read_p95_ms': round(percentile(reads, 95) * 1000, 3),
+                'writes_per_s': round(len(counts[0][0]) / duration, 1),
+                'write_p95_ms': round(percentile(sorted(counts[0][0]), 95) * 1000, 3),
+                'errors': sum(errors for latencies, errors in counts),
+            })
+    print_table(results, ['profile', 'mode', 'reads_per_s', 'read_p95_ms', 'writes_per_s', 'write_p95_ms', 'errors'])
+    write_report('replica', results, output)
@@ -0,0 +1,123 @@
+import asyncio
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+
+from benchmarks.common import ROOT, load_app, print_table, seed, summarize, write_report
+
+# 各种部署方式的启动命令，{port} 和 {workers} 会被替换
+SERVERS = {
+    'wsgi': [sys.executable, '-c',
+             'from werkzeug.serving import run_simple; from wsgi import app; '
+             'run_simple("127.0.0.1", {port}, app, threaded=True)'],
+    'gunicorn': ['gunicorn', '-w', '{workers}', '--threads', '4', '-b', '127.0.0.1:{port}', 'wsgi:app'],
+    'asgi': [sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', '{port}', '--workers', '{workers}',
+             '--log-level', 'warning'],
+    'asgi-async': [sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', '{port}', '--workers', '{workers}',
+                   '--log-level', 'warning'],
+}
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_for(port, timeout=15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise click.ClickException('server on port %d did not start' % port)
+
+
+async def _request(port, path):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(('GET %s HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n' % path).encode())
+    await writer.drain()
+    status_line = await reader.readline()
+    await reader.read()
+    writer.close()
+    return int(status_line.split()[1])
+
+
+async def _load(port, path, concurrency, duration):
+    """
+    concurrency 个客户端持续发请求 duration 秒
+    """
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def client():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            try:
+                status = await _request(port, path)
+            except OSError:
+                status = None
+            if status == 200:
+                latencies.append(time.perf_counter() - t0)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    result = summarize(latencies, time.perf_counter() - started)
+    result['errors'] = errors
+    return result
+
+
+@click.command()
+@click.option('--server', '-s', 'servers', multiple=True, type=click.Choice(list(SERVERS)),
+              help='Deployments to compare, wsgi/asgi/asgi-async by default.')
+@click.option('--concurrency', '-c', default='10,100', show_default=True, help='Comma separated client counts.')
+@click.option('--duration', '-d', default=5.0, show_default=True, help='Seconds per concurrency level.')
+@click.option('--workers', '-w', default=1, show_default=True, help='Server worker processes.')
+@click.option('--size', default=10000, show_default=True, help='Movies in the database.')
+@click.option('--path', default='/api/v1/movies?limit=20', show_default=True, help='Request path.')
+@click.option('--output', '-o', type=click.Path(dir_okay=False), help='Write the JSON report to a file.')
+def serving(servers, concurrency, duration, workers, size, path, output):
+    """
+    Compare concurrent throughput of WSGI and ASGI deployments.
+    """
+    servers = servers or ('wsgi', 'asgi', 'asgi-async')
+    db_path = os.path.join(tempfile.mkdtemp(prefix='watchlist-bench-'), 'bench.db')
+    app, db = load_app(db_path)
+    with app.app_context():
+        seed(db, size)
+
+    results = []
+    for name in servers:
+        if name == 'gunicorn' and shutil.which('gunicorn') is None:
+            raise click.ClickException('gunicorn is not installed')
+        port = _free_port()
+        env = dict(os.environ, DATABASE_FILE=db_path, FLASK_CONFIG='production',
+                   WATCHLIST_ASYNC='1' if name == 'asgi-async' else '0')
+        command = [part.format(port=port, workers=workers) for part in SERVERS[name]]
+        process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.DEVNULL, start_new_session=True)
+        try:
+            _wait_for(port)
+            for level in [int(c) for c in concurrency.split(',')]:
+                click.echo('Running %s with %d clients...' % (name, level), err=True)
+                result = asyncio.run(_load(port, path, level, duration))
+                result.update(server=name, concurrency=level, workers=workers)
+                results.append(result)
+        finally:
+            os.killpg(process.pid, signal.SIGTERM)
+            process.wait()
+    print_table(results, ['server', 'concurrency', 'p50_ms', 'p99_ms', 'throughput_rps', 'errors'])
+    write_report('serving', results, output)
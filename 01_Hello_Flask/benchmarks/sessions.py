@@ -0,0 +1,65 @@
+import click
+
+from benchmarks.common import PASSWORD, USERNAME, load_app, measure, print_table, seed, write_report
+
+BACKENDS = ['cookie', 'memory', 'sqlite']
+SCENARIOS = ['read', 'flash', 'open_save']
+
+
+def _check(response, status=200):
+    if response.status_code != status:
+        raise click.ClickException('unexpected status %d' % response.status_code)
+    return response
+
+
+def _scenarios(app, client, cookie):
+    from flask import flash, get_flashed_messages
+
+    def read(i):
+        # 只读取会话（登录状态），不修改
+        _check(client.get('/settings'))
+
+    def flash_(i):
+        # 修改后闪现消息并重定向，下一个请求读取并清除消息
+        _check(client.post('/settings', data={'name': 'Bench %d' % (i % 10)}), 302)
+        _check(client.get('/settings'))
+
+    def open_save(i):
+        # 只测量会话接口：读取、修改并保存一个登录用户的会话
+        interface = app.session_interface
+        with app.test_request_context('/', headers={'Cookie': cookie}) as ctx:
+            session = interface.open_session(app, ctx.request)
+            ctx.session = session
+            flash('Item updated.')
+            get_flashed_messages()
+            flash('Item updated.')
+            interface.save_session(app, session, app.response_class())
+
+    return {'read': read, 'flash': flash_, 'open_save': open_save}
+
+
+@click.command()
+@click.option('--iterations', '-n', default=500, show_default=True, help='Requests per scenario.')
+@click.option('--backend', '-b', 'backends', multiple=True, type=click.Choice(BACKENDS),
+              help='Session backends to run, all by default.')
+@click.option('--output', '-o', type=click.Path(dir_okay=False), help='Write the JSON report to a file.')
+def sessions(iterations, backends, output):
+    """
+    Compare signed cookie sessions with server-side session stores.
+    """
+    results = []
+    for backend in backends or BACKENDS:
+        app, db = load_app(WATCHLIST_SESSION_BACKEND=backend, WATCHLIST_SESSION_SWEEP_INTERVAL=0)
+        with app.app_context():
+            seed(db, 100)
+            client = app.test_client()
+            _check(client.post('/login', data={'username': USERNAME, 'password': PASSWORD}), 302)
+            cookie = client.get_cookie(app.config['SESSION_COOKIE_NAME'])
+            funcs = _scenarios(app, client, '%s=%s' % (cookie.key, cookie.value))
+            for name in SCENARIOS:
+                click.echo('Running %s with %s sessions...' % (name, backend), err=True)
+                result = measure(funcs[name], iterations)
+                result.update(scenario=name, backend=backend, cookie_bytes=len(cookie.value))
+                results.append(result)
+    print_table(results, ['scenario', 'backend', 'p50_ms', 'p95_ms', 'mean_ms', 'cookie_bytes'])
+    write_report('sessions', results, output)
@@ -0,0 +1,91 @@
+import concurrent.futures
+import os
+import tempfile
+import time
+
+import click
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from benchmarks.common import print_table, write_report
+
+SETUP = [
+    'CREATE TABLE movie (id INTEGER PRIMARY KEY, title VARCHAR(60), year VARCHAR(4))',
+    'CREATE INDEX ix_movie_title ON movie (title)',
+]
+
+
+def _engine(path, profile):
+    from watchlist.database import SQLITE_PROFILES, apply_pragmas, engine_options
+
+    uri = 'sqlite:///' + path
+    engine = create_engine(uri, **engine_options(profile, uri))
+    apply_pragmas(engine, SQLITE_PROFILES[profile]['pragmas'])
+    return engine
+
+
+def _worker(args):
+    """
+    模拟一个 worker 进程：按比例混合写事务和分页读，持续 duration 秒
+    """
+    path, profile, duration, write_ratio, worker_id = args
+    engine = _engine(path, profile)
+    counts = {'reads': 0, 'writes': 0, 'locked': 0}
+    deadline = time.perf_counter() + duration
+    i = 0
+    while time.perf_counter() < deadline:
+        i += 1
+        try:
+            if i % 100 < write_ratio * 100:
+                with engine.begin() as conn:
+                    conn.execute(text('INSERT INTO movie (title, year) VALUES (:t, :y)'),
+                                 {'t': 'Worker %d Movie %d' % (worker_id, i), 'y': '2000'})
+                counts['writes'] += 1
+            else:
+                with engine.connect() as conn:
+                    conn.execute(text('SELECT id, title, year FROM movie WHERE id > :after ORDER BY id LIMIT 20'),
+                                 {'after': i % 1000}).fetchall()
+                counts['reads'] += 1
+        except OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+            counts['locked'] += 1
+    engine.dispose()
+    return counts
+
+
+@click.command()
+@click.option('--workers', '-w', default=4, show_default=True, help='Concurrent worker processes.')
+@click.option('--duration', '-d', default=5.0, show_default=True, help='Seconds per profile.')
+@click.option('--write-ratio', default=0.2, show_default=True, help='Fraction of operations that write.')
+@click.option('--rows', default=10000, show_default=True, help='Rows inserted before the run.')
+@click.option('--output', '-o', type=click.Path(dir_okay=False), help='Write the JSON report to a file.')
+def sqlite(workers, duration, write_ratio, rows, output):
+    """
+    Compare SQLite connection profiles under concurrent worker processes.
+    """
+    from watchlist.database import SQLITE_PROFILES
+
+    results = []
+    for profile in SQLITE_PROFILES:
+        path = os.path.join(tempfile.mkdtemp(prefix='watchlist-bench-'), 'bench.db')
+        engine = _engine(path, profile)
+        with engine.begin() as conn:
+            for statement in SETUP:
+                conn.execute(text(statement))
+            conn.execute(text('INSERT INTO movie (title, year) VALUES (:t, :y)'),
+                         [{'t': 'Movie %d' % i, 'y': '2000'} for i in range(rows)])
+        engine.dispose()
+
+        click.echo('Running %s profile with %d workers...' % (profile, workers), err=True)
+        tasks = [(path, profile, duration, write_ratio, i) for i in range(workers)]
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            counts = list(executor.map(_worker, tasks))
+        result = {'profile': profile, 'workers': workers}
+        for name in ('reads', 'writes', 'locked'):
+            result[name] = sum(c[name] for c in counts)
+        result['reads_per_s'] = round(result['reads'] / duration, 1)
+        result['writes_per_s'] = round(result['writes'] / duration, 1)
+        results.append(result)
+    print_table(results, ['profile', 'workers', 'reads_per_s', 'writes_per_s', 'locked'])
+    write_report('sqlite', results, output)
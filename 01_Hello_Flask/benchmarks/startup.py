@@ -0,0 +1,56 @@
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+import click
+
+from benchmarks.common import ROOT, load_app, print_table, write_report
+
+# 在新进程中分别测量导入、创建程序实例和第一个请求的耗时
+SCRIPT = '''
+import json, time
+t0 = time.perf_counter()
+import watchlist
+t1 = time.perf_counter()
+app = watchlist.create_app('testing')
+t2 = time.perf_counter()
+with app.app_context():
+    watchlist.db.create_all()
+    app.test_client().get('/')
+t3 = time.perf_counter()
+print(json.dumps({'import_ms': (t1 - t0) * 1000, 'create_app_ms': (t2 - t1) * 1000,
+                  'first_request_ms': (t3 - t2) * 1000}))
+'''
+
+
+@click.command()
+@click.option('--runs', '-n', default=10, show_default=True, help='Fresh interpreter runs.')
+@click.option('--apps', default=50, show_default=True, help='App instances created in one process.')
+@click.option('--output', '-o', type=click.Path(dir_okay=False), help='Write the JSON report to a file.')
+def startup(runs, apps, output):
+    """
+    Measure cold start: import, create_app and first request.
+    """
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        out = subprocess.check_output([sys.executable, '-c', SCRIPT], cwd=ROOT)
+        sample = json.loads(out.decode().strip().splitlines()[-1])
+        sample['process_ms'] = (time.perf_counter() - started) * 1000
+        samples.append(sample)
+    result = {'case': 'cold_start', 'runs': runs}
+    for name in ('import_ms', 'create_app_ms', 'first_request_ms', 'process_ms'):
+        result[name] = round(statistics.median(s[name] for s in samples), 2)
+
+    # 同一进程内创建多个互相隔离的程序实例
+    started = time.perf_counter()
+    for _ in range(apps):
+        load_app(config_name='testing')
+    warm = {'case': 'warm_create_app', 'runs': apps,
+            'create_app_ms': round((time.perf_counter() - started) * 1000 / apps, 2)}
+
+    results = [result, warm]
+    print_table(results, ['case', 'runs', 'import_ms', 'create_app_ms', 'first_request_ms', 'process_ms'])
+    write_report('startup', results, output)
@@ -0,0 +1,63 @@
+import time
+import tracemalloc
+
+import click
+
+from benchmarks.common import load_app, parse_sizes, print_table, seed, write_report
+
+SCENARIOS = ['one_page', 'streamed']
+
+
+def _request(client, url):
+    """
+    发出一个请求，返回 (第一个块的耗时, 总耗时, 响应大小)
+    """
+    started = time.perf_counter()
+    response = client.get(url, buffered=False)
+    chunks = iter(response.response)
+    size = len(next(chunks))
+    first = time.perf_counter() - started
+    for chunk in chunks:
+        size += len(chunk)
+    response.close()
+    return first, time.perf_counter() - started, size
+
+
+@click.command()
+@click.option('--sizes', default='1000,10000,100000', show_default=True, help='Comma separated movie counts.')
+@click.option('--iterations', '-n', default=5, show_default=True, help='Requests per scenario.')
+@click.option('--output', '-o', type=click.Path(dir_okay=False), help='Write the JSON report to a file.')
+def streaming(sizes, iterations, output):
+    """
+    Compare rendering a whole watchlist as one page with the streamed /all view.
+
+    one_page renders every movie with render_template (page size = movie
+    count, page cache off); streamed uses yield_per and stream_template.
+    """
+    results = []
+    for size in parse_sizes(sizes):
+        app, db = load_app(WATCHLIST_PER_PAGE=size, WATCHLIST_PAGE_CACHE_SIZE=0, WATCHLIST_FRAGMENT_CACHE_SIZE=0,
+                           WATCHLIST_COMPRESS=False)
+        with app.app_context():
+            seed(db, size)
+            client = app.test_client()
+            for name, url in zip(SCENARIOS, ['/', '/all']):
+                click.echo('Running %s with %d movies...' % (name, size), err=True)
+                _request(client, url)
+                timings = [_request(client, url) for _ in range(iterations)]
+                tracemalloc.start()
+                try:
+                    _request(client, url)
+                    peak = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+                results.append({
+                    'scenario': name,
+                    'size': size,
+                    'ttfb_ms': round(min(t[0] for t in timings) * 1000, 3),
+                    'total_ms': round(min(t[1] for t in timings) * 1000, 3),
+                    'bytes': timings[0][2],
+                    'peak_kb': round(peak / 1024.0, 1),
+                })
+    print_table(results, ['scenario', 'size', 'ttfb_ms', 'total_ms', 'bytes', 'peak_kb'])
+    write_report('streaming', results, output)
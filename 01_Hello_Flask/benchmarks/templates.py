@@ -0,0 +1,90 @@
+import os
+import tempfile
+import time
+
+import click
+
+from benchmarks.common import load_app, print_table, seed, summarize, write_report
+
+SCENARIOS = ['cold_source', 'cold_bytecode', 'warm', 'warm_fragments']
+
+
+def _render(app):
+    """
+    在请求上下文中渲染一页主页，返回耗时（不含查询数据库）
+    """
+    from flask import render_template, request
+    from watchlist.listing import list_options
+    from watchlist.models import Movie
+    from watchlist.pagination import keyset_page
+    from watchlist.views import index_context
+
+    with app.test_request_context('/'):
+        per_page = app.config['WATCHLIST_PER_PAGE']
+        rows = Movie.of_user(1).order_by(Movie.id).limit(per_page + 1).all()
+        page = keyset_page(rows, per_page=per_page)
+        context = index_context(1, list_options(request.args), page)
+        started = time.perf_counter()
+        render_template('index.html', **context)
+        return time.perf_counter() - started
+
+
+@click.command()
+@click.option('--iterations', '-n', default=30, show_default=True, help='Renders per scenario.')
+@click.option('--per-page', default=20, show_default=True, help='Movies rendered per page.')
+@click.option('--output', '-o', type=click.Path(dir_okay=False), help='Write the JSON report to a file.')
+def templates(iterations, per_page, output):
+    """
+    Benchmark cold and warm template rendering.
+
+    cold_* create a new application for every render, like a freshly started
+    worker; cold_bytecode reads templates precompiled by
+    'flask compile-templates'.
+    """
+    db_path = os.path.join(tempfile.mkdtemp(prefix='watchlist-bench-'), 'bench.db')
+    cache_dir = tempfile.mkdtemp(prefix='watchlist-jinja-')
+    config = {'WATCHLIST_PER_PAGE': per_page}
+    app, db = load_app(db_path, **config)
+    with app.app_context():
+        seed(db, per_page * 2)
+
+    def cold(template_cache_dir):
+        def run():
+            fresh, _ = load_app(db_path, WATCHLIST_TEMPLATE_CACHE_DIR=template_cache_dir, **config)
+            with fresh.app_context():
+                return _render(fresh)
+        return run
+
+    def warm(fragment_cache_size):
+        fresh, _ = load_app(db_path, WATCHLIST_TEMPLATE_CACHE_DIR='',
+                            WATCHLIST_FRAGMENT_CACHE_SIZE=fragment_cache_size, **config)
+
+        def run():
+            with fresh.app_context():
+                return _render(fresh)
+        return run
+
+    # 相当于部署时执行 flask compile-templates
+    compiled, _ = load_app(db_path, WATCHLIST_TEMPLATE_CACHE_DIR=cache_dir, **config)
+    with compiled.app_context():
+        for name in compiled.jinja_env.list_templates(extensions=['html']):
+            compiled.jinja_env.get_template(name)
+
+    funcs = {
+        'cold_source': cold(''),
+        'cold_bytecode': cold(cache_dir),
+        'warm': warm(0),
+        'warm_fragments': warm(4096),
+    }
+    results = []
+    for name in SCENARIOS:
+        click.echo('Running %s...' % name, err=True)
+        func = funcs[name]
+        func()  # 预热导入等一次性开销
+        started = time.perf_counter()
+        latencies = [func() for _ in range(iterations)]
+        result = summarize(latencies, time.perf_counter() - started)
+        result.update(scenario=name, per_page=per_page)
+        results.append(result)
+    print_table(results, ['scenario', 'per_page', 'p50_ms', 'p95_ms', 'mean_ms'])
+    write_report('templates', results, output)
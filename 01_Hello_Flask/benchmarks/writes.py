@@ -0,0 +1,70 @@
+import threading
+import time
+
+import click
+
+from benchmarks.common import PASSWORD, USERNAME, load_app, parse_sizes, print_table, seed, summarize, write_report
+
+PROFILES = ['default', 'production']
+
+
+def _writer(app, cookie, movie_id, deadline, latencies):
+    """
+    一个并发用户：不停地提交编辑表单，直到 deadline
+    """
+    client = app.test_client()
+    client.set_cookie(cookie.key, cookie.value)
+    i = 0
+    while time.perf_counter() < deadline:
+        i += 1
+        started = time.perf_counter()
+        response = client.post('/movie/edit/%d' % movie_id, data={'title': 'Edited %d' % i, 'year': '2000'})
+        if response.status_code != 302:
+            raise click.ClickException('unexpected status %d' % response.status_code)
+        latencies.append(time.perf_counter() - started)
+
+
+@click.command()
+@click.option('--writers', '-c', default='1,8,32', show_default=True, help='Comma separated concurrent writers.')
+@click.option('--duration', '-d', default=3.0, show_default=True, help='Seconds per scenario.')
+@click.option('--window', default=0.0, show_default=True, help='Batch window in milliseconds.')
+@click.option('--output', '-o', type=click.Path(dir_okay=False), help='Write the JSON report to a file.')
+def writes(writers, duration, window, output):
+    """
+    Compare one transaction per edit with batched group commits.
+
+    Every writer thread posts the edit form for its own movie in a loop;
+    results are reported for both SQLite profiles.
+    """
+    results = []
+    for profile in PROFILES:
+        for batched in (False, True):
+            mode = 'batched' if batched else 'direct'
+            for count in parse_sizes(writers):
+                app, db = load_app(WATCHLIST_DB_PROFILE=profile, WATCHLIST_WRITE_BATCH=batched,
+                                   WATCHLIST_WRITE_WINDOW=window, WATCHLIST_PAGE_CACHE_SIZE=0)
+                with app.app_context():
+                    seed(db, count)
+                    client = app.test_client()
+                    client.post('/login', data={'username': USERNAME, 'password': PASSWORD})
+                    cookie = client.get_cookie(app.config['SESSION_COOKIE_NAME'])
+
+                click.echo('Running %s writes with %s profile and %d writers...' % (mode, profile, count), err=True)
+                latencies = [[] for _ in range(count)]
+                started = time.perf_counter()
+                deadline = started + duration
+                threads = [threading.Thread(target=_writer, args=(app, cookie, i + 1, deadline, latencies[i]))
+                           for i in range(count)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                result = summarize([t for l in latencies for t in l], time.perf_counter() - started)
+                result.update(profile=profile, mode=mode, writers=count)
+                batcher = app.extensions.get('watchlist_writes')
+                if batcher is not None:
+                    result['avg_batch'] = round(batcher.writes / float(batcher.batches or 1), 1)
+                    batcher.close()
+                results.append(result)
+    print_table(results, ['profile', 'mode', 'writers', 'throughput_rps', 'p50_ms', 'p95_ms', 'avg_batch'])
+    write_report('writes', results, output)
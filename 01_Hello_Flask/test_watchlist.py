@@ -1,33 +1,38 @@
+import importlib.util
+import json
+import os
+import sqlite3
+import tempfile
 import unittest
 
+from sqlalchemy import event, text
+
 # from app import app, db, Movie, User, forge, initdb
-from watchlist import app, db
-from watchlist.commands import forge, initdb
+from watchlist import create_app, db
+from watchlist.commands import export_movies, forge, import_movies, initdb, reindex
 from watchlist.models import Movie, User
 
 
 class WatchlistTestCase(unittest.TestCase):
     def setUp(self):
-        # 更新配置
-        app.config.update(
-            TESTING=True,
-            SQLALCHEMY_DATABASE_URI='sqlite:///:memory:'
-        )
+        # 使用测试配置创建程序实例（内存型数据库）
+        self.app = create_app('testing')
         # 创建一个应用上下文
-        self.app_context = app.app_context()
+        self.app_context = self.app.app_context()
         self.app_context.push()
         # 创建数据库和表
         db.create_all()
         # 创建测试数据，一个用户，一个电影条目
         user = User(name='Test', username='test')
         user.set_password('123')
-        movie = Movie(title='Test Movie Title', year='2019')
+        movie = Movie(title='Test Movie Title', year='2019', user=user)
         # 使用add_all()方法一次添加多个模型类实例，传入列表
         db.session.add_all([user, movie])
         db.session.commit()
+        self.user = user
 
-        self.client = app.test_client()  # 创建测试客户端
-        self.runner = app.test_cli_runner()  # 创建测试命令运行器
+        self.client = self.app.test_client()  # 创建测试客户端
+        self.runner = self.app.test_cli_runner()  # 创建测试命令运行器
 
     def tearDown(self):
         db.session.remove()  # 清除数据库会话
@@ -35,10 +40,23 @@ class WatchlistTestCase(unittest.TestCase):
         self.app_context.pop()  # 弹出应用上下文
 
     def test_app_exist(self):
-        self.assertIsNotNone(app)
+        self.assertIsNotNone(self.app)
 
     def test_app_is_testing(self):
-        self.assertTrue(app.config['TESTING'])
+        self.assertTrue(self.app.config['TESTING'])
+
+    # 测试同一进程中创建多个互相隔离的程序实例
+    def test_multiple_apps(self):
+        other = create_app('testing', WATCHLIST_PER_PAGE=5)
+        self.assertIsNot(other, self.app)
+        self.assertEqual(other.config['WATCHLIST_PER_PAGE'], 5)
+        self.assertEqual(self.app.config['WATCHLIST_PER_PAGE'], 20)
+        with other.app_context():
+            db.create_all()
+            self.assertEqual(Movie.query.count(), 0)
+            db.drop_all()
+        self.assertEqual(Movie.query.count(), 1)
+        self.assertIn('initdb', self.app.cli.list_commands(None))
 
     def test_404_page(self):
         response = self.client.get('/nothing')
@@ -54,6 +72,429 @@ class WatchlistTestCase(unittest.TestCase):
         self.assertIn('Test Movie Title', data)
         self.assertEqual(response.status_code, 200)
 
+    # 测试主页分页
+    def test_index_pagination(self):
+        db.session.add_all([Movie(title='Movie %d' % i, year='2020', user=self.user) for i in range(5)])
+        db.session.commit()
+        self.app.config['WATCHLIST_PER_PAGE'] = 2
+        response = self.client.get('/')
+        data = response.get_data(as_text=True)
+        self.assertIn('6 Titles', data)
+        self.assertIn('Test Movie Title', data)
+        self.assertIn('Movie 0', data)
+        self.assertNotIn('Movie 1', data)
+        self.assertIn('after=2', data)
+        self.assertNotIn('Prev', data)
+
+        response = self.client.get('/?after=2')
+        data = response.get_data(as_text=True)
+        self.assertIn('Movie 1', data)
+        self.assertIn('Movie 2', data)
+        self.assertNotIn('Movie 0', data)
+        self.assertIn('before=3', data)
+
+        response = self.client.get('/?before=3')
+        data = response.get_data(as_text=True)
+        self.assertIn('Test Movie Title', data)
+        self.assertIn('Movie 0', data)
+
+    # 测试主页排序和按年份筛选，分页链接保留这些参数
+    def test_index_sort_and_filter(self):
+        db.session.add_all([Movie(title=title, year=year, user=self.user) for title, year in
+                            [('Leon', 1994), ('Akira', 1988), ('WALL-E', 2008), ('Mahjong', 1996)]])
+        db.session.commit()
+        self.app.config['WATCHLIST_PER_PAGE'] = 2
+
+        data = self.client.get('/?sort=title').get_data(as_text=True)
+        self.assertLess(data.index('Akira'), data.index('Leon'))
+        self.assertNotIn('Mahjong', data)
+        self.assertIn('after=2&amp;sort=title', data)
+        data = self.client.get('/?sort=title&after=2').get_data(as_text=True)
+        self.assertLess(data.index('Mahjong'), data.index('Test Movie Title'))
+        self.assertIn('before=5&amp;sort=title', data)
+        data = self.client.get('/?sort=title&before=5').get_data(as_text=True)
+        self.assertIn('Akira', data)
+        self.assertIn('Leon', data)
+
+        data = self.client.get('/?sort=year_desc').get_data(as_text=True)
+        self.assertLess(data.index('Test Movie Title'), data.index('WALL-E'))
+        data = self.client.get('/?decade=1990').get_data(as_text=True)
+        self.assertIn('Leon', data)
+        self.assertIn('Mahjong', data)
+        self.assertNotIn('Akira', data)
+        self.assertIn('<strong>1990s (2)</strong>', data)
+        self.assertIn('1980s (1)', data)
+        # 年代链接不带空的 sort 参数，标题显示筛选后的数量
+        self.assertIn('href="/?decade=1980"', data)
+        self.assertNotIn('sort=&', data)
+        self.assertIn('2 of 5 Titles', data)
+        data = self.client.get('/?decade=1990&sort=title').get_data(as_text=True)
+        self.assertIn('href="/?decade=1980&amp;sort=title"', data)
+        data = self.client.get('/?year_from=1990&year_to=2010&sort=year').get_data(as_text=True)
+        self.assertLess(data.index('Leon'), data.index('Mahjong'))
+        self.assertIn('year_from=1990', data)
+        self.assertIn('5 Titles in total', data)
+
+        response = self.client.get('/api/v1/movies?sort=year&year_to=2000&limit=2')
+        self.assertEqual([m['title'] for m in response.get_json()['items']], ['Akira', 'Leon'])
+        self.assertEqual(response.get_json()['items'][0]['year'], '1988')
+        response = self.client.get('/api/v1/movies?sort=year&year_to=2000&limit=2&after=%d'
+                                   % response.get_json()['next'])
+        self.assertEqual([m['title'] for m in response.get_json()['items']], ['Mahjong'])
+        response = self.client.get('/api/v1/movies?sort=recent&limit=1')
+        self.assertEqual(response.get_json()['items'][0]['title'], 'Mahjong')
+
+    # 测试年代计数在增删改（包括绕过 ORM 的批量操作）后保持正确
+    def test_decade_counts(self):
+        def facets():
+            return self.client.get('/api/v1/movies/facets').get_json()['decades']
+
+        def recount():
+            rows = db.session.execute(text('SELECT year / 10 * 10, count(*) FROM movie WHERE user_id = :u '
+                                           'GROUP BY 1 ORDER BY 1'), {'u': self.user.id})
+            return [{'decade': d, 'count': c} for d, c in rows]
+
+        self.assertEqual(facets(), [{'decade': 2010, 'count': 1}])
+        self.login()
+        self.client.post('/', data=dict(title='Leon', year='1994'))
+        ids = [m['id'] for m in self.client.post('/api/v1/movies', json=[
+            {'title': 'A', 'year': '1995'}, {'title': 'B', 'year': 1988}]).get_json()['items']]
+        self.assertEqual(facets(), [{'decade': 1980, 'count': 1}, {'decade': 1990, 'count': 2},
+                                    {'decade': 2010, 'count': 1}])
+
+        self.client.post('/movie/edit/1', data=dict(title='Test Movie Title', year='1999'))
+        self.client.patch('/api/v1/movies', json=[{'id': ids[1], 'year': '2001'}])
+        self.client.delete('/api/v1/movies', json=[ids[0]])
+        self.assertEqual(facets(), [{'decade': 1990, 'count': 2}, {'decade': 2000, 'count': 1}])
+        self.assertEqual(facets(), recount())
+
+        # 其他用户的电影不计入
+        other = User(name='Other', username='other')
+        db.session.add(Movie(title='Other', year=1990, user=other))
+        db.session.commit()
+        self.assertEqual(facets(), recount())
+
+    # 测试电影记录缓存：命中时不查询电影表，提交修改后只删除被修改的记录
+    def test_record_cache(self):
+        from watchlist.cache import record_stats
+
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        other = User(name='Other', username='other')
+        db.session.add_all([Movie(title='Second Movie', year=2002, user=self.user),
+                            Movie(title='Other Movie', year=2003, user=other)])
+        db.session.commit()
+        self.login()
+        self.assertIn('Test Movie Title', self.client.get('/movie/edit/1').get_data(as_text=True))
+        self.assertIn('Second Movie', self.client.get('/movie/edit/2').get_data(as_text=True))
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            self.assertIn('Test Movie Title', self.client.get('/movie/edit/1').get_data(as_text=True))
+            self.assertFalse([s for s in statements if 'FROM movie' in s])
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertEqual(record_stats(), {'hits': 1, 'misses': 2, 'entries': 2})
+        self.assertEqual(self.client.get('/movie/edit/3').status_code, 404)
+
+        # 编辑只删除被修改的记录
+        self.client.post('/movie/edit/1', data=dict(title='Edited Title', year='1999'))
+        self.assertEqual(record_stats()['entries'], 2)
+        self.assertIn('Edited Title', self.client.get('/movie/edit/1').get_data(as_text=True))
+        movie = db.session.get(Movie, 2)
+        movie.title = 'Renamed Movie'
+        db.session.commit()
+        self.assertIn('Renamed Movie', self.client.get('/movie/edit/2').get_data(as_text=True))
+        self.assertEqual(record_stats()['misses'], 5)
+        # 绕过 ORM 的批量修改删除所有电影记录
+        self.client.patch('/api/v1/movies', json=[{'id': 2, 'title': 'Patched Movie'}])
+        self.assertEqual(record_stats()['entries'], 0)
+        self.assertIn('Patched Movie', self.client.get('/movie/edit/2').get_data(as_text=True))
+        self.client.post('/movie/delete/2')
+        self.assertEqual(self.client.get('/movie/edit/2').status_code, 404)
+
+    # 测试用户信息缓存：缓存命中后渲染页面不再查询用户表
+    def test_user_cache(self):
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        self.login()
+        self.client.get('/')
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            response = self.client.get('/')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertIn("Test's Watchlist", response.get_data(as_text=True))
+        self.assertFalse([s for s in statements if 'FROM user' in s])
+
+    # 测试每个用户只能看到和修改自己的电影
+    def test_per_user_movies(self):
+        other = User(name='Other', username='other')
+        other.set_password('789')
+        db.session.add(Movie(title='Other Movie', year='2001', user=other))
+        db.session.commit()
+        other_movie = Movie.query.filter_by(title='Other Movie').first()
+
+        # 未登录时显示站点所有者（第一个用户）的清单
+        data = self.client.get('/').get_data(as_text=True)
+        self.assertIn('Test Movie Title', data)
+        self.assertNotIn('Other Movie', data)
+
+        self.client.post('/login', data=dict(username='other', password='789'))
+        data = self.client.get('/').get_data(as_text=True)
+        self.assertIn("Other's Watchlist", data)
+        self.assertIn('Other Movie', data)
+        self.assertIn('1 Titles', data)
+        self.assertNotIn('Test Movie Title', data)
+        self.assertNotIn('Test Movie Title', self.client.get('/search?q=test').get_data(as_text=True))
+        self.assertEqual([m['title'] for m in self.client.get('/api/v1/movies').get_json()['items']],
+                         ['Other Movie'])
+
+        # 其他用户的电影视为不存在
+        self.assertEqual(self.client.get('/movie/edit/1').status_code, 404)
+        self.assertEqual(self.client.post('/movie/delete/1').status_code, 404)
+        self.assertEqual(self.client.get('/api/v1/movies/1').status_code, 404)
+        self.assertEqual(self.client.delete('/api/v1/movies', json=[1]).status_code, 404)
+        self.assertEqual(Movie.query.count(), 2)
+
+        self.client.post('/', data=dict(title='Mine', year='2002'))
+        self.assertEqual(Movie.query.filter_by(title='Mine').first().user_id, other.id)
+        self.assertEqual(self.client.post('/movie/delete/%d' % other_movie.id).status_code, 302)
+
+    # 测试按用户分页使用 (user_id, id) 索引
+    def test_per_user_index(self):
+        from watchlist.pagination import keyset_query
+
+        def plan(query):
+            sql = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+            return ' '.join(row[-1] for row in db.session.execute(text('EXPLAIN QUERY PLAN ' + sql)))
+
+        result = plan(keyset_query(Movie.of_user(1), Movie.id, after=10))
+        self.assertIn('ix_movie_user_id_id', result)
+        self.assertNotIn('TEMP B-TREE', result)
+        # 按标题、年份排序时使用 (user_id, 排序列, id) 索引
+        for order, index in ((Movie.title, 'ix_movie_user_id_title_id'), (Movie.year, 'ix_movie_user_id_year_id')):
+            for descending in (False, True):
+                result = plan(keyset_query(Movie.of_user(1), Movie.id, after=10, order=order, descending=descending))
+                self.assertIn(index, result)
+                self.assertNotIn('TEMP B-TREE', result)
+
+    # 测试全文搜索
+    def test_search(self):
+        db.session.add_all([Movie(title='My Neighbor Totoro', year='1988', user=self.user),
+                            Movie(title='Leon', year='1994', user=self.user)])
+        db.session.commit()
+
+        response = self.client.get('/search?q=toto')
+        data = response.get_data(as_text=True)
+        self.assertIn('My Neighbor Totoro', data)
+        self.assertNotIn('Leon', data)
+
+        # 修改和删除后索引同步更新
+        movie = Movie.query.filter_by(title='Leon').first()
+        movie.title = 'Leon: The Professional'
+        db.session.commit()
+        data = self.client.get('/search?q=profess').get_data(as_text=True)
+        self.assertIn('Leon: The Professional', data)
+        db.session.delete(movie)
+        db.session.commit()
+        data = self.client.get('/search?q=leon').get_data(as_text=True)
+        self.assertIn('0 results', data)
+
+        data = self.client.get('/search?q=%22%2A').get_data(as_text=True)
+        self.assertIn('0 results', data)
+
+    # 测试页面缓存和条件请求
+    def test_index_etag(self):
+        response = self.client.get('/')
+        etag = response.headers['ETag']
+        self.assertIn('no-cache', response.headers['Cache-Control'])
+
+        response = self.client.get('/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.get_data(), b'')
+
+        # 修改电影后页面缓存失效，ETag 改变
+        db.session.add(Movie(title='Another Movie', year='2020', user=self.user))
+        db.session.commit()
+        response = self.client.get('/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Another Movie', response.get_data(as_text=True))
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    # 测试多个 worker 进程共用一个数据库时，其他进程的修改通过共享版本号使页面缓存失效
+    def test_cache_shared_versions(self):
+        path = os.path.join(tempfile.mkdtemp(), 'shared.db')
+        first, second = [create_app('testing', SQLALCHEMY_DATABASE_URI='sqlite:///' + path) for _ in range(2)]
+        with first.app_context():
+            db.create_all()
+            user = User(name='Test', username='test')
+            user.set_password('123')
+            db.session.add_all([user, Movie(title='First Movie', year=2001, user=user)])
+            db.session.commit()
+        reader = first.test_client()
+        self.assertIn('1 Titles', reader.get('/').get_data(as_text=True))
+        self.assertEqual(reader.get('/api/v1/movies/facets').get_json()['decades'], [{'decade': 2000, 'count': 1}])
+
+        writer = second.test_client()
+        writer.post('/login', data=dict(username='test', password='123'))
+        writer.post('/', data=dict(title='Second Movie', year='1999'))
+        data = reader.get('/').get_data(as_text=True)
+        self.assertIn('Second Movie', data)
+        self.assertIn('2 Titles', data)
+        self.assertEqual(len(reader.get('/api/v1/movies/facets').get_json()['decades']), 2)
+        with first.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_record_cache_shared_versions(self):
+        path = os.path.join(tempfile.mkdtemp(), 'shared.db')
+        first, second = [create_app('testing', SQLALCHEMY_DATABASE_URI='sqlite:///' + path) for _ in range(2)]
+        with first.app_context():
+            db.create_all()
+            user = User(name='Test', username='test')
+            user.set_password('123')
+            db.session.add_all([user, Movie(title='First Movie', year=2001, user=user)])
+            db.session.commit()
+            self.assertEqual(Movie.cached_get(1).title, 'First Movie')
+        reader = first.test_client()
+        reader.post('/login', data=dict(username='test', password='123'))
+        self.assertIn('First Movie', reader.get('/movie/edit/1').get_data(as_text=True))
+
+        writer = second.test_client()
+        writer.post('/login', data=dict(username='test', password='123'))
+        writer.post('/movie/edit/1', data=dict(title='Edited Movie', year='2002'))
+        # 另一个进程的修改使本进程的记录缓存失效
+        with first.app_context():
+            self.assertEqual(Movie.cached_get(1).title, 'Edited Movie')
+        self.assertIn('Edited Movie', reader.get('/movie/edit/1').get_data(as_text=True))
+        with first.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    # 测试 JSON API
+    def test_api_list_and_get(self):
+        db.session.add_all([Movie(title='Movie %d' % i, year='2020', user=self.user) for i in range(3)])
+        db.session.commit()
+        response = self.client.get('/api/v1/movies?limit=2')
+        data = response.get_json()
+        self.assertEqual(data['total'], 4)
+        self.assertEqual([m['title'] for m in data['items']], ['Test Movie Title', 'Movie 0'])
+        self.assertEqual(data['next'], 2)
+        self.assertIsNone(data['prev'])
+
+        data = self.client.get('/api/v1/movies?limit=2&after=2').get_json()
+        self.assertEqual([m['id'] for m in data['items']], [3, 4])
+        self.assertIsNone(data['next'])
+
+        data = self.client.get('/api/v1/movies?year=2019').get_json()
+        self.assertEqual(len(data['items']), 1)
+        data = self.client.get('/api/v1/movies?q=test').get_json()
+        self.assertEqual(data['items'][0]['title'], 'Test Movie Title')
+
+        self.assertEqual(self.client.get('/api/v1/movies/1').get_json()['year'], '2019')
+        response = self.client.get('/api/v1/movies/99')
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('error', response.get_json())
+
+    def test_api_batch_operations(self):
+        response = self.client.post('/api/v1/movies', json={'title': 'New Movie', 'year': '2020'})
+        self.assertEqual(response.status_code, 401)
+
+        self.login()
+        response = self.client.post('/api/v1/movies', json=[{'title': 'A', 'year': '2001'},
+                                                           {'title': 'B', 'year': '2002'}])
+        self.assertEqual(response.status_code, 201)
+        ids = [m['id'] for m in response.get_json()['items']]
+        self.assertEqual(Movie.query.count(), 3)
+
+        # 整批校验，有一项不合法时都不写入
+        response = self.client.post('/api/v1/movies', json=[{'title': 'C', 'year': '2003'}, {'title': 'D'}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()['invalid'], [1])
+        self.assertEqual(Movie.query.count(), 3)
+
+        response = self.client.patch('/api/v1/movies', json=[{'id': ids[0], 'title': 'A2'},
+                                                            {'id': ids[1], 'year': '2012'}])
+        self.assertEqual(response.get_json(), {'updated': 2})
+        self.assertEqual(db.session.get(Movie, ids[0]).title, 'A2')
+        self.assertEqual(db.session.get(Movie, ids[1]).year, 2012)
+
+        response = self.client.patch('/api/v1/movies/%d' % ids[0], json={'year': '1999'})
+        self.assertEqual(response.get_json()['year'], '1999')
+
+        # 请求体不是对象、没有可修改的字段、id 为 true 或在创建接口中传 id 时都返回 400
+        for method, url, body in [('patch', '/api/v1/movies/%d' % ids[0], 5),
+                                  ('patch', '/api/v1/movies/%d' % ids[0], {}),
+                                  ('patch', '/api/v1/movies', [{'id': ids[0]}]),
+                                  ('patch', '/api/v1/movies', [{'id': True, 'title': 'X'}]),
+                                  ('delete', '/api/v1/movies', [True]),
+                                  ('delete', '/api/v1/movies', {'ids': [ids[0], False]}),
+                                  ('post', '/api/v1/movies', [ids[0]])]:
+            with self.subTest(method=method, body=body):
+                response = getattr(self.client, method)(url, json=body)
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(Movie.query.count(), 3)
+        self.assertEqual(db.session.get(Movie, ids[0]).title, 'A2')
+
+        response = self.client.delete('/api/v1/movies', json={'ids': ids + [99]})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.get_json()['missing'], [99])
+        response = self.client.delete('/api/v1/movies', json={'ids': ids})
+        self.assertEqual(response.get_json(), {'deleted': 2})
+        self.assertEqual(Movie.query.count(), 1)
+        self.assertIn('1 Titles', self.client.get('/').get_data(as_text=True))
+
+    # 测试异步读接口（aiosqlite 不能访问内存型数据库，使用临时文件）
+    @unittest.skipUnless(importlib.util.find_spec('aiosqlite') and importlib.util.find_spec('asgiref'),
+                         'aiosqlite or asgiref is not installed')
+    def test_async_api(self):
+        path = os.path.join(tempfile.mkdtemp(), 'async.db')
+        app = create_app('testing', WATCHLIST_ASYNC=True, SQLALCHEMY_DATABASE_URI='sqlite:///' + path)
+        with app.app_context():
+            db.create_all()
+            owner = User(name='Owner', username='owner')
+            db.session.add_all([Movie(title='Movie %d' % i, year='2020', user=owner) for i in range(3)])
+            db.session.commit()
+            client = app.test_client()
+            data = client.get('/api/v1/movies?limit=2').get_json()
+            self.assertEqual([m['id'] for m in data['items']], [1, 2])
+            self.assertEqual(data['next'], 2)
+            self.assertEqual(data['total'], 3)
+            data = client.get('/api/v1/movies?q=movie').get_json()
+            self.assertEqual(len(data['items']), 3)
+            self.assertEqual(client.get('/api/v1/movies/3').get_json()['title'], 'Movie 2')
+            self.assertEqual(client.get('/api/v1/movies/9').status_code, 404)
+            db.session.remove()
+            db.drop_all()
+
+    # 测试请求计时和 /metrics
+    def test_instrumentation(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('Server-Timing', response.headers)
+
+        # 统计功能在创建程序实例时按配置注册
+        app = create_app('testing', WATCHLIST_INSTRUMENT=True)
+        with app.app_context():
+            db.create_all()
+            client = app.test_client()
+            response = client.get('/')
+            self.assertIn('db;dur=', response.headers['Server-Timing'])
+            self.assertIn('tpl;dur=', response.headers['Server-Timing'])
+            response = client.get('/metrics')
+            data = response.get_data(as_text=True)
+            self.assertIn('watchlist_requests_total{endpoint="main.index",method="GET",status="200"}', data)
+            self.assertIn('watchlist_request_duration_seconds_count{endpoint="main.index"}', data)
+            self.assertIn('watchlist_sql_queries_total{endpoint="main.index"}', data)
+            self.assertIn('watchlist_record_cache_hits_total 0', data)
+            db.drop_all()
+
     def login(self):
         self.client.post('/login', data=dict(
             username='test',
@@ -175,7 +616,7 @@ class WatchlistTestCase(unittest.TestCase):
         ), follow_redirects=True)
         data = response.get_data(as_text=True)
         self.assertNotIn('Login success.', data)
-        # self.assertIn('Invalid username or password.', data)
+        self.assertIn('Invalid username or password.', data)
 
         # 测试使用空用户名登录
         response = self.client.post('/login', data=dict(
@@ -195,6 +636,62 @@ class WatchlistTestCase(unittest.TestCase):
         self.assertNotIn('Login success.', data)
         self.assertIn('Invalid input.', data)
 
+    # 测试多用户登录
+    def test_login_other_user(self):
+        user = User(name='Other', username='other')
+        user.set_password('789')
+        db.session.add(user)
+        db.session.commit()
+
+        response = self.client.post('/login', data=dict(username='other', password='123'), follow_redirects=True)
+        self.assertIn('Invalid username or password.', response.get_data(as_text=True))
+        response = self.client.post('/login', data=dict(username='other', password='789'), follow_redirects=True)
+        self.assertIn('Login success.', response.get_data(as_text=True))
+        with self.client.session_transaction() as session:
+            self.assertEqual(session['_user_id'], str(user.id))
+
+    # 测试未知用户同样经过一次密码校验
+    def test_login_unknown_user_hashes(self):
+        pool = self.app.extensions['watchlist_hash_pool']
+        self.assertEqual(pool.dummy_hashes, {})
+        response = self.client.post('/login', data=dict(username='nobody', password='123'), follow_redirects=True)
+        self.assertIn('Invalid username or password.', response.get_data(as_text=True))
+        self.assertIn(self.app.config['PASSWORD_HASH_METHOD'], pool.dummy_hashes)
+
+    # 测试用户名唯一
+    def test_username_unique(self):
+        from sqlalchemy.exc import IntegrityError
+
+        db.session.add(User(name='Copy', username='test'))
+        self.assertRaises(IntegrityError, db.session.commit)
+        db.session.rollback()
+
+    # 测试登录限流
+    def test_login_rate_limit(self):
+        self.app.extensions['watchlist_login_limiter'].limit = 3
+        for _ in range(3):
+            response = self.client.post('/login', data=dict(username='test', password='456'))
+            self.assertEqual(response.status_code, 302)
+        response = self.client.post('/login', data=dict(username='test', password='123'))
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Too many login attempts', response.get_data(as_text=True))
+
+    # 测试密码校验队列已满
+    def test_login_hash_pool_busy(self):
+        pool = self.app.extensions['watchlist_hash_pool']
+        acquired = 0
+        while pool.slots.acquire(blocking=False):
+            acquired += 1
+        try:
+            response = self.client.post('/login', data=dict(username='test', password='123'))
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.headers['Retry-After'], '5')
+        finally:
+            for _ in range(acquired):
+                pool.slots.release()
+        response = self.client.post('/login', data=dict(username='test', password='123'), follow_redirects=True)
+        self.assertIn('Login success.', response.get_data(as_text=True))
+
     # 测试登出
     def test_logout(self):
         self.login()
@@ -208,6 +705,194 @@ class WatchlistTestCase(unittest.TestCase):
         self.assertNotIn('Edit', data)
         self.assertNotIn('<form method="post">', data)
 
+    # 测试服务端会话：cookie 中只有随机的会话 id，登录后更换 id
+    def test_server_sessions(self):
+        import time
+
+        for backend in ('memory', 'sqlite'):
+            with self.subTest(backend=backend):
+                path = os.path.join(tempfile.mkdtemp(), 'sessions.db')
+                app = create_app('testing', WATCHLIST_SESSION_BACKEND=backend, WATCHLIST_SESSION_SWEEP_INTERVAL=0,
+                                 SQLALCHEMY_DATABASE_URI='sqlite:///' + path)
+                with app.app_context():
+                    db.create_all()
+                    user = User(name='Test', username='test')
+                    user.set_password('123')
+                    db.session.add(user)
+                    db.session.commit()
+                    client = app.test_client()
+                    store = app.session_interface.store
+
+                    # 未登录时的闪现消息也保存在服务端
+                    client.post('/login', data=dict(username='test', password='wrong'))
+                    anonymous = client.get_cookie('session').value
+                    self.assertIsNotNone(store.get(anonymous, time.time()))
+                    data = client.post('/login', data=dict(username='test', password='123'),
+                                       follow_redirects=True).get_data(as_text=True)
+                    self.assertIn('Login success.', data)
+                    sid = client.get_cookie('session').value
+                    self.assertNotEqual(sid, anonymous)
+                    self.assertIsNone(store.get(anonymous, time.time()))
+                    self.assertIn('_user_id', store.get(sid, time.time())[0])
+
+                    # 没有修改会话的请求不设置 cookie
+                    response = client.get('/settings')
+                    self.assertEqual(response.status_code, 200)
+                    self.assertNotIn('Set-Cookie', response.headers)
+                    # 不接受存储中没有的会话 id
+                    with app.test_request_context(headers={'Cookie': 'session=forged'}) as ctx:
+                        self.assertIsNone(ctx.session.sid)
+                        self.assertFalse(ctx.session)
+                    db.session.remove()
+                    db.drop_all()
+
+    # 测试第一次写入会话后启动的清理线程可以停止
+    def test_session_sweeper_close(self):
+        app = create_app('testing', WATCHLIST_SESSION_BACKEND='memory', WATCHLIST_SESSION_SWEEP_INTERVAL=60)
+        interface = app.session_interface
+        app.test_client().post('/login', data=dict(username='', password=''))  # 闪现消息写入会话
+        self.assertTrue(interface.sweeper.is_alive())
+        interface.close()
+        self.assertFalse(interface.sweeper.is_alive())
+
+    # 测试会话存储的过期、LRU 淘汰和清理
+    def test_session_stores(self):
+        from watchlist.models import session_table
+        from watchlist.sessions import MemoryStore, SQLiteStore
+
+        for store in (MemoryStore(max_entries=2), SQLiteStore(db.engine, session_table, batch_size=1)):
+            with self.subTest(store=type(store).__name__):
+                store.set('a', '{}', 100)
+                store.set('b', '{}', 200)
+                store.set('c', '{}', 300)
+                self.assertIsNone(store.get('a', 150))
+                self.assertEqual(store.get('b', 150), ('{}', 200))
+                store.touch('b', 400)
+                self.assertGreaterEqual(store.sweep(350), 1)
+                self.assertIsNone(store.get('c', 0))
+                self.assertEqual(store.get('b', 350), ('{}', 400))
+                store.delete('b')
+                self.assertIsNone(store.get('b', 0))
+        # 内存存储超过上限时淘汰最久未使用的
+        store = MemoryStore(max_entries=2)
+        store.set('a', '{}', 100)
+        store.set('b', '{}', 100)
+        store.get('a', 0)
+        store.set('c', '{}', 100)
+        self.assertEqual(list(store.items), ['a', 'c'])
+
+    # 测试合并写入：同一窗口内的写操作在一个事务中提交，失败的写操作不影响同批的其他写操作
+    def test_write_batching(self):
+        from watchlist.writes import create_movie, operation
+
+        path = os.path.join(tempfile.mkdtemp(), 'writes.db')
+        app = create_app('testing', WATCHLIST_WRITE_BATCH=True, WATCHLIST_WRITE_WINDOW=50,
+                         SQLALCHEMY_DATABASE_URI='sqlite:///' + path)
+        with app.app_context():
+            db.create_all()
+            user = User(name='Test', username='test')
+            user.set_password('123')
+            db.session.add(user)
+            db.session.commit()
+            user_id = user.id
+            client = app.test_client()
+            client.post('/login', data=dict(username='test', password='123'))
+            batcher = app.extensions['watchlist_writes']
+
+            # 请求等到提交后才返回，重定向后的主页能看到新添加的电影
+            data = client.post('/', data=dict(title='Batched Movie', year='2001'),
+                               follow_redirects=True).get_data(as_text=True)
+            self.assertIn('Item created.', data)
+            self.assertIn('Batched Movie', data)
+            self.assertEqual((batcher.batches, batcher.writes), (1, 1))
+            self.assertEqual(client.post('/movie/delete/999').status_code, 404)
+
+            futures = [batcher.submit(create_movie, user_id, 'Movie %d' % i, 2000) for i in range(5)]
+            self.assertEqual([f.result() for f in futures], [2, 3, 4, 5, 6])
+            self.assertEqual((batcher.batches, batcher.writes), (3, 7))
+
+            @operation('Movie')
+            def fail(connection):
+                raise ValueError('invalid')
+
+            futures = [batcher.submit(create_movie, user_id, 'Movie 5', 2000), batcher.submit(fail),
+                       batcher.submit(create_movie, user_id, 'Movie 6', 2000)]
+            self.assertEqual(futures[0].result(), 7)
+            self.assertRaises(ValueError, futures[1].result)
+            self.assertEqual(futures[2].result(), 8)
+            self.assertEqual(Movie.query.count(), 8)
+            data = client.get('/').get_data(as_text=True)
+            self.assertIn('Movie 6', data)
+            batcher.close()
+            db.session.remove()
+            db.drop_all()
+
+    # 测试读写分离：只读视图从只读副本读取，写入后的用户在下一次快照之前读主库
+    def test_read_replica(self):
+        for mode in ('readonly', 'snapshot'):
+            with self.subTest(mode=mode):
+                path = os.path.join(tempfile.mkdtemp(), 'replica.db')
+                app = create_app('testing', WATCHLIST_READ_REPLICA=mode, WATCHLIST_SNAPSHOT_INTERVAL=0,
+                                 WATCHLIST_PAGE_CACHE_SIZE=0, SQLALCHEMY_DATABASE_URI='sqlite:///' + path)
+                with app.app_context():
+                    db.create_all()
+                    user = User(name='Test', username='test')
+                    user.set_password('123')
+                    db.session.add_all([user, Movie(title='First Movie', year=2001, user=user)])
+                    db.session.commit()
+                    replica = app.extensions['watchlist_replica']
+                    if mode == 'snapshot':
+                        replica.refresh()
+                    engine = replica.reader() if mode == 'readonly' else replica.current[0]
+                    statements = []
+                    event.listen(engine, 'before_cursor_execute',
+                                 lambda conn, cursor, statement, *args: statements.append(statement))
+
+                    visitor = app.test_client()
+                    owner = app.test_client()
+                    owner.post('/login', data=dict(username='test', password='123'))
+                    self.assertIn('First Movie', visitor.get('/').get_data(as_text=True))
+                    self.assertTrue(statements)
+                    self.assertTrue(all(s.lstrip().upper().startswith(('SELECT', 'PRAGMA')) for s in statements))
+                    self.assertEqual(visitor.get('/api/v1/movies').get_json()['total'], 1)
+
+                    # 本进程写入后立即能读到
+                    owner.post('/', data=dict(title='Second Movie', year='2002'))
+                    self.assertIn('Second Movie', owner.get('/').get_data(as_text=True))
+                    self.assertIn('Second Movie', visitor.get('/').get_data(as_text=True))
+                    if mode == 'snapshot':
+                        replica.refresh()
+                        self.assertIn('Second Movie', visitor.get('/').get_data(as_text=True))
+
+                    # 其他进程写入后共享版本号变了，快照在下一次刷新之前不再使用
+                    conn = sqlite3.connect(path)
+                    with conn:
+                        conn.execute("INSERT INTO movie (title, year, user_id) VALUES ('Third Movie', 2003, 1)")
+                    conn.close()
+                    self.assertIn('Third Movie', visitor.get('/').get_data(as_text=True))
+                    if mode == 'snapshot':
+                        with app.test_request_context():
+                            self.assertIsNone(replica.reader())
+                            replica.refresh()
+                            engine = replica.reader()
+                            self.assertIsNotNone(engine)
+                            replica.release(engine)
+
+                    # 请求拿到引擎后、第一次查询前快照刷新了，旧快照要等请求释放后才删除
+                    if mode == 'snapshot':
+                        with app.test_request_context():
+                            engine = replica.reader()
+                            old_path = replica.current[1]
+                            replica.refresh()
+                            with engine.connect() as connection:
+                                self.assertEqual(connection.execute(text('SELECT count(*) FROM movie')).scalar(), 3)
+                            self.assertTrue(os.path.exists(old_path))
+                            replica.release(engine)
+                            self.assertFalse(os.path.exists(old_path))
+                    replica.close()
+                    db.session.remove()
+                    db.drop_all()
+
     # 测试设置
     def test_settings(self):
         self.login()
@@ -239,9 +924,312 @@ class WatchlistTestCase(unittest.TestCase):
         self.assertIn('Done.', result.output)
         self.assertNotEqual(Movie.query.count(), 0)
 
+    @unittest.skipUnless(importlib.util.find_spec('faker'), 'Faker is not installed')
+    def test_forge_command_count(self):
+        db.drop_all()
+        db.create_all()
+        result = self.runner.invoke(forge, ['--count', '25', '--users', '3', '--seed', '7', '--batch-size', '10'])
+        self.assertIn('Generated 25 movies', result.output)
+        self.assertEqual(Movie.query.count(), 25)
+        self.assertEqual(User.query.count(), 3)
+        # 电影轮流分配给各个用户
+        self.assertEqual([m.user_id for m in Movie.query.order_by(Movie.id).limit(4)], [1, 2, 3, 1])
+        first = [(m.title, m.year) for m in Movie.query.order_by(Movie.id)]
+
+        # 同样的种子生成同样的数据
+        db.drop_all()
+        db.create_all()
+        self.runner.invoke(forge, ['--count', '25', '--seed', '7', '--batch-size', '5'])
+        self.assertEqual(first[:5], [(m.title, m.year) for m in Movie.query.order_by(Movie.id).limit(5)])
+
+        # 再次运行时用户名不重复；至少要生成一个用户
+        result = self.runner.invoke(forge, ['--count', '5', '--users', '3', '--seed', '7'])
+        self.assertIn('Created 3 users.', result.output)
+        self.assertEqual(User.query.count(), 4)
+        self.assertEqual(len({u.username for u in User.query}), 4)
+        db.drop_all()
+        db.create_all()
+        result = self.runner.invoke(forge, ['--count', '5', '--users', '0'])
+        self.assertEqual(result.exit_code, 2)
+        self.assertEqual(Movie.query.count(), 0)
+
+    # 测试静态资源构建：带哈希的文件名、预压缩和长期缓存
+    def test_build_assets(self):
+        import shutil
+
+        from watchlist import assets
+
+        static = os.path.join(tempfile.mkdtemp(), 'static')
+        shutil.copytree(self.app.static_folder, static, ignore=shutil.ignore_patterns('dist'))
+        reports = {r['file']: r for r in assets.build(static)}
+        self.assertIn('gzip', reports['style.css'])
+        self.assertNotIn('gzip', reports['sheep.jpg'])
+
+        self.app.static_folder = static
+        self.app.config['WATCHLIST_ASSETS'] = True
+        assets.init_app(self.app)
+        data = self.client.get('/').get_data(as_text=True)
+        manifest = self.app.extensions['watchlist_assets']
+        url = '/static/dist/' + manifest['files']['style.css']
+        self.assertIn(url, data)
+        if assets.Image is not None:
+            self.assertIn('type="image/webp"', data)
+
+        response = self.client.get(url, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.headers['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(response.mimetype, 'text/css')
+        response.close()
+        response = self.client.get(url)
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertIn(b'.movie-list', response.get_data())
+        response.close()
+        # 未构建的路径仍由默认方式处理
+        response = self.client.get('/static/style.css')
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+    # 测试流式输出全部电影
+    def test_all_movies_streamed(self):
+        movies = [Movie(title='Streamed Movie %d' % i, year='2000', user=self.user) for i in range(30)]
+        db.session.add_all(movies)
+        db.session.commit()
+        self.app.config['WATCHLIST_STREAM_BATCH'] = 7
+        self.assertIn('/all', self.client.get('/').get_data(as_text=True))
+
+        response = self.client.get('/all')
+        self.assertTrue(response.is_streamed)
+        data = response.get_data(as_text=True)
+        self.assertIn('31 Titles', data)
+        self.assertIn('Test Movie Title - 2019', data)
+        self.assertIn('Streamed Movie 29 - 2000', data)
+        self.assertNotIn('/movie/edit/', data)
+        self.assertIn('</html>', data)
+
+        self.login()
+        fragments = len(self.app.extensions['watchlist_cache'].fragments)
+        data = self.client.get('/all').get_data(as_text=True)
+        self.assertIn('/movie/edit/31', data)
+        # 不占用片段缓存
+        self.assertEqual(len(self.app.extensions['watchlist_cache'].fragments), fragments)
+
+    # 测试响应压缩
+    def test_compression(self):
+        import gzip
+
+        from watchlist import compress
+
+        movies = [Movie(title='Compressed Movie %d' % i, year='2000', user=self.user) for i in range(20)]
+        db.session.add_all(movies)
+        db.session.commit()
+        plain = self.client.get('/')
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertIn('Accept-Encoding', plain.headers['Vary'])
+
+        response = self.client.get('/', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        etag = response.headers['ETag']
+        self.assertTrue(etag.startswith('W/'))
+        # 用弱 ETag 验证时 304 响应返回同样的弱 ETag
+        cached = self.client.get('/', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.headers['ETag'], etag)
+        self.assertIn('Accept-Encoding', cached.headers['Vary'])
+        cached = self.client.get('/', headers={'If-None-Match': plain.headers['ETag']})
+        self.assertEqual(cached.headers['ETag'], plain.headers['ETag'])
+        self.assertEqual(int(response.headers['Content-Length']), len(response.get_data()))
+        self.assertLess(len(response.get_data()), len(plain.get_data()))
+        self.assertEqual(gzip.decompress(response.get_data()), plain.get_data())
+        if compress.brotli is not None:
+            response = self.client.get('/', headers={'Accept-Encoding': 'gzip, br'})
+            self.assertEqual(response.headers['Content-Encoding'], 'br')
+            self.assertEqual(compress.brotli.decompress(response.get_data()), plain.get_data())
+
+        # 小于阈值的响应和图片不压缩
+        response = self.client.get('/api/v1/movies/1', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response.headers)
+        response = self.client.get('/static/images/totoro.gif', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response.headers)
+        response.close()
+
+        # 没有 Content-Length 的流式响应逐块压缩
+        def streamed(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/html; charset=utf-8'), ('ETag', '"abc"')])
+            return iter([b'<li>movie</li>' * 10] * 5)
+
+        chunks = []
+        middleware = compress.CompressionMiddleware(streamed, min_size=10 ** 6)
+        body = middleware({'REQUEST_METHOD': 'GET', 'HTTP_ACCEPT_ENCODING': 'gzip'},
+                          lambda status, headers, exc_info=None: chunks.append(dict(headers)))
+        self.assertEqual(chunks[0]['Content-Encoding'], 'gzip')
+        self.assertEqual(chunks[0]['ETag'], 'W/"abc"')
+        self.assertNotIn('Content-Length', chunks[0])
+        self.assertEqual(gzip.decompress(b''.join(body)), b'<li>movie</li>' * 50)
+
+    # 测试预编译模板到字节码缓存
+    def test_compile_templates_command(self):
+        result = self.runner.invoke(args=['compile-templates'])
+        self.assertIn('WATCHLIST_TEMPLATE_CACHE_DIR', result.output)
+
+        directory = tempfile.mkdtemp()
+        app = create_app('testing', WATCHLIST_TEMPLATE_CACHE_DIR=directory)
+        with app.app_context():
+            result = app.test_cli_runner().invoke(args=['compile-templates'])
+        self.assertIn('Compiled', result.output)
+        self.assertGreaterEqual(len(os.listdir(directory)), len(app.jinja_env.list_templates(extensions=['html'])))
+
+    # 测试电影列表行的片段缓存
+    def test_movie_row_fragment_cache(self):
+        self.assertIn('Test Movie Title - 2019', self.client.get('/').get_data(as_text=True))
+        fragments = self.app.extensions['watchlist_cache'].fragments
+        self.assertEqual(len(fragments), 1)
+
+        # 登录后的行带编辑按钮，使用不同的缓存键
+        self.login()
+        data = self.client.get('/').get_data(as_text=True)
+        self.assertIn('/movie/edit/1', data)
+        self.assertEqual(len(fragments), 2)
+
+        # 修改后缓存键随内容改变，不会显示旧的片段
+        self.client.post('/movie/edit/1', data=dict(title='New Title', year='2020'))
+        data = self.client.get('/').get_data(as_text=True)
+        self.assertIn('New Title - 2020', data)
+        self.assertNotIn('Test Movie Title', data)
+
+    def test_reindex_command(self):
+        result = self.runner.invoke(reindex)
+        self.assertIn('Rebuilt search index.', result.output)
+        response = self.client.get('/search?q=test')
+        self.assertIn('Test Movie Title', response.get_data(as_text=True))
+
+    def test_import_export_commands(self):
+        tmpdir = tempfile.mkdtemp()
+        csv_path = os.path.join(tmpdir, 'movies.csv')
+        with open(csv_path, 'w', encoding='utf-8') as f:
+            f.write('title,year\nLeon,1994\nLeon,1994\nTest Movie Title,2019\n,1999\nWALL-E,2008\n')
+        result = self.runner.invoke(import_movies, [csv_path, '--batch-size', '2'])
+        self.assertIn('Imported 2 movies', result.output)
+        self.assertIn('Skipped 2 duplicate and 1 invalid rows.', result.output)
+        self.assertEqual(Movie.query.count(), 3)
+
+        jsonl_path = os.path.join(tmpdir, 'movies.jsonl')
+        result = self.runner.invoke(export_movies, [jsonl_path])
+        self.assertIn('Exported 3 movies', result.output)
+        with open(jsonl_path, encoding='utf-8') as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual(rows[1], {'title': 'Leon', 'year': '1994'})
+
+        # 导入后缓存的电影总数也要更新
+        data = self.client.get('/').get_data(as_text=True)
+        self.assertIn('3 Titles', data)
+
     def test_initdb_command(self):
         result = self.runner.invoke(initdb)
         self.assertIn('Initialized database.', result.output)
+        # 新建的数据库记录为最新版本
+        result = self.runner.invoke(args=['db', 'current'])
+        self.assertIn('(head)', result.output)
+
+    def _schema(self):
+        rows = db.session.execute(text("SELECT type, name FROM sqlite_master WHERE name NOT LIKE 'sqlite_%' "
+                                       "AND name != 'watchlist_version'"))
+        columns = {t: [r[1] for r in db.session.execute(text('PRAGMA table_info(%s)' % t))] for t in ('movie', 'user')}
+        return set(rows), columns
+
+    # 测试迁移后的结构与模型一致
+    def test_migrations_match_models(self):
+        from watchlist import migrate
+
+        expected = self._schema()
+        db.drop_all()
+        self.assertEqual([m.revision for m in migrate.upgrade()], ['0001', '0002', '0003', '0004', '0005', '0006',
+                                                                '0007'])
+        self.assertEqual(self._schema(), expected)
+        self.assertEqual(migrate.current_revision(), migrate.head())
+        self.assertEqual(migrate.upgrade(), [])
+
+    # 测试在旧数据库上执行迁移，数据保留
+    def test_migrate_legacy_database(self):
+        from watchlist import migrate
+
+        password_hash = self.user.password_hash
+        db.drop_all()
+        db.session.execute(text('CREATE TABLE user (id INTEGER NOT NULL, name VARCHAR(20), username VARCHAR(20), '
+                                'password_hash VARCHAR(128), PRIMARY KEY (id))'))
+        db.session.execute(text('CREATE TABLE movie (id INTEGER NOT NULL, title VARCHAR(60), year VARCHAR(4), '
+                                'PRIMARY KEY (id))'))
+        db.session.execute(text("INSERT INTO user (name, username, password_hash) VALUES ('Old', 'old', :h)"),
+                           {'h': password_hash})
+        for i in range(7):
+            db.session.execute(text("INSERT INTO movie (title, year) VALUES (:t, '1999')"), {'t': 'Legacy %d' % i})
+        db.session.commit()
+
+        migrate.upgrade(batch_size=3)
+        db.session.expire_all()
+        self.assertEqual(Movie.query.filter_by(user_id=1).count(), 7)
+        self.assertEqual(Movie.query.first().year, 1999)
+        self.assertEqual(Movie.decade_counts(1), [(1990, 7)])
+        data = self.client.get('/search?q=legacy').get_data(as_text=True)
+        self.assertIn('Legacy 6', data)
+        self.assertIn('7 Titles', self.client.get('/').get_data(as_text=True))
+
+    # 测试重建表时复制期间的写操作同步到新表
+    def test_migrate_rebuild_table(self):
+        from watchlist import migrate
+
+        migrate.stamp('head')
+        db.session.add_all([Movie(title='Movie %d' % i, year=2020, user=self.user) for i in range(9)])
+        db.session.commit()
+        migrate.downgrade('0004')
+        writes = []
+
+        class ConcurrentWrites(migrate.Progress):
+            def update(self, count):
+                # 第一批复制完成后，模拟其他请求修改旧表
+                if not writes:
+                    db.session.execute(text("INSERT INTO movie (title, year) VALUES ('Late', '2024')"))
+                    db.session.execute(text("UPDATE movie SET title = 'Renamed' WHERE title = 'Movie 8'"))
+                    db.session.execute(text("DELETE FROM movie WHERE id = 1"))
+                    db.session.commit()
+                writes.append(count)
+
+        migrate.downgrade('0003', batch_size=4, progress=ConcurrentWrites)
+        self.assertEqual(len(writes), 3)
+        self.assertEqual(migrate.current_revision(), '0003')
+        titles = [r[0] for r in db.session.execute(text('SELECT title FROM movie ORDER BY id'))]
+        self.assertEqual(titles, ['Movie %d' % i for i in range(8)] + ['Renamed', 'Late'])
+        self.assertNotIn('user_id', [r[1] for r in db.session.execute(text('PRAGMA table_info(movie)'))])
+        match = text("SELECT rowid FROM movie_fts WHERE movie_fts MATCH 'renamed'")
+        self.assertEqual(len(db.session.execute(match).all()), 1)
+
+        migrate.upgrade()
+        db.session.expire_all()
+        self.assertEqual(Movie.query.filter_by(user_id=self.user.id).count(), 10)
+
+    # 测试重建表中途失败时删除同步触发器和临时表，旧表仍可写入，迁移可以重新执行
+    def test_migrate_rebuild_table_failure(self):
+        from watchlist import migrate
+
+        migrate.stamp('head')
+        db.session.add_all([Movie(title='Movie %d' % i, year=2020, user=self.user) for i in range(9)])
+        db.session.commit()
+        migrate.downgrade('0004')
+
+        class FailingCopy(migrate.Progress):
+            def update(self, count):
+                raise RuntimeError('copy failed')
+
+        self.assertRaises(RuntimeError, migrate.downgrade, '0003', batch_size=4, progress=FailingCopy)
+        self.assertEqual(migrate.current_revision(), '0004')
+        leftovers = db.session.execute(text("SELECT name FROM sqlite_master WHERE name LIKE '_rebuild_%'")).all()
+        self.assertEqual(leftovers, [])
+        db.session.execute(text("INSERT INTO movie (title, year, user_id) VALUES ('After Failure', '2024', 1)"))
+        db.session.commit()
+
+        migrate.downgrade('0003', batch_size=4)
+        self.assertEqual(migrate.current_revision(), '0003')
+        self.assertEqual(db.session.execute(text('SELECT count(*) FROM movie')).scalar(), 11)
 
     def test_admin_command(self):
         db.drop_all()
@@ -254,12 +1242,57 @@ class WatchlistTestCase(unittest.TestCase):
         self.assertTrue(User.query.first().validate_password('123'))
 
     def test_admin_command_update(self):
-        result = self.runner.invoke(args=['admin', '--username', 'peter', '--password', '456'])
+        result = self.runner.invoke(args=['admin', '--username', 'test', '--password', '456', '--update'])
         self.assertIn('Updating user...', result.output)
         self.assertIn('Done.', result.output)
         self.assertEqual(User.query.count(), 1)
-        self.assertEqual(User.query.first().username, 'peter')
         self.assertTrue(User.query.first().validate_password('456'))
+        result = self.runner.invoke(args=['admin', '--username', 'peter', '--password', '456', '--update'])
+        self.assertIn('User peter not found.', result.output)
+
+    # 测试创建更多用户，用户名已被占用时报错而不是修改已有用户
+    def test_admin_command_multiple_users(self):
+        result = self.runner.invoke(args=['admin', '--username', 'peter', '--password', '456'])
+        self.assertIn('Creating user...', result.output)
+        self.assertEqual([u.username for u in User.query.order_by(User.id)], ['test', 'peter'])
+        self.assertTrue(User.query.filter_by(username='peter').first().validate_password('456'))
+
+        result = self.runner.invoke(args=['admin', '--username', 'test', '--password', '789'])
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn('Username test is already taken.', result.output)
+        self.assertEqual(User.query.count(), 2)
+        self.assertTrue(User.query.filter_by(username='test').first().validate_password('123'))
+
+    # 用最小的参数运行每个基准测试，确认修改代码后它们仍能运行
+    def test_benchmarks_smoke(self):
+        from click.testing import CliRunner
+
+        from benchmarks.__main__ import cli
+
+        runs = {
+            'compression': ['--per-page', '5', '-n', '2'],
+            'endpoints': ['--sizes', '20', '-n', '2'],
+            'login': ['--users', '2', '-n', '2', '--hash-method', 'pbkdf2:sha256:1'],
+            'replica': ['-r', '1', '-d', '0.2', '--rows', '20'],
+            'serving': ['-s', 'wsgi', '-c', '1', '-d', '0.2', '--size', '20'],
+            'sessions': ['-n', '2'],
+            'sqlite': ['-w', '1', '-d', '0.2', '--rows', '20'],
+            'startup': ['-n', '1', '--apps', '1'],
+            'streaming': ['--sizes', '20', '-n', '1'],
+            'templates': ['-n', '1', '--per-page', '5'],
+            'writes': ['-c', '1', '-d', '0.2'],
+        }
+        self.assertEqual(set(runs) | {'compare'}, set(cli.commands))
+        directory = tempfile.mkdtemp()
+        for name, args in runs.items():
+            with self.subTest(benchmark=name):
+                output = os.path.join(directory, name + '.json')
+                result = CliRunner().invoke(cli, [name, '-o', output] + args)
+                self.assertEqual(result.exit_code, 0, result.output)
+                with open(output) as f:
+                    self.assertTrue(json.load(f)['results'])
+        output = os.path.join(directory, 'templates.json')
+        self.assertEqual(CliRunner().invoke(cli, ['compare', output, output]).exit_code, 0)
 
 
 if __name__ == '__main__':
@@ -1,59 +1,97 @@
+import importlib
 import os
-import sys
 
 from flask import Flask
-from flask_login import LoginManager
-from flask_sqlalchemy import SQLAlchemy
+from flask.cli import AppGroup
+from jinja2 import FileSystemBytecodeCache
 
-# 系统平台判断
-WIN = sys.platform.startswith('win')
-if WIN:
-    prefix = 'sqlite:///'
-else:
-    prefix = 'sqlite:////'
+from watchlist.extensions import db, login_manager
 
-# 创建Flask应用实例
-# 配置数据库的连接信息
-# app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:////' + os.path.join(app.root_path, 'data.db')
-# 对于SQLite, [sqlite:////数据库文件的绝对路径]
+# 命令名 -> 定义命令的位置，执行命令时才导入对应模块
+COMMANDS = {
+    'initdb': 'watchlist.commands:initdb',
+    'reindex': 'watchlist.commands:reindex',
+    'forge': 'watchlist.commands:forge',
+    'admin': 'watchlist.commands:admin',
+    'import-movies': 'watchlist.commands:import_movies',
+    'export-movies': 'watchlist.commands:export_movies',
+    'compile-templates': 'watchlist.commands:compile_templates',
+    'build-assets': 'watchlist.commands:build_assets',
+    'db': 'watchlist.migrate:db_cli',
+}
 
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = prefix + os.path.join(os.path.dirname(app.root_path), os.getenv('DATABASE_FILE',
-                                                                                                        'data.db'))
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False  # 关闭对模型修改的监控
-# 密钥这种敏感信息，保存到环境变量中要比直接写在代码中更加安全。
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev')
-db = SQLAlchemy(app)  # 初始化扩展，传入程序实例app
 
-# 实例化扩展类
-login_manager = LoginManager(app)
-login_manager.login_message = 'Please login to access this page.'
+class LazyAppGroup(AppGroup):
+    """
+    按需导入命令的命令组，启动 worker 或运行 flask run 时不会导入 commands 模块
+    """
 
+    def __init__(self, *args, lazy_commands=None, **kwargs):
+        super(LazyAppGroup, self).__init__(*args, **kwargs)
+        self.lazy_commands = lazy_commands or {}
 
-@login_manager.user_loader
-def load_user(user_id):
-    from watchlist.models import User
-    user = User.query.get(int(user_id))
-    return user
+    def list_commands(self, ctx):
+        return sorted(set(super(LazyAppGroup, self).list_commands(ctx)) | set(self.lazy_commands))
 
+    def get_command(self, ctx, name):
+        if name in self.lazy_commands and name not in self.commands:
+            module_name, attr = self.lazy_commands[name].split(':')
+            self.add_command(getattr(importlib.import_module(module_name), attr), name)
+        return super(LazyAppGroup, self).get_command(ctx, name)
 
-login_manager.login_view = 'login'
 
+def create_app(config_name=None, **config):
+    """
+    创建程序实例
 
-@app.context_processor
-def inject_user():
-    from watchlist.models import User
-    user = User.query.first()
-    return dict(user=user)
+    config_name 为 settings.config 中的配置名，默认读取环境变量 FLASK_CONFIG；
+    其余关键字参数会覆盖对应的配置项。
+    """
+    from watchlist import assets, auth, compress, replica, sessions, writes
+    from watchlist.database import SQLITE_PROFILES, apply_pragmas, engine_options
+    from watchlist.settings import config as configs
 
+    if config_name is None:
+        config_name = os.getenv('FLASK_CONFIG', 'development')
 
-from watchlist import views, errors, commands
+    app = Flask('watchlist')
+    app.config.from_object(configs[config_name])
+    app.config.update(config)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config['WATCHLIST_DB_PROFILE'],
+                                                                      app.config['SQLALCHEMY_DATABASE_URI']))
 
-# import os
-# import sys
-# import click
-# from flask import Flask, flash, redirect, render_template, request, url_for
-# from flask_sqlalchemy import SQLAlchemy
-# from markupsafe import escape
-# from werkzeug.security import check_password_hash, generate_password_hash
-# from flask_login import LoginManager, UserMixin, current_user, login_required, login_user, logout_user
+    db.init_app(app)
+    login_manager.init_app(app)
+    auth.init_app(app)
+    with app.app_context():
+        apply_pragmas(db.engine, SQLITE_PROFILES[app.config['WATCHLIST_DB_PROFILE']]['pragmas'])
+    sessions.init_app(app)
+    writes.init_app(app)
+    replica.init_app(app)
+
+    # 必须在第一次访问 app.jinja_env 之前设置
+    if app.config['WATCHLIST_TEMPLATE_CACHE_DIR']:
+        os.makedirs(app.config['WATCHLIST_TEMPLATE_CACHE_DIR'], exist_ok=True)
+        app.jinja_options = dict(app.jinja_options,
+                                 bytecode_cache=FileSystemBytecodeCache(app.config['WATCHLIST_TEMPLATE_CACHE_DIR']))
+
+    assets.init_app(app)
+
+    app.cli = LazyAppGroup(app.name, lazy_commands=COMMANDS)
+    register_blueprints(app)
+    compress.init_app(app)
+    return app
+
+
+def register_blueprints(app):
+    from watchlist.api import api_bp
+    from watchlist.errors import errors_bp
+    from watchlist.views import main_bp
+
+    app.register_blueprint(main_bp)
+    app.register_blueprint(errors_bp)
+    app.register_blueprint(api_bp, url_prefix='/api/v1')
+    # 只有开启统计时才导入和注册
+    if app.config['WATCHLIST_INSTRUMENT']:
+        from watchlist.metrics import metrics_bp
+        app.register_blueprint(metrics_bp)
@@ -0,0 +1,62 @@
+from flask import abort, current_app
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from watchlist.api import filter_movies, list_args, make_json, page_response, serialize
+from watchlist.auth import current_owner_id
+from watchlist.cache import MISSING, lookup, store
+from watchlist.database import SQLITE_PROFILES, apply_pragmas
+from watchlist.listing import sort_args
+from watchlist.models import Movie
+from watchlist.pagination import keyset_page, keyset_query
+from watchlist.search import search_statement
+
+# 异步读接口，使用 aiosqlite 驱动的 AsyncSession
+# 需要安装 flask[async] 和 aiosqlite，配置 WATCHLIST_ASYNC=1 后替换 API 中的同步读接口。
+# Flask 在每个请求里为异步视图单独运行一个事件循环，连接不能跨循环复用，所以使用 NullPool。
+
+
+def get_async_engine():
+    engine = current_app.extensions.get('watchlist_async_engine')
+    if engine is None:
+        uri = current_app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:', 'sqlite+aiosqlite:', 1)
+        engine = create_async_engine(uri, poolclass=NullPool)
+        apply_pragmas(engine.sync_engine, SQLITE_PROFILES[current_app.config['WATCHLIST_DB_PROFILE']]['pragmas'])
+        current_app.extensions['watchlist_async_engine'] = engine
+    return engine
+
+
+def async_session():
+    return AsyncSession(get_async_engine(), expire_on_commit=False)
+
+
+async def list_movies_async():
+    args = list_args()
+    user_id = current_owner_id()
+    async with async_session() as session:
+        if args['q']:
+            stmt = search_statement(args['q'], user_id, limit=args['limit'])
+            movies = (await session.execute(stmt)).scalars().all() if stmt is not None else []
+            return make_json({'items': [serialize(m) for m in movies]})
+
+        stmt = keyset_query(filter_movies(select(Movie).where(Movie.user_id == user_id), args), Movie.id,
+                            after=args['after'], before=args['before'], per_page=args['limit'], **sort_args(args))
+        rows = (await session.execute(stmt)).scalars().all()
+        page = keyset_page(rows, after=args['after'], before=args['before'], per_page=args['limit'])
+
+        # 与同步版本共用缓存的电影总数
+        key = ('Movie', 'count', user_id)
+        total = lookup(key)
+        if total is MISSING:
+            total = store(key, await session.scalar(select(func.count(Movie.id)).where(Movie.user_id == user_id)))
+    return page_response(page, total)
+
+
+async def get_movie_async(movie_id):
+    user_id = current_owner_id()
+    async with async_session() as session:
+        movie = await session.get(Movie, movie_id)
+    if movie is None or movie.user_id != user_id:
+        abort(404)
+    return make_json(serialize(movie))
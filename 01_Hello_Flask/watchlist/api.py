@@ -0,0 +1,271 @@
+import functools
+import json
+
+from flask import Blueprint, current_app, request
+from flask_login import current_user
+from sqlalchemy import delete, select, update
+from werkzeug.exceptions import HTTPException
+
+from watchlist.auth import current_owner_id
+from watchlist.cache import invalidate
+from watchlist.extensions import db
+from watchlist.listing import filter_years, list_options, sort_args
+from watchlist.models import Movie, format_year
+from watchlist.pagination import keyset_paginate
+from watchlist.replica import replica_reads
+from watchlist.search import search_movies
+
+# JSON API，路径前缀 /api/v1
+# 创建、修改、删除都支持一次提交多部电影，整批在一个事务中完成
+api_bp = Blueprint('api', __name__)
+
+
+class APIError(Exception):
+    def __init__(self, message, status=400, **extra):
+        super(APIError, self).__init__(message)
+        self.message = message
+        self.status = status
+        self.extra = extra
+
+
+def make_json(data, status=200):
+    # 紧凑格式，不缩进、不加空格
+    body = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    return current_app.response_class(body, status=status, mimetype='application/json')
+
+
+def serialize(movie):
+    return {'id': movie.id, 'title': movie.title, 'year': format_year(movie.year)}
+
+
+@api_bp.errorhandler(APIError)
+def handle_api_error(e):
+    return make_json(dict(error=e.message, **e.extra), e.status)
+
+
+@api_bp.errorhandler(HTTPException)
+def handle_http_error(e):
+    return make_json({'error': e.description}, e.code)
+
+
+# 程序级别按状态码注册的错误处理函数（返回 HTML 页面）优先于按异常类注册的，
+# 所以这几个状态码需要在蓝本上单独注册
+for code in (400, 404, 500):
+    api_bp.register_error_handler(code, handle_http_error)
+
+
+def api_login_required(f):
+    """
+    未登录时返回 401，而不是重定向到登录页
+    """
+
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+        if not current_user.is_authenticated:
+            raise APIError('Authentication required.', 401)
+        return f(*args, **kwargs)
+
+    return wrapper
+
+
+def _is_id(value):
+    # JSON 中的 true / false 解析为 bool，它是 int 的子类，不能当作 id
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _payload(key=None, ids=False):
+    """
+    读取请求体，单个对象也统一转换成列表，返回 (列表, 是否批量)
+
+    ids 为 True 时每项必须是电影 id，否则必须是对象。
+    """
+    data = request.get_json(silent=True)
+    if key is not None and isinstance(data, dict) and key in data:
+        data = data[key]
+    batch = isinstance(data, list)
+    items = data if batch else [data]
+    valid = _is_id if ids else (lambda item: isinstance(item, dict))
+    if not items or not all(valid(item) for item in items):
+        raise APIError('Invalid JSON payload.')
+    if len(items) > current_app.config['WATCHLIST_API_MAX_BATCH']:
+        raise APIError('Too many items in one request.', 413)
+    return items, batch
+
+
+def _validate(items, partial=False):
+    errors = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append(index)
+            continue
+        title = item.get('title')
+        year = item.get('year')
+        if partial:
+            # 修改时只校验提交的字段，缺少的字段用合法值占位；一个可修改的字段都没有时视为不合法
+            title = title if 'title' in item else 'x'
+            year = year if 'year' in item else '0000'
+            if not _is_id(item.get('id')) or ('title' not in item and 'year' not in item):
+                errors.append(index)
+                continue
+        if not isinstance(title, str) or not Movie.validate_input(title, year):
+            errors.append(index)
+    if errors:
+        raise APIError('Invalid input.', invalid=errors)
+
+
+def _check_exists(ids):
+    # 其他用户的电影同样视为不存在
+    found = set(db.session.execute(select(Movie.id).where(Movie.id.in_(ids),
+                                                          Movie.user_id == current_user.id)).scalars())
+    missing = [movie_id for movie_id in ids if movie_id not in found]
+    if missing:
+        raise APIError('Movie not found.', 404, missing=missing)
+
+
+def list_args():
+    """
+    解析列表接口的查询参数
+    """
+    limit = min(request.args.get('limit', current_app.config['WATCHLIST_PER_PAGE'], type=int),
+                current_app.config['WATCHLIST_API_MAX_PAGE'])
+    return dict(list_options(request.args), **{
+        'limit': max(limit, 1),
+        'q': request.args.get('q', '').strip(),
+        'year': request.args.get('year', type=int),
+        'after': request.args.get('after', type=int),
+        'before': request.args.get('before', type=int),
+    })
+
+
+def filter_movies(query, args):
+    if args['year'] is not None:
+        query = query.filter(Movie.year == args['year'])
+    return filter_years(query, args)
+
+
+def page_response(page, total):
+    return make_json({
+        'items': [serialize(m) for m in page.items],
+        'prev': page.prev_cursor if page.has_prev else None,
+        'next': page.next_cursor if page.has_next else None,
+        'total': total,
+    })
+
+
+@replica_reads
+def list_movies():
+    """
+    电影列表，支持游标分页、排序、按年份筛选和全文搜索
+
+    与主页一样，登录后返回自己的电影，未登录时返回站点所有者的电影。
+    """
+    args = list_args()
+    user_id = current_owner_id()
+    if args['q']:
+        movies = search_movies(args['q'], user_id, limit=args['limit'])
+        return make_json({'items': [serialize(m) for m in movies]})
+
+    page = keyset_paginate(filter_movies(Movie.of_user(user_id), args), Movie.id,
+                           after=args['after'], before=args['before'], per_page=args['limit'], **sort_args(args))
+    return page_response(page, Movie.cached_count(user_id))
+
+
+@api_bp.route('/movies/facets')
+@replica_reads
+def movie_facets():
+    """
+    每个年代的电影数，用于筛选
+    """
+    decades = Movie.decade_counts(current_owner_id())
+    return make_json({'decades': [{'decade': decade, 'count': count} for decade, count in decades]})
+
+
+@replica_reads
+def get_movie(movie_id):
+    return make_json(serialize(Movie.of_user(current_owner_id()).filter(Movie.id == movie_id).first_or_404()))
+
+
+@api_bp.record_once
+def _register_read_views(state):
+    # 读接口有同步和异步两种实现，按配置选择（异步版本见 watchlist/aio.py）
+    if state.app.config['WATCHLIST_ASYNC']:
+        from watchlist.aio import get_movie_async, list_movies_async
+        state.add_url_rule('/movies', 'list_movies', list_movies_async)
+        state.add_url_rule('/movies/<int:movie_id>', 'get_movie', get_movie_async)
+    else:
+        state.add_url_rule('/movies', 'list_movies', list_movies)
+        state.add_url_rule('/movies/<int:movie_id>', 'get_movie', get_movie)
+
+
+@api_bp.route('/movies', methods=['POST'])
+@api_login_required
+def create_movies():
+    """
+    创建一部或多部电影
+    """
+    items, batch = _payload('items')
+    _validate(items)
+    movies = [Movie(title=item['title'], year=Movie.parse_year(item['year']), user_id=current_user.id)
+              for item in items]
+    db.session.add_all(movies)
+    db.session.commit()
+    data = [serialize(m) for m in movies]
+    return make_json({'items': data} if batch else data[0], 201)
+
+
+@api_bp.route('/movies/<int:movie_id>', methods=['PATCH', 'PUT'])
+@api_login_required
+def update_movie(movie_id):
+    movie = Movie.of_user(current_user.id).filter(Movie.id == movie_id).first_or_404()
+    items, batch = _payload()
+    if batch:
+        raise APIError('Invalid JSON payload.')
+    item = dict(items[0], id=movie_id)
+    _validate([item], partial=True)
+    if 'title' in item:
+        movie.title = item['title']
+    if 'year' in item:
+        movie.year = Movie.parse_year(item['year'])
+    db.session.commit()
+    return make_json(serialize(movie))
+
+
+@api_bp.route('/movies', methods=['PATCH'])
+@api_login_required
+def update_movies():
+    """
+    批量修改，每项需包含 id
+    """
+    items, batch = _payload('items')
+    _validate(items, partial=True)
+    _check_exists([item['id'] for item in items])
+    rows = [{k: Movie.parse_year(v) if k == 'year' else v for k, v in item.items() if k in ('id', 'title', 'year')}
+            for item in items]
+    # 按主键批量 UPDATE（executemany），不逐个加载对象；_check_exists 已确认都属于当前用户
+    db.session.execute(update(Movie), rows)
+    db.session.commit()
+    invalidate('Movie')
+    return make_json({'updated': len(rows)})
+
+
+@api_bp.route('/movies/<int:movie_id>', methods=['DELETE'])
+@api_login_required
+def delete_movie(movie_id):
+    movie = Movie.of_user(current_user.id).filter(Movie.id == movie_id).first_or_404()
+    db.session.delete(movie)
+    db.session.commit()
+    return make_json({'deleted': 1})
+
+
+@api_bp.route('/movies', methods=['DELETE'])
+@api_login_required
+def delete_movies():
+    """
+    批量删除，请求体为 id 列表或 {"ids": [...]}
+    """
+    ids, batch = _payload('ids', ids=True)
+    _check_exists(ids)
+    db.session.execute(delete(Movie).where(Movie.id.in_(ids), Movie.user_id == current_user.id))
+    db.session.commit()
+    invalidate('Movie')
+    return make_json({'deleted': len(set(ids))})
@@ -0,0 +1,177 @@
+import gzip
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import shutil
+
+from flask import current_app, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:  # 可选依赖，见 requirements-assets.txt
+    brotli = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# 静态资源构建
+# flask build-assets 把 static 目录下的文件复制到 static/dist，文件名加上内容哈希，
+# 可压缩的文件预先生成 .gz/.br，GIF 动图另外转换为更小的 WebP，并写出 manifest.json。
+# 模板中仍然使用 url_for('static', filename=...)，由 url_defaults 换成带哈希的文件名，
+# 内容改变时文件名随之改变，所以可以让浏览器永久缓存。
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+COMPRESSIBLE = ('.css', '.js', '.svg', '.ico', '.txt', '.json', '.html')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def _hashed_name(path, digest):
+    base, ext = os.path.splitext(path)
+    return '%s.%s%s' % (base, digest[:12], ext)
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _compress(path, data, report):
+    # mtime=0 让同样的内容总是生成同样的 .gz 文件
+    gz = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(gz) < len(data):
+        _write(path + '.gz', gz)
+        report['gzip'] = len(gz)
+    if brotli is not None:
+        br = brotli.compress(data, quality=11)
+        if len(br) < len(data):
+            _write(path + '.br', br)
+            report['brotli'] = len(br)
+
+
+def _to_webp(data):
+    """
+    把 GIF 动图转换为动画 WebP，没有安装 Pillow 时返回 None
+    """
+    if Image is None:
+        return None
+    with Image.open(io.BytesIO(data)) as image:
+        out = io.BytesIO()
+        image.save(out, 'WEBP', save_all=True, quality=80, method=6)
+    return out.getvalue()
+
+
+def build(static_folder, webp=True):
+    """
+    构建 static_folder 中的所有文件，返回每个文件的大小报告
+    """
+    dist = os.path.join(static_folder, DIST)
+    shutil.rmtree(dist, ignore_errors=True)
+    manifest = {'files': {}, 'variants': {}}
+    reports = []
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != dist)
+        for name in sorted(files):
+            source = os.path.join(root, name)
+            filename = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = f.read()
+            hashed = _hashed_name(filename, hashlib.sha256(data).hexdigest())
+            target = os.path.join(dist, hashed)
+            _write(target, data)
+            manifest['files'][filename] = hashed
+            report = {'file': filename, 'size': len(data)}
+            if filename.endswith(COMPRESSIBLE):
+                _compress(target, data, report)
+
+            if webp and filename.endswith('.gif'):
+                converted = _to_webp(data)
+                # 只在确实更小时使用
+                if converted is not None and len(converted) < len(data):
+                    variant = _hashed_name(os.path.splitext(filename)[0] + '.webp',
+                                           hashlib.sha256(converted).hexdigest())
+                    _write(os.path.join(dist, variant), converted)
+                    manifest['variants'][filename] = {'webp': variant}
+                    report['webp'] = len(converted)
+            reports.append(report)
+
+    with open(os.path.join(dist, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return reports
+
+
+def load_manifest(static_folder):
+    path = os.path.join(static_folder, DIST, MANIFEST)
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def init_app(app):
+    """
+    使用构建好的静态资源：url_for 生成带哈希的文件名，静态文件视图支持预压缩和长期缓存
+
+    没有构建过（找不到 manifest.json）或关闭了 WATCHLIST_ASSETS 时不做任何修改。
+    """
+    manifest = load_manifest(app.static_folder) if app.config['WATCHLIST_ASSETS'] else None
+    app.extensions['watchlist_assets'] = manifest
+    app.add_template_global(static_variant)
+    if manifest is None:
+        return
+
+    files = manifest['files']
+
+    @app.url_defaults
+    def fingerprint(endpoint, values):
+        if endpoint == 'static':
+            hashed = files.get(values.get('filename'))
+            if hashed is not None:
+                values['filename'] = '%s/%s' % (DIST, hashed)
+
+    # 替换默认的静态文件视图，URL 规则不变
+    app.view_functions['static'] = send_asset
+
+
+def send_asset(filename):
+    """
+    发送静态文件；dist 中带哈希的文件按 Accept-Encoding 发送预压缩的版本，并允许永久缓存
+    """
+    if not filename.startswith(DIST + '/'):
+        return current_app.send_static_file(filename)
+
+    directory = current_app.static_folder
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    encodings = request.accept_encodings
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if encodings[encoding] and os.path.isfile(os.path.join(directory, filename + suffix)):
+            response = send_from_directory(directory, filename + suffix, mimetype=mimetype, max_age=31536000)
+            response.headers['Content-Encoding'] = encoding
+            # 不要让浏览器以为文件名是 .gz/.br
+            del response.headers['Content-Disposition']
+            break
+    else:
+        response = send_from_directory(directory, filename, max_age=31536000)
+    if filename.endswith(COMPRESSIBLE):
+        response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = IMMUTABLE
+    return response
+
+
+def static_variant(filename, fmt):
+    """
+    模板中使用：返回静态文件另一种格式（例如 webp）的 URL，没有时返回 None
+    """
+    manifest = current_app.extensions.get('watchlist_assets')
+    if not manifest:
+        return None
+    variant = manifest['variants'].get(filename, {}).get(fmt)
+    if variant is None:
+        return None
+    return url_for('static', filename='%s/%s' % (DIST, variant))
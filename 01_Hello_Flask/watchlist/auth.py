@@ -0,0 +1,138 @@
+import concurrent.futures
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+from flask import current_app
+from flask_login import current_user
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HashPoolBusy(Exception):
+    """
+    密码校验队列已满或等待超时
+    """
+
+
+class HashPool(object):
+    """
+    有界的密码校验线程池
+
+    密码哈希故意设计得很慢，同时校验的数量限制为 workers 个，
+    最多再排队 queue 个，超出时直接拒绝，避免登录请求占满所有 worker 的 CPU。
+    hashlib 的 scrypt/pbkdf2 计算时会释放 GIL，所以放到线程池中不会阻塞其他请求。
+    """
+
+    def __init__(self, workers, queue, timeout):
+        self.executor = concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix='password-hash')
+        self.slots = threading.BoundedSemaphore(workers + queue)
+        self.timeout = timeout
+        self.dummy_hashes = {}  # 哈希算法 -> 用于拒绝未知用户的哈希值
+
+    def verify(self, password_hash, password):
+        if not self.slots.acquire(blocking=False):
+            raise HashPoolBusy()
+        try:
+            future = self.executor.submit(check_password_hash, password_hash, password)
+        except BaseException:
+            self.slots.release()
+            raise
+        # 任务结束时才释放名额，请求等待超时后任务仍占用名额
+        future.add_done_callback(lambda f: self.slots.release())
+        try:
+            return future.result(self.timeout)
+        except concurrent.futures.TimeoutError:
+            raise HashPoolBusy()
+
+
+class RateLimiter(object):
+    """
+    滑动窗口计数的限流器，window 秒内每个键最多 limit 次
+
+    只保存最近活跃的 max_keys 个键，内存占用有上限。
+    """
+
+    def __init__(self, limit, window, max_keys=10000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self.hits = OrderedDict()  # 键 -> 请求时间队列
+        self.lock = threading.Lock()
+
+    def hit(self, key):
+        """
+        记录一次请求，超过限制时返回 False
+        """
+        now = time.monotonic()
+        with self.lock:
+            hits = self.hits.pop(key, None)
+            if hits is None:
+                hits = deque()
+            while hits and hits[0] <= now - self.window:
+                hits.popleft()
+            allowed = len(hits) < self.limit
+            if allowed:
+                hits.append(now)
+            self.hits[key] = hits
+            while len(self.hits) > self.max_keys:
+                self.hits.popitem(last=False)
+            return allowed
+
+    def reset(self, key):
+        with self.lock:
+            self.hits.pop(key, None)
+
+
+def init_app(app):
+    app.extensions['watchlist_hash_pool'] = HashPool(app.config['WATCHLIST_HASH_WORKERS'],
+                                                     app.config['WATCHLIST_HASH_QUEUE'],
+                                                     app.config['WATCHLIST_HASH_TIMEOUT'])
+    app.extensions['watchlist_login_limiter'] = RateLimiter(app.config['WATCHLIST_LOGIN_LIMIT'],
+                                                            app.config['WATCHLIST_LOGIN_WINDOW'])
+
+
+def verify_password(password_hash, password):
+    return current_app.extensions['watchlist_hash_pool'].verify(password_hash, password)
+
+
+def reject_password(password):
+    """
+    用户不存在时同样做一次完整的密码校验并返回 False
+
+    让未知用户和密码错误的响应耗时一致，无法通过耗时判断用户名是否存在。
+    """
+    pool = current_app.extensions['watchlist_hash_pool']
+    method = current_app.config['PASSWORD_HASH_METHOD']
+    dummy = pool.dummy_hashes.get(method)
+    if dummy is None:
+        # 第一次用到时才生成，不拖慢程序启动
+        dummy = pool.dummy_hashes[method] = generate_password_hash(os.urandom(16).hex(), method=method)
+    pool.verify(dummy, password)
+    return False
+
+
+def login_allowed(remote_addr, username):
+    """
+    按 IP 和用户名分别限流，两者都未超限时才允许尝试登录
+    """
+    limiter = current_app.extensions['watchlist_login_limiter']
+    by_ip = limiter.hit('ip:%s' % remote_addr)
+    by_username = limiter.hit('user:%s' % username)
+    return by_ip and by_username
+
+
+def login_succeeded(username):
+    current_app.extensions['watchlist_login_limiter'].reset('user:%s' % username)
+
+
+def current_owner_id():
+    """
+    当前显示的是哪个用户的电影：已登录时为当前用户，未登录时为站点所有者（第一个用户）
+    """
+    if current_user.is_authenticated:
+        return current_user.id
+    from watchlist.models import User
+
+    owner = User.cached_owner()
+    return owner.id if owner is not None else None
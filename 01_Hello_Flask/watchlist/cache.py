@@ -0,0 +1,336 @@
+import functools
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from flask import Response, current_app, g, has_app_context, has_request_context, request, session
+from flask_login import current_user
+from sqlalchemy import event, inspect, select, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+
+# 进程内缓存
+# 每个模型维护一个版本号，事务提交后如果修改了该模型，版本号加一，
+# 同时清除依赖该模型的缓存项。缓存项以 (模型名, ...) 作为键。
+# 多个 worker 进程共用一个数据库时，其他进程的提交不会触发本进程的 after_commit。
+# 数据库中的 cache_version 表由触发器维护每个模型的共享版本号，每个请求第一次读缓存前查询一次，
+# 发现变化的模型同样使本进程的缓存失效。
+
+logger = logging.getLogger(__name__)
+
+class CacheState(object):
+    """
+    保存在 app.extensions 中的缓存状态
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.versions = {}  # 模型名 -> 版本号
+        self.values = {}  # 缓存键 -> (过期时间, 值)
+        self.pages = OrderedDict()  # (路径, 用户) -> (过期时间, 版本, ETag, 页面)，按最近使用排序
+        self.fragments = OrderedDict()  # 片段键 -> 渲染好的 HTML，按最近使用排序
+        self.records = OrderedDict()  # (模型名, 主键) -> (过期时间, 列值)，按最近使用排序
+        self.record_hits = 0
+        self.record_misses = 0
+        self.shared = None  # 上次从 cache_version 表读到的共享版本号，模型名 -> 版本号
+
+    def bump(self, name):
+        with self.lock:
+            self.versions[name] = self.versions.get(name, 0) + 1
+            for key in [k for k in self.values if k[0] == name]:
+                del self.values[key]
+
+
+def _state():
+    return current_app.extensions.setdefault('watchlist_cache', CacheState())
+
+
+def sync():
+    """
+    读取数据库中的共享版本号，其他进程修改过的模型在本进程中同样失效
+
+    一个请求中只查询一次；不在请求中时（命令、后台线程）每次都查询。
+    旧数据库还没有 cache_version 表时只使用进程内的版本号。
+    """
+    if has_request_context():
+        if request.environ.get('watchlist.cache_synced'):
+            return
+        request.environ['watchlist.cache_synced'] = True
+    sa = current_app.extensions['sqlalchemy']
+    try:
+        # 总是查询主库，读写分离时快照中的版本号可能是旧的
+        shared = dict(sa.session.execute(text('SELECT name, version FROM cache_version'),
+                                         bind_arguments={'bind': sa.engine}).all())
+    except OperationalError:
+        logger.debug('cache_version table is missing, run "flask db upgrade" to share cache versions')
+        return
+    state = _state()
+    with state.lock:
+        previous, state.shared = state.shared, shared
+    # 第一次读取时本进程还没有缓存任何内容，不需要失效
+    if previous is not None:
+        changed = [name for name, version in shared.items() if previous.get(name) != version]
+        if changed:
+            invalidate(*changed)
+
+
+def get_version(name):
+    """
+    返回模型的当前版本号
+    """
+    sync()
+    return _state().versions.get(name, 0)
+
+
+def get_versions():
+    """
+    返回所有模型当前版本号的副本
+    """
+    sync()
+    with _state().lock:
+        return dict(_state().versions)
+
+
+MISSING = object()
+
+
+def lookup(key):
+    """
+    读取缓存，未命中或已过期时返回 MISSING
+    """
+    sync()
+    item = _state().values.get(key)
+    if item is not None and item[0] > time.monotonic():
+        return item[1]
+    return MISSING
+
+
+def store(key, value, ttl=None):
+    state = _state()
+    if ttl is None:
+        ttl = current_app.config['WATCHLIST_CACHE_TTL']
+    with state.lock:
+        state.values[key] = (time.monotonic() + ttl, value)
+    return value
+
+
+def cached(key, factory, ttl=None):
+    """
+    读取缓存，未命中或已过期时调用 factory 生成并写入缓存
+    """
+    value = lookup(key)
+    if value is MISSING:
+        value = store(key, factory(), ttl)
+    return value
+
+
+def cached_instance(model, key, *criteria, order_by=None):
+    """
+    缓存一条记录的列值，返回合并到当前会话中的模型实例
+
+    命中缓存时不查询数据库：用缓存的列值构造一个 detached 实例，
+    再通过 merge(load=False) 放入会话，之后可以像普通查询结果一样修改并提交。
+    同一请求内的重复调用直接返回 g 中记住的实例。
+    """
+    key = (model.__name__,) + key
+    memo = g.setdefault('watchlist_instances', {})
+    if key in memo:
+        return memo[key]
+
+    values = cached(key, lambda: _load_values(model, criteria, order_by))
+    instance = _attach(model, values) if values is not None else None
+    memo[key] = instance
+    return instance
+
+
+def _load_values(model, criteria, order_by=None):
+    # 只查询列值，不经过会话的 identity map
+    stmt = select(*model.__table__.columns).where(*criteria).order_by(order_by).limit(1)
+    row = current_app.extensions['sqlalchemy'].session.execute(stmt).mappings().first()
+    return dict(row) if row is not None else None
+
+
+def _attach(model, values):
+    # 用缓存的列值构造 detached 实例，合并到当前会话中
+    instance = model(**values)
+    make_transient_to_detached(instance)
+    return current_app.extensions['sqlalchemy'].session.merge(instance, load=False)
+
+
+def cached_record(model, ident):
+    """
+    按主键读取一条记录，使用大小有限的 LRU 记录缓存，返回合并到当前会话中的模型实例
+
+    提交修改了某条记录时只删除这一条缓存；读取期间模型的版本号变了（有其他提交）时不写入缓存，
+    避免把刚被修改的旧数据放回去。其他进程修改过的模型通过共享版本号发现，删除该模型的所有记录。
+    不存在的记录不缓存。
+    """
+    size = current_app.config['WATCHLIST_RECORD_CACHE_SIZE']
+    if not size:
+        values = _load_values(model, [model.__mapper__.primary_key[0] == ident])
+        return _attach(model, values) if values is not None else None
+
+    sync()
+    state = _state()
+    key = (model.__name__, ident)
+    with state.lock:
+        item = state.records.get(key)
+        if item is not None and item[0] > time.monotonic():
+            state.records.move_to_end(key)
+            state.record_hits += 1
+            values = item[1]
+        else:
+            state.record_misses += 1
+            values = None
+            version = state.versions.get(model.__name__, 0)
+    if values is not None:
+        return _attach(model, values)
+
+    values = _load_values(model, [model.__mapper__.primary_key[0] == ident])
+    if values is None:
+        return None
+    with state.lock:
+        if state.versions.get(model.__name__, 0) == version:
+            state.records[key] = (time.monotonic() + current_app.config['WATCHLIST_CACHE_TTL'], values)
+            state.records.move_to_end(key)
+            while len(state.records) > size:
+                state.records.popitem(last=False)
+    return _attach(model, values)
+
+
+def record_stats():
+    """
+    记录缓存的命中次数、未命中次数和当前条数
+    """
+    state = _state()
+    with state.lock:
+        return {'hits': state.record_hits, 'misses': state.record_misses, 'entries': len(state.records)}
+
+
+def invalidate(*names, identities=None):
+    """
+    手动使模型相关的缓存失效（用于绕过 ORM 的批量写入）
+
+    identities 为修改过的记录 [(模型名, 主键)]，给出时记录缓存中只删除这些记录，
+    否则删除这些模型的所有记录。
+    """
+    state = _state()
+    for name in names:
+        state.bump(name)
+    with state.lock:
+        if identities is None:
+            identities = [key for key in state.records if key[0] in names]
+        for key in identities:
+            state.records.pop(key, None)
+    if 'watchlist_instances' in g:
+        g.watchlist_instances.clear()
+
+
+def cached_fragment(key, factory):
+    """
+    缓存渲染好的模板片段
+
+    key 需包含片段依赖的所有数据（例如电影的标题和年份），数据改变后自然使用新的键，
+    不需要失效处理；旧的片段按最近最少使用淘汰。
+    """
+    size = current_app.config['WATCHLIST_FRAGMENT_CACHE_SIZE']
+    if not size:
+        return factory()
+    state = _state()
+    with state.lock:
+        html = state.fragments.get(key)
+        if html is not None:
+            state.fragments.move_to_end(key)
+            return html
+    html = factory()
+    with state.lock:
+        state.fragments[key] = html
+        while len(state.fragments) > size:
+            state.fragments.popitem(last=False)
+    return html
+
+
+def cached_page(*models):
+    """
+    缓存 GET 请求渲染出的页面，并用 ETag 支持条件请求
+
+    缓存键包含请求路径和登录用户，页面随 models 的版本号一起失效，
+    其他 worker 进程提交的修改通过共享版本号发现。
+    ETag 是页面内容的哈希，所以多个 worker 进程之间也一致；
+    If-None-Match 匹配时直接返回 304，不渲染也不发送页面内容。
+    有待显示的闪现消息时不使用缓存。
+    """
+
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            size = current_app.config['WATCHLIST_PAGE_CACHE_SIZE']
+            if request.method != 'GET' or not size or '_flashes' in session:
+                return f(*args, **kwargs)
+
+            state = _state()
+            user_id = current_user.get_id() if current_user.is_authenticated else None
+            key = (request.full_path, user_id)
+            versions = tuple(get_version(name) for name in models)
+            now = time.monotonic()
+            with state.lock:
+                entry = state.pages.get(key)
+                if entry is not None and entry[0] > now and entry[1] == versions:
+                    state.pages.move_to_end(key)
+                else:
+                    entry = None
+
+            if entry is None:
+                response = current_app.make_response(f(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                body = response.get_data()
+                etag = hashlib.sha1(body).hexdigest()
+                entry = (now + current_app.config['WATCHLIST_CACHE_TTL'], versions, etag, body, response.mimetype)
+                with state.lock:
+                    state.pages[key] = entry
+                    while len(state.pages) > size:
+                        state.pages.popitem(last=False)
+
+            response = Response(entry[3], mimetype=entry[4])
+            response.set_etag(entry[2])
+            # 浏览器每次都要重新验证，登录用户的页面不能被共享缓存保存
+            response.cache_control.no_cache = True
+            if user_id is not None:
+                response.cache_control.private = True
+            return response.make_conditional(request)
+
+        return wrapper
+
+    return decorator
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_changes(session, flush_context):
+    # after_flush 时 new/dirty/deleted 仍是 flush 前的状态
+    changed = session.info.setdefault('watchlist_changed', set())
+    identities = session.info.setdefault('watchlist_identities', set())
+    for obj in session.new | session.dirty | session.deleted:
+        changed.add(type(obj).__name__)
+    # 新增的记录不可能在记录缓存中
+    for obj in session.dirty | session.deleted:
+        identity = inspect(obj).identity
+        if identity is not None:
+            identities.add((type(obj).__name__,) + identity)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    changed = session.info.pop('watchlist_changed', None)
+    identities = session.info.pop('watchlist_identities', ())
+    if changed and has_app_context():
+        invalidate(*changed, identities=identities)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop('watchlist_changed', None)
+    session.info.pop('watchlist_identities', None)
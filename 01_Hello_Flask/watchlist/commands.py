@@ -1,78 +1,379 @@
+import concurrent.futures
+import contextlib
+import csv
+import functools
+import itertools
+import json
+import os
+import time
+
 import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.exc import IntegrityError
+from werkzeug.security import generate_password_hash
 
-from watchlist import app, db
-from watchlist.models import Movie, User
+from watchlist.extensions import db
+from watchlist.cache import invalidate
+from watchlist.migrate import stamp
+from watchlist.models import (MOVIE_DECADE_DDL, MOVIE_DECADE_REBUILD, MOVIE_FTS_DDL, Movie, MovieDecade, User,
+                              format_year)
 
 
 # 自定义命令
 
-@app.cli.command()  # 注册为命令,可以传入name参数来自定义命令
+@click.command()  # 定义命令，在 create_app 中按需注册
 @click.option('--drop', is_flag=True, help='Create after drop.')  # 设置选项
+@with_appcontext
 def initdb(drop):
     """
     Initialize the database.
     """
     if drop:
-        with app.app_context():
-            db.drop_all()
-    with app.app_context():
-        db.create_all()
+        db.drop_all()
+    db.create_all()
+    # 新建的数据库已经是最新的结构
+    stamp('head')
     click.echo('Initialized database.')  # 输出提示信息
 
 
-@app.cli.command()
-def forge():
+@click.command('compile-templates')
+@with_appcontext
+def compile_templates():
+    """
+    Compile all templates into the bytecode cache.
+    """
+    directory = current_app.config['WATCHLIST_TEMPLATE_CACHE_DIR']
+    if not directory:
+        raise click.ClickException('Set WATCHLIST_TEMPLATE_CACHE_DIR to enable the bytecode cache.')
+    started = time.perf_counter()
+    # 部署时执行一次，worker 启动后直接读取编译结果，不再解析模板源码
+    names = current_app.jinja_env.list_templates(extensions=['html'])
+    for name in names:
+        current_app.jinja_env.get_template(name)
+    click.echo('Compiled %d templates into %s in %.2fs.' % (len(names), directory, time.perf_counter() - started))
+
+
+@click.command('build-assets')
+@click.option('--no-webp', is_flag=True, help='Do not convert GIF animations to WebP.')
+@with_appcontext
+def build_assets(no_webp):
+    """
+    Fingerprint and compress static files into static/dist.
+    """
+    from watchlist import assets
+
+    reports = assets.build(current_app.static_folder, webp=not no_webp)
+    for report in reports:
+        variants = ', '.join('%s %d' % (k, report[k]) for k in ('gzip', 'brotli', 'webp') if k in report)
+        click.echo('%-24s %8d  %s' % (report['file'], report['size'], variants))
+    if assets.brotli is None:
+        click.echo('Brotli is not installed, skipped .br files.')
+    if assets.Image is None and not no_webp:
+        click.echo('Pillow is not installed, skipped WebP conversion.')
+    click.echo('Built %d files.' % len(reports))
+
+
+@click.command()
+@with_appcontext
+def reindex():
+    """
+    Rebuild the full-text search index and the decade counts.
+    """
+    # 旧数据库可能还没有全文索引表、年代计数表和触发器
+    MovieDecade.__table__.create(db.engine, checkfirst=True)
+    for statement in MOVIE_FTS_DDL + MOVIE_DECADE_DDL:
+        db.session.execute(text(statement))
+    db.session.execute(text("INSERT INTO movie_fts(movie_fts) VALUES ('rebuild')"))
+    for statement in MOVIE_DECADE_REBUILD:
+        db.session.execute(text(statement))
+    db.session.commit()
+    invalidate('Movie')
+    click.echo('Rebuilt search index.')
+    click.echo('Rebuilt decade counts.')
+
+
+def _fake_movies(task, user_ids):
+    """
+    生成一批假电影数据，task 为 (种子, 起始序号, 数量)，电影轮流分配给 user_ids 中的用户
+
+    定义在模块顶层，方便在进程池中执行；每批使用独立的种子，
+    所以结果与进程数无关，同样的 --seed 总是生成同样的数据。
+    """
+    from faker import Faker
+
+    seed, start, count = task
+    fake = Faker()
+    fake.seed_instance(seed * 1000003 + start)
+    return [{'title': fake.catch_phrase()[:60], 'year': fake.random_int(1920, 2024),
+             'user_id': user_ids[(start + i) % len(user_ids)]}
+            for i in range(count)]
+
+
+def _fake_users(task, password_hash, offset=0):
+    from faker import Faker
+
+    seed, start, count = task
+    fake = Faker()
+    fake.seed_instance(seed * 1000003 + start + 1)
+    # 用户名加上序号保证唯一，序号从已有的最大用户 id 开始，再次运行时不与之前生成的用户重复
+    return [{'name': fake.name()[:20], 'username': '%s%d' % (fake.user_name()[:12], offset + start + i),
+             'password_hash': password_hash}
+            for i in range(count)]
+
+
+def _tasks(seed, total, batch_size):
+    return [(seed, start, min(batch_size, total - start)) for start in range(0, total, batch_size)]
+
+
+@click.command()
+@click.option('--count', type=int, help='Number of movies to generate with Faker.')
+@click.option('--users', default=1, show_default=True, type=click.IntRange(1),
+              help='Number of users to generate with --count, movies are spread across all users.')
+@click.option('--seed', default=0, show_default=True, help='Random seed, the same seed gives the same data.')
+@click.option('--batch-size', default=10000, show_default=True, help='Rows generated and inserted per batch.')
+@click.option('--workers', default=1, show_default=True, help='Processes used to generate data.')
+@click.option('--password', default='password', show_default=True, help='Password shared by generated users.')
+@with_appcontext
+def forge(count, users, seed, batch_size, workers, password):
     """
     Generate fake data.
     """
-    with app.app_context():
-        db.create_all()
+    db.create_all()
 
+    if count is None:
+        _forge_sample()
+        click.echo('Done.')
+        return
+
+    started = time.perf_counter()
+    # 密码哈希故意设计得很慢，所有生成的用户共用同一个哈希
+    password_hash = generate_password_hash(password, method=current_app.config['PASSWORD_HASH_METHOD'])
+    executor = concurrent.futures.ProcessPoolExecutor(workers) if workers > 1 else None
+    mapper = executor.map if executor is not None else map
+    existing = db.session.execute(select(func.count(User.id), func.max(User.id))).one()
+    # 用户名仍然已存在时（例如删除过用户）跳过这个用户
+    insert_users = sqlite.insert(User.__table__).on_conflict_do_nothing(index_elements=['username'])
+    try:
+        for rows in mapper(functools.partial(_fake_users, password_hash=password_hash, offset=existing[1] or 0),
+                           _tasks(seed, users, batch_size)):
+            db.session.execute(insert_users, rows)
+        user_ids = db.session.execute(select(User.id).order_by(User.id)).scalars().all()
+        inserted = 0
+        for rows in mapper(functools.partial(_fake_movies, user_ids=user_ids), _tasks(seed, count, batch_size)):
+            db.session.execute(insert(Movie.__table__), rows)
+            inserted += len(rows)
+        db.session.commit()
+        invalidate('Movie', 'User')
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    click.echo('Created %d users.' % (len(user_ids) - existing[0]))
+    _report('Generated', inserted, started)
+    click.echo('Done.')
+
+
+def _forge_sample():
     name = 'Hyoung'
     movies = [
-        {'title': 'My Neighbor Totoro', 'year': '1988'},
-        {'title': 'Dead Poets Society', 'year': '1989'},
-        {'title': 'A Perfect World', 'year': '1993'},
-        {'title': 'Leon', 'year': '1994'},
-        {'title': 'Mahjong', 'year': '1996'},
-        {'title': 'Swallowtail Butterfly', 'year': '1996'},
-        {'title': 'King of Comedy', 'year': '1999'},
-        {'title': 'Devils on the Doorstep', 'year': '1999'},
-        {'title': 'WALL-E', 'year': '2008'},
-        {'title': 'The Pork of Music', 'year': '2012'},
+        {'title': 'My Neighbor Totoro', 'year': 1988},
+        {'title': 'Dead Poets Society', 'year': 1989},
+        {'title': 'A Perfect World', 'year': 1993},
+        {'title': 'Leon', 'year': 1994},
+        {'title': 'Mahjong', 'year': 1996},
+        {'title': 'Swallowtail Butterfly', 'year': 1996},
+        {'title': 'King of Comedy', 'year': 1999},
+        {'title': 'Devils on the Doorstep', 'year': 1999},
+        {'title': 'WALL-E', 'year': 2008},
+        {'title': 'The Pork of Music', 'year': 2012},
     ]
 
     user = User(name=name)
     db.session.add(user)
     for m in movies:
-        movie = Movie(title=m['title'], year=m['year'])
+        movie = Movie(title=m['title'], year=m['year'], user=user)
         db.session.add(movie)
 
     db.session.commit()
-    click.echo('Done.')
 
 
-# 生成管理员账户
-@app.cli.command()
+# 创建用户或修改密码
+@click.command()
 @click.option('--username', prompt=True, help='The username used to login.')
 @click.option('--password', prompt=True, hide_input=True, confirmation_prompt=True, help='The password used to login.')
-def admin(username, password):
+@click.option('--name', help='Display name of a new user, defaults to the username.')
+@click.option('--update', is_flag=True, help='Change the password of an existing user instead of creating one.')
+@with_appcontext
+def admin(username, password, name, update):
     """
-    Create user
+    Create a user, or change the password of an existing user with --update.
     """
-    with app.app_context():
-        db.create_all()
+    db.create_all()
 
-    user = User.query.first()
-    if user is not None:
-        click.echo('Updating user...')
-        user.username = username
-        user.set_password(password)  # 设置密码
-    else:
+    # 用户名有唯一索引，按用户名查找，不再假设只有一个用户
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        if update:
+            raise click.ClickException('User %s not found.' % username)
         click.echo('Creating user...')
-        user = User(username=username, name='Admin')
-        user.set_password(password)
+        user = User(username=username, name=name or username)
         db.session.add(user)
+    elif update:
+        click.echo('Updating user...')
+        if name:
+            user.name = name
+    else:
+        raise click.ClickException('Username %s is already taken.' % username)
+    user.set_password(password)  # 设置密码
 
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # 查找之后其他进程创建了同名用户
+        db.session.rollback()
+        raise click.ClickException('Username %s is already taken.' % username)
     click.echo('Done.')
+
+
+# 批量导入导出
+# 文件按行流式读写，内存占用只与批大小有关
+
+def _guess_format(path, fmt):
+    if fmt is not None:
+        return fmt
+    return 'jsonl' if os.path.splitext(path)[1].lower() in ('.jsonl', '.json', '.ndjson') else 'csv'
+
+
+def _open(path, mode='r'):
+    # '-' 表示标准输入/输出
+    if path == '-':
+        stream = click.get_text_stream('stdin' if mode == 'r' else 'stdout')
+        return contextlib.nullcontext(stream)
+    return open(path, mode, encoding='utf-8', newline='')
+
+
+def _read_rows(f, fmt):
+    if fmt == 'csv':
+        yield from csv.DictReader(f)
+    else:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def _get_user(username):
+    """
+    按用户名查找用户，未指定时为站点所有者（第一个用户）
+    """
+    if username is None:
+        user = User.query.order_by(User.id).first()
+    else:
+        user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException('User %s not found.' % username if username else
+                                   'No user found, run "flask admin" first.')
+    return user
+
+
+def _clean_rows(rows, stats, user_id):
+    for row in rows:
+        title = (row.get('title') or '').strip()
+        year = str(row.get('year') or '').strip()
+        if not Movie.validate_input(title, year):
+            stats['invalid'] += 1
+            continue
+        yield {'title': title, 'year': Movie.parse_year(year), 'user_id': user_id}
+
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _insert_movies(batches, stats, user_id):
+    """
+    逐批去重后用 executemany 插入，调用方负责提交事务
+    """
+    for batch in batches:
+        # 先在批内去重，再排除该用户已有的标题（包括本次之前批次插入的）
+        rows = {row['title']: row for row in batch}
+        existing = db.session.execute(select(Movie.title).where(Movie.title.in_(rows),
+                                                                Movie.user_id == user_id)).scalars()
+        for title in existing:
+            rows.pop(title, None)
+        stats['duplicate'] += len(batch) - len(rows)
+        if rows:
+            db.session.execute(insert(Movie.__table__), list(rows.values()))
+            stats['inserted'] += len(rows)
+
+
+def _report(action, count, started):
+    elapsed = time.perf_counter() - started
+    rate = count / elapsed if elapsed > 0 else 0
+    click.echo('%s %d movies in %.2fs (%.0f rows/s).' % (action, count, elapsed, rate))
+
+
+@click.command('import-movies')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False, allow_dash=True))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='File format, guessed from the extension.')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows per insert batch.')
+@click.option('--username', help='Owner of the imported movies, the first user by default.')
+@with_appcontext
+def import_movies(path, fmt, batch_size, username):
+    """
+    Import movies from a CSV or JSON Lines file.
+    """
+    fmt = _guess_format(path, fmt)
+    stats = {'inserted': 0, 'duplicate': 0, 'invalid': 0}
+    started = time.perf_counter()
+    db.create_all()
+    user_id = _get_user(username).id
+    with _open(path) as f:
+        rows = _clean_rows(_read_rows(f, fmt), stats, user_id)
+        try:
+            _insert_movies(_batched(rows, batch_size), stats, user_id)
+            db.session.commit()  # 整个导入在一个事务中完成
+        except Exception:
+            db.session.rollback()
+            raise
+    invalidate('Movie')  # 批量插入不经过 ORM 的 flush，需要手动清除缓存
+    click.echo('Skipped %(duplicate)d duplicate and %(invalid)d invalid rows.' % stats)
+    _report('Imported', stats['inserted'], started)
+
+
+@click.command('export-movies')
+@click.argument('path', type=click.Path(dir_okay=False, writable=True, allow_dash=True))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='File format, guessed from the extension.')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows fetched per round trip.')
+@click.option('--username', help='Whose movies to export, the first user by default.')
+@with_appcontext
+def export_movies(path, fmt, batch_size, username):
+    """
+    Export movies to a CSV or JSON Lines file.
+    """
+    fmt = _guess_format(path, fmt)
+    count = 0
+    started = time.perf_counter()
+    user_id = _get_user(username).id
+    stmt = (select(Movie.title, Movie.year).where(Movie.user_id == user_id).order_by(Movie.id)
+            .execution_options(yield_per=batch_size))
+    with _open(path, 'w') as f:
+        if fmt == 'csv':
+            writer = csv.writer(f)
+            writer.writerow(['title', 'year'])
+        for title, year in db.session.execute(stmt):
+            if fmt == 'csv':
+                writer.writerow([title, format_year(year)])
+            else:
+                f.write(json.dumps({'title': title, 'year': format_year(year)}, ensure_ascii=False) + '\n')
+            count += 1
+    # 导出到标准输出时不打印统计信息，避免混入数据
+    if path != '-':
+        _report('Exported', count, started)
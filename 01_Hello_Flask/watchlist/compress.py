@@ -0,0 +1,160 @@
+import zlib
+
+from werkzeug.http import parse_accept_header
+
+try:
+    import brotli
+except ImportError:  # 可选依赖，见 requirements-assets.txt
+    brotli = None
+
+# 压缩这些类型的响应，图片等已经压缩过的内容不再压缩
+COMPRESSIBLE_TYPES = ('text/html', 'text/css', 'text/plain', 'text/csv', 'application/json',
+                      'application/javascript', 'text/javascript', 'image/svg+xml')
+
+
+class CompressionMiddleware(object):
+    """
+    按 Accept-Encoding 用 brotli 或 gzip 压缩响应的 WSGI 中间件
+
+    有 Content-Length 的响应整体压缩，小于 min_size 的不压缩；
+    没有 Content-Length 的流式响应逐块压缩并立即 flush，客户端仍能边接收边显示。
+    已经带 Content-Encoding 的响应（例如预压缩的静态文件）原样返回。
+    可以压缩的类型不论是否真的压缩都加上 Vary: Accept-Encoding，缓存才不会把一种编码的响应发给另一种客户端；
+    客户端用压缩响应的弱 ETag 验证时，304 响应中的 ETag 同样改为弱 ETag。
+    """
+
+    def __init__(self, app, min_size=500, gzip_level=6, brotli_quality=5):
+        self.app = app
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def negotiate(self, environ):
+        accept = parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        if brotli is not None and accept.quality('br') > 0:
+            return 'br'
+        if accept.quality('gzip') > 0:
+            return 'gzip'
+        return None
+
+    def compressor(self, encoding):
+        """
+        返回 (压缩一块, 结束) 两个函数
+        """
+        if encoding == 'br':
+            c = brotli.Compressor(quality=self.brotli_quality)
+            return (lambda data: c.process(data) + c.flush()), c.finish
+        c = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 31)  # 31 表示 gzip 格式
+        return (lambda data: c.compress(data) + c.flush(zlib.Z_SYNC_FLUSH)), c.flush
+
+    def compressible(self, headers):
+        """
+        响应的类型可以压缩，是否真的压缩还要看 Accept-Encoding、状态码和大小
+        """
+        content_type = ''
+        for name, value in headers:
+            name = name.lower()
+            if name == 'content-encoding':
+                return False
+            if name == 'cache-control' and 'no-transform' in value:
+                return False
+            if name == 'content-type':
+                content_type = value.split(';')[0].strip().lower()
+        return content_type in COMPRESSIBLE_TYPES
+
+    def should_compress(self, status, headers):
+        if status[:3] in ('204', '206', '304') or status[0] in '13':
+            return False
+        length = _header(headers, 'content-length')
+        if length is not None and int(length) < self.min_size:
+            return False
+        return self.compressible(headers)
+
+    def __call__(self, environ, start_response):
+        encoding = self.negotiate(environ)
+        started = {}
+
+        def capture(status, headers, exc_info=None):
+            # 等看到响应头之后再决定是否压缩
+            started.update(status=status, headers=headers, exc_info=exc_info)
+            return lambda data: None
+
+        body = self.app(environ, capture)
+        status, headers = started['status'], started['headers']
+        if status[:3] == '304':
+            start_response(status, _not_modified(environ, headers), started['exc_info'])
+            return body
+        if encoding is None or environ['REQUEST_METHOD'] == 'HEAD' or not self.should_compress(status, headers):
+            if self.compressible(headers):
+                headers = [(name, value) for name, value in headers if name.lower() != 'vary'] + [
+                    ('Vary', _vary(headers))]
+            start_response(status, headers, started['exc_info'])
+            return body
+
+        compress, finish = self.compressor(encoding)
+        streaming = not any(name.lower() == 'content-length' for name, value in headers)
+        headers = [(name, value) for name, value in headers
+                   if name.lower() not in ('content-length', 'accept-ranges', 'vary', 'etag')] + [
+            ('Content-Encoding', encoding),
+            ('Vary', _vary(started['headers'])),
+        ]
+        etag = _header(started['headers'], 'etag')
+        if etag:
+            # 压缩后的内容与原内容不同，强 ETag 改为弱 ETag
+            headers.append(('ETag', etag if etag.startswith('W/') else 'W/' + etag))
+
+        if streaming:
+            start_response(status, headers, started['exc_info'])
+            return _stream(body, compress, finish)
+
+        try:
+            data = b''.join(body)
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+        data = compress(data) + finish()
+        headers.append(('Content-Length', str(len(data))))
+        start_response(status, headers, started['exc_info'])
+        return [data]
+
+
+def _header(headers, name):
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _not_modified(environ, headers):
+    # 客户端缓存的是压缩后的响应（If-None-Match 中是弱 ETag）时，304 响应与 200 响应一样返回弱 ETag
+    etag = _header(headers, 'etag')
+    if not etag or etag.startswith('W/') or 'W/' + etag not in environ.get('HTTP_IF_NONE_MATCH', ''):
+        return headers
+    return [(name, value) for name, value in headers if name.lower() not in ('vary', 'etag')] + [
+        ('Vary', _vary(headers)), ('ETag', 'W/' + etag)]
+
+
+def _vary(headers):
+    values = [v.strip() for v in (_header(headers, 'vary') or '').split(',') if v.strip()]
+    if 'accept-encoding' not in [v.lower() for v in values]:
+        values.append('Accept-Encoding')
+    return ', '.join(values)
+
+
+def _stream(body, compress, finish):
+    try:
+        for chunk in body:
+            if chunk:
+                yield compress(chunk)
+        yield finish()
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+
+
+def init_app(app):
+    if app.config['WATCHLIST_COMPRESS']:
+        app.wsgi_app = CompressionMiddleware(app.wsgi_app,
+                                             min_size=app.config['WATCHLIST_COMPRESS_MIN_SIZE'],
+                                             gzip_level=app.config['WATCHLIST_COMPRESS_LEVEL'],
+                                             brotli_quality=app.config['WATCHLIST_BROTLI_QUALITY'])
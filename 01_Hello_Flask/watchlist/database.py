@@ -0,0 +1,54 @@
+from sqlalchemy import event
+
+# SQLite 连接参数配置
+# default：SQLite 默认设置（回滚日志，每次提交都 fsync）
+# production：WAL 模式允许读写并发，synchronous=NORMAL 只在检查点时 fsync，
+# busy_timeout 让写冲突时等待锁而不是立即报 database is locked
+SQLITE_PROFILES = {
+    'default': {
+        'pragmas': {},
+        'engine_options': {},
+    },
+    'production': {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 5000,  # 毫秒
+            'cache_size': -64000,  # 负数表示 KB，即 64MB
+            'mmap_size': 268435456,  # 256MB
+            'temp_store': 'MEMORY',
+        },
+        'engine_options': {
+            'pool_size': 10,
+            'max_overflow': 20,
+            'pool_timeout': 10,
+            'connect_args': {'timeout': 5},
+        },
+    },
+}
+
+
+def engine_options(profile, uri):
+    """
+    返回传给 create_engine 的参数，内存数据库使用固定的单连接池，不设置连接池大小
+    """
+    if ':memory:' in uri or uri in ('sqlite://', 'sqlite:///'):
+        return {}
+    return dict(SQLITE_PROFILES[profile]['engine_options'])
+
+
+def apply_pragmas(engine, pragmas):
+    """
+    在每个新连接上执行 PRAGMA
+    """
+    if not pragmas or engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute('PRAGMA %s = %s' % (name, value))
+        finally:
+            cursor.close()
@@ -1,18 +1,18 @@
-from flask import render_template
+from flask import Blueprint, render_template
 
-from watchlist import app
+errors_bp = Blueprint('errors', __name__)
 
 
-@app.errorhandler(400)
+@errors_bp.app_errorhandler(400)
 def bad_request(e):
     return render_template('errors/400.html'), 400
 
 
-@app.errorhandler(404)
+@errors_bp.app_errorhandler(404)
 def page_not_found(e):
     return render_template('errors/404.html'), 404
 
 
-@app.errorhandler(500)
+@errors_bp.app_errorhandler(500)
 def internal_server_error(e):
     return render_template('errors/500.html'), 500
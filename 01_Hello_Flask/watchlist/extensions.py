@@ -0,0 +1,17 @@
+from flask_login import LoginManager
+from flask_sqlalchemy import SQLAlchemy
+
+from watchlist.replica import RoutingSession
+
+# 实例化扩展类，在 create_app 中通过 init_app 绑定到程序实例
+db = SQLAlchemy(session_options={'class_': RoutingSession})  # 支持把只读视图的查询发到只读副本
+login_manager = LoginManager()
+login_manager.login_view = 'main.login'
+login_manager.login_message = 'Please login to access this page.'
+
+
+@login_manager.user_loader
+def load_user(user_id):
+    from watchlist.models import User
+    user = User.cached_get(int(user_id))
+    return user
@@ -0,0 +1,67 @@
+from watchlist.models import Movie
+
+# 电影列表的排序和按年份筛选，主页和 API 共用
+# 排序方式 -> (先按哪一列排序, 是否倒序)，列值相同时按 id 排序；None 表示只按 id（添加顺序）
+SORTS = {
+    'added': (None, False),
+    'recent': (None, True),
+    'title': ('title', False),
+    'year': ('year', False),
+    'year_desc': ('year', True),
+}
+DEFAULT_SORT = 'added'
+SORT_LABELS = [('added', 'Added'), ('recent', 'Recent'), ('title', 'Title'), ('year', 'Oldest'),
+               ('year_desc', 'Newest')]
+
+
+def list_options(args):
+    """
+    从查询参数中读取排序方式和年份范围，不认识的排序方式按默认处理
+
+    decade=1990 相当于 year_from=1990&year_to=1999。
+    """
+    sort = args.get('sort')
+    decade = args.get('decade', type=int)
+    year_from = args.get('year_from', type=int)
+    year_to = args.get('year_to', type=int)
+    if decade is not None:
+        decade = decade // 10 * 10
+        year_from, year_to = decade, decade + 9
+    return {
+        'sort': sort if sort in SORTS else DEFAULT_SORT,
+        'decade': decade,
+        'year_from': year_from,
+        'year_to': year_to,
+    }
+
+
+def list_params(options):
+    """
+    需要保留在分页链接中的查询参数（省略默认值）
+    """
+    params = {}
+    if options['sort'] != DEFAULT_SORT:
+        params['sort'] = options['sort']
+    if options['decade'] is not None:
+        params['decade'] = options['decade']
+    else:
+        for name in ('year_from', 'year_to'):
+            if options[name] is not None:
+                params[name] = options[name]
+    return params
+
+
+def filter_years(query, options):
+    if options['year_from'] is not None:
+        query = query.filter(Movie.year >= options['year_from'])
+    if options['year_to'] is not None:
+        query = query.filter(Movie.year <= options['year_to'])
+    return query
+
+
+def sort_args(options):
+    """
+    传给 keyset_paginate / keyset_query 的 order 和 descending 参数
+    """
+    name, descending = SORTS[options['sort']]
+    return {'order': getattr(Movie, name) if name else None, 'descending': descending}
@@ -0,0 +1,197 @@
+import cProfile
+import os
+import threading
+import time
+
+from flask import (Blueprint, Response, before_render_template, current_app, g, has_request_context, request,
+                   template_rendered)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from watchlist.cache import record_stats
+
+# 请求耗时直方图的桶（秒）
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Metrics(object):
+    """
+    进程内的请求指标汇总，/metrics 以 Prometheus 文本格式输出
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}  # (endpoint, method, status) -> 次数
+        self.durations = {}  # endpoint -> [各桶计数..., 总耗时, 总次数]
+        self.sql = {}  # endpoint -> [语句数, 总耗时]
+        self.templates = {}  # endpoint -> 模板渲染总耗时
+
+    def observe(self, endpoint, method, status, timing):
+        with self.lock:
+            key = (endpoint, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+            histogram = self.durations.setdefault(endpoint, [0] * len(BUCKETS) + [0.0, 0])
+            for i, bound in enumerate(BUCKETS):
+                if timing.total <= bound:
+                    histogram[i] += 1
+            histogram[-2] += timing.total
+            histogram[-1] += 1
+
+            sql = self.sql.setdefault(endpoint, [0, 0.0])
+            sql[0] += timing.sql_count
+            sql[1] += timing.sql_time
+            self.templates[endpoint] = self.templates.get(endpoint, 0.0) + timing.template_time
+
+    def render(self, records=None):
+        lines = []
+        if records is not None:
+            lines.append('# HELP watchlist_record_cache_hits_total Record cache lookups served from memory.')
+            lines.append('# TYPE watchlist_record_cache_hits_total counter')
+            lines.append('watchlist_record_cache_hits_total %d' % records['hits'])
+            lines.append('# HELP watchlist_record_cache_misses_total Record cache lookups that queried the database.')
+            lines.append('# TYPE watchlist_record_cache_misses_total counter')
+            lines.append('watchlist_record_cache_misses_total %d' % records['misses'])
+            lines.append('# HELP watchlist_record_cache_entries Records currently cached.')
+            lines.append('# TYPE watchlist_record_cache_entries gauge')
+            lines.append('watchlist_record_cache_entries %d' % records['entries'])
+        with self.lock:
+            lines.append('# HELP watchlist_requests_total Requests handled.')
+            lines.append('# TYPE watchlist_requests_total counter')
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append('watchlist_requests_total{endpoint="%s",method="%s",status="%s"} %d'
+                             % (endpoint, method, status, count))
+
+            lines.append('# HELP watchlist_request_duration_seconds Request wall time.')
+            lines.append('# TYPE watchlist_request_duration_seconds histogram')
+            for endpoint, histogram in sorted(self.durations.items()):
+                for bound, count in zip(BUCKETS, histogram):
+                    lines.append('watchlist_request_duration_seconds_bucket{endpoint="%s",le="%s"} %d'
+                                 % (endpoint, bound, count))
+                lines.append('watchlist_request_duration_seconds_bucket{endpoint="%s",le="+Inf"} %d'
+                             % (endpoint, histogram[-1]))
+                lines.append('watchlist_request_duration_seconds_sum{endpoint="%s"} %.6f' % (endpoint, histogram[-2]))
+                lines.append('watchlist_request_duration_seconds_count{endpoint="%s"} %d' % (endpoint, histogram[-1]))
+
+            lines.append('# HELP watchlist_sql_queries_total SQL statements executed.')
+            lines.append('# TYPE watchlist_sql_queries_total counter')
+            for endpoint, (count, _) in sorted(self.sql.items()):
+                lines.append('watchlist_sql_queries_total{endpoint="%s"} %d' % (endpoint, count))
+            lines.append('# HELP watchlist_sql_duration_seconds_total Time spent executing SQL.')
+            lines.append('# TYPE watchlist_sql_duration_seconds_total counter')
+            for endpoint, (_, seconds) in sorted(self.sql.items()):
+                lines.append('watchlist_sql_duration_seconds_total{endpoint="%s"} %.6f' % (endpoint, seconds))
+
+            lines.append('# HELP watchlist_template_duration_seconds_total Time spent rendering templates.')
+            lines.append('# TYPE watchlist_template_duration_seconds_total counter')
+            for endpoint, seconds in sorted(self.templates.items()):
+                lines.append('watchlist_template_duration_seconds_total{endpoint="%s"} %.6f' % (endpoint, seconds))
+        return '\n'.join(lines) + '\n'
+
+
+class RequestTiming(object):
+    """
+    单个请求的计时数据，保存在 g 中
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.total = 0.0
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.template_started = []
+        self.profiler = None
+
+    def server_timing(self):
+        return 'app;dur=%.2f, db;dur=%.2f;desc="%d queries", tpl;dur=%.2f' % (
+            self.total * 1000, self.sql_time * 1000, self.sql_count, self.template_time * 1000)
+
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+@metrics_bp.record_once
+def _init_app(state):
+    app = state.app
+    app.extensions['watchlist_metrics'] = Metrics()
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+
+
+def _timing():
+    if has_request_context():
+        return g.get('watchlist_timing')
+    return None
+
+
+@metrics_bp.before_app_request
+def start_timing():
+    timing = g.watchlist_timing = RequestTiming()
+    if current_app.config['WATCHLIST_PROFILE_THRESHOLD']:
+        timing.profiler = cProfile.Profile()
+        timing.profiler.enable()
+
+
+@metrics_bp.after_app_request
+def finish_timing(response):
+    timing = g.pop('watchlist_timing', None)
+    if timing is None:
+        return response
+    timing.total = time.perf_counter() - timing.started
+    if timing.profiler is not None:
+        timing.profiler.disable()
+        if timing.total >= current_app.config['WATCHLIST_PROFILE_THRESHOLD']:
+            _dump_profile(timing)
+
+    endpoint = request.endpoint or 'none'
+    current_app.extensions['watchlist_metrics'].observe(endpoint, request.method, response.status_code, timing)
+    response.headers['Server-Timing'] = timing.server_timing()
+    return response
+
+
+def _dump_profile(timing):
+    # 只保存超过阈值的慢请求，文件可用 snakeviz 或 pstats 查看
+    directory = current_app.config['WATCHLIST_PROFILE_DIR']
+    os.makedirs(directory, exist_ok=True)
+    filename = '%s-%s-%dms.prof' % (time.strftime('%Y%m%d-%H%M%S'), request.endpoint or 'none',
+                                     timing.total * 1000)
+    timing.profiler.dump_stats(os.path.join(directory, filename))
+    current_app.logger.warning('Slow request %s %s took %.0fms, profile saved to %s',
+                               request.method, request.path, timing.total * 1000, filename)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _timing() is not None:
+        conn.info.setdefault('watchlist_query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timing = _timing()
+    started = conn.info.get('watchlist_query_started')
+    if timing is not None and started:
+        timing.sql_count += 1
+        timing.sql_time += time.perf_counter() - started.pop()
+
+
+def _before_render(sender, template, context, **extra):
+    timing = _timing()
+    if timing is not None:
+        timing.template_started.append(time.perf_counter())
+
+
+def _after_render(sender, template, context, **extra):
+    timing = _timing()
+    if timing is not None and timing.template_started:
+        timing.template_time += time.perf_counter() - timing.template_started.pop()
+
+
+@metrics_bp.route('/metrics')
+def metrics():
+    """
+    Prometheus 指标
+    """
+    return Response(current_app.extensions['watchlist_metrics'].render(record_stats()),
+                    mimetype='text/plain; version=0.0.4')
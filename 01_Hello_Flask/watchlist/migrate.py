@@ -0,0 +1,448 @@
+import contextlib
+import importlib
+import os
+import pkgutil
+import re
+import time
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import text
+
+from watchlist.extensions import db
+
+# 数据库迁移
+# 每个迁移是 watchlist/migrations 下的一个模块，定义 revision、down_revision、upgrade(op) 和 downgrade(op)，
+# 按 down_revision 串成一条链。数据库当前的版本号保存在 watchlist_version 表中。
+# SQLite 能原地完成的修改（加列、建索引）直接执行；不能原地完成的（改列类型、删外键列）
+# 用 Operations.rebuild_table 分批复制到新表后替换，复制期间旧表仍可读写。
+
+VERSION_TABLE = 'watchlist_version'
+MIGRATIONS_PACKAGE = 'watchlist.migrations'
+
+
+class MigrationError(Exception):
+    pass
+
+
+class Migration(object):
+    def __init__(self, module):
+        self.module = module
+        self.revision = module.revision
+        self.down_revision = module.down_revision
+        self.message = (module.__doc__ or '').strip().splitlines()[0] if module.__doc__ else ''
+
+    def __repr__(self):
+        return '<Migration %s>' % self.revision
+
+
+def load_migrations():
+    """
+    按顺序返回所有迁移（从最早到最新）
+    """
+    package = importlib.import_module(MIGRATIONS_PACKAGE)
+    by_down = {}
+    for info in pkgutil.iter_modules(package.__path__):
+        if not re.match(r'\d{4}_', info.name):
+            continue
+        migration = Migration(importlib.import_module('%s.%s' % (MIGRATIONS_PACKAGE, info.name)))
+        if migration.down_revision in by_down:
+            raise MigrationError('Multiple migrations follow %s.' % migration.down_revision)
+        by_down[migration.down_revision] = migration
+
+    chain = []
+    current = None
+    while current in by_down:
+        chain.append(by_down.pop(current))
+        current = chain[-1].revision
+    if by_down:
+        raise MigrationError('Migrations not connected to the chain: %s'
+                             % ', '.join(m.revision for m in by_down.values()))
+    return chain
+
+
+def head():
+    migrations = load_migrations()
+    return migrations[-1].revision if migrations else None
+
+
+class Progress(object):
+    """
+    默认的进度报告，什么也不显示
+    """
+
+    def __init__(self, label, total):
+        self.label = label
+        self.total = total
+
+    def update(self, count):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class Operations(object):
+    """
+    迁移中可用的操作，传给 upgrade(op) 和 downgrade(op)
+
+    batch_size 控制回填和复制时每个事务处理的行数，事务之间会释放写锁，
+    其他请求可以插入写操作，所以大表的迁移不需要停机。
+    """
+
+    def __init__(self, connection, batch_size=5000, progress=Progress):
+        self.connection = connection
+        self.batch_size = batch_size
+        self.progress = progress
+
+    def execute(self, sql, **params):
+        return self.connection.execute(text(sql), params)
+
+    def scalar(self, sql, **params):
+        return self.connection.execute(text(sql), params).scalar()
+
+    def commit(self):
+        self.connection.commit()
+
+    def has_table(self, name):
+        return bool(self.scalar("SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name = :name",
+                                name=name))
+
+    def has_index(self, name):
+        return bool(self.scalar("SELECT count(*) FROM sqlite_master WHERE type = 'index' AND name = :name",
+                                name=name))
+
+    def columns(self, table):
+        return [row[1] for row in self.execute('PRAGMA table_info(%s)' % table)]
+
+    def add_column(self, table, column_sql):
+        """
+        原地添加一列，column_sql 为列定义，例如 'user_id INTEGER REFERENCES user (id)'
+
+        SQLite 只修改表定义，不重写已有的行，与表的大小无关。
+        """
+        name = column_sql.split()[0]
+        if name not in self.columns(table):
+            self.execute('ALTER TABLE %s ADD COLUMN %s' % (table, column_sql))
+
+    def create_index(self, name, table, columns, unique=False):
+        """
+        创建索引，已存在时跳过
+
+        建索引时 SQLite 持有写锁，只会阻塞写操作；WAL 模式下读操作不受影响。
+        """
+        self.execute('CREATE %sINDEX IF NOT EXISTS %s ON %s (%s)'
+                     % ('UNIQUE ' if unique else '', name, table, ', '.join(columns)))
+
+    def drop_index(self, name):
+        self.execute('DROP INDEX IF EXISTS %s' % name)
+
+    def backfill(self, table, assignments, where, **params):
+        """
+        分批执行 UPDATE table SET assignments WHERE where，每批单独提交
+
+        更新后的行必须不再满足 where，否则会重复处理同一批行。
+        """
+        total = self.scalar('SELECT count(*) FROM %s WHERE %s' % (table, where), **params)
+        sql = ('UPDATE %s SET %s WHERE rowid IN (SELECT rowid FROM %s WHERE %s LIMIT :_batch)'
+               % (table, assignments, table, where))
+        with self.progress('Backfilling %s' % table, total) as progress:
+            while True:
+                count = self.execute(sql, _batch=self.batch_size, **params).rowcount
+                self.commit()
+                if not count:
+                    break
+                progress.update(count)
+
+    def rebuild_table(self, table, create_sql, copy, after=()):
+        """
+        用新的表定义重建表，用于 SQLite 不能原地完成的修改
+
+        create_sql：新表的 CREATE TABLE 语句，表名写作 {table}
+        copy：新表列名 -> 从旧表取值的 SQL 表达式，需要包含整数主键 id
+        after：替换完成后执行的语句，例如重建索引和触发器（旧表删除时一并删除）
+
+        先建临时表，用触发器把旧表上的写操作同步过去，再按主键分批复制，每批单独提交；
+        最后在一个短事务中删除旧表、把临时表改名。中途失败时删除同步触发器和临时表，
+        旧表不受影响，可以重新执行（开始前也会清理上一次失败留下的触发器和临时表）。
+        """
+        temp = '_rebuild_%s' % table
+        self._drop_rebuild(temp)
+        self.commit()
+        try:
+            self._rebuild(table, temp, create_sql, copy, after)
+        except Exception:
+            self.connection.rollback()
+            self._drop_rebuild(temp)
+            self.commit()
+            raise
+
+    def _drop_rebuild(self, temp):
+        for suffix in ('ai', 'au', 'ad'):
+            self.execute('DROP TRIGGER IF EXISTS %s_%s' % (temp, suffix))
+        self.execute('DROP TABLE IF EXISTS %s' % temp)
+
+    def _rebuild(self, table, temp, create_sql, copy, after):
+        names = ', '.join(copy)
+        exprs = ', '.join(copy.values())
+        self.execute(create_sql.format(table=temp))
+        # 复制期间旧表上的插入、修改和删除同步到新表
+        mirror = 'INSERT OR REPLACE INTO %s (%s) SELECT %s FROM %s WHERE id = NEW.id' % (temp, names, exprs, table)
+        self.execute('CREATE TRIGGER %s_ai AFTER INSERT ON %s BEGIN %s; END' % (temp, table, mirror))
+        self.execute('CREATE TRIGGER %s_au AFTER UPDATE ON %s BEGIN DELETE FROM %s WHERE id = OLD.id; %s; END'
+                     % (temp, table, temp, mirror))
+        self.execute('CREATE TRIGGER %s_ad AFTER DELETE ON %s BEGIN DELETE FROM %s WHERE id = OLD.id; END'
+                     % (temp, table, temp))
+        self.commit()
+
+        total = self.scalar('SELECT count(*) FROM %s' % table)
+        last = self.scalar('SELECT min(id) - 1 FROM %s' % table)
+        with self.progress('Copying %s' % table, total) as progress:
+            while last is not None:
+                # 本批的最后一个主键，不足一批时取最大主键
+                bound = self.scalar('SELECT id FROM %s WHERE id > :last ORDER BY id LIMIT 1 OFFSET :offset'
+                                    % table, last=last, offset=self.batch_size - 1)
+                if bound is None:
+                    bound = self.scalar('SELECT max(id) FROM %s' % table)
+                    if bound is None or bound <= last:
+                        break
+                # 已被触发器同步的行是更新的数据，跳过
+                count = self.execute('INSERT OR IGNORE INTO %s (%s) SELECT %s FROM %s '
+                                     'WHERE id > :last AND id <= :bound ORDER BY id'
+                                     % (temp, names, exprs, table), last=last, bound=bound).rowcount
+                self.commit()
+                progress.update(count)
+                last = bound
+
+        for suffix in ('ai', 'au', 'ad'):
+            self.execute('DROP TRIGGER %s_%s' % (temp, suffix))
+        self.execute('DROP TABLE %s' % table)
+        self.execute('ALTER TABLE %s RENAME TO %s' % (temp, table))
+        for statement in after:
+            self.execute(statement)
+
+
+def _ensure_version_table(connection):
+    connection.execute(text('CREATE TABLE IF NOT EXISTS %s (version_num VARCHAR(32) NOT NULL PRIMARY KEY)'
+                            % VERSION_TABLE))
+
+
+def current_revision(connection=None):
+    """
+    数据库当前的版本号，还没有迁移过时返回 None
+    """
+    with _connect(connection) as connection:
+        exists = connection.execute(text("SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                                    {'name': VERSION_TABLE}).scalar()
+        if not exists:
+            return None
+        return connection.execute(text('SELECT version_num FROM %s' % VERSION_TABLE)).scalar()
+
+
+def _set_revision(connection, revision):
+    _ensure_version_table(connection)
+    connection.execute(text('DELETE FROM %s' % VERSION_TABLE))
+    if revision is not None:
+        connection.execute(text('INSERT INTO %s (version_num) VALUES (:v)' % VERSION_TABLE), {'v': revision})
+
+
+@contextlib.contextmanager
+def _connect(connection=None):
+    if connection is not None:
+        yield connection
+    else:
+        with db.engine.connect() as connection:
+            yield connection
+
+
+def _index(migrations, revision):
+    if revision is None:
+        return -1
+    for i, migration in enumerate(migrations):
+        if migration.revision == revision:
+            return i
+    raise MigrationError('Unknown revision %s.' % revision)
+
+
+def upgrade(target='head', batch_size=5000, progress=Progress, echo=None):
+    """
+    从当前版本升级到 target，返回执行过的迁移
+    """
+    migrations = load_migrations()
+    with db.engine.connect() as connection:
+        start = _index(migrations, current_revision(connection))
+        end = len(migrations) - 1 if target == 'head' else _index(migrations, target)
+        op = Operations(connection, batch_size, progress)
+        done = []
+        for migration in migrations[start + 1:end + 1]:
+            if echo is not None:
+                echo('Upgrading to %s: %s' % (migration.revision, migration.message))
+            migration.module.upgrade(op)
+            _set_revision(connection, migration.revision)
+            connection.commit()
+            done.append(migration)
+    return done
+
+
+def downgrade(target, batch_size=5000, progress=Progress, echo=None):
+    """
+    从当前版本降级到 target（None 表示撤销所有迁移），返回执行过的迁移
+    """
+    migrations = load_migrations()
+    with db.engine.connect() as connection:
+        start = _index(migrations, current_revision(connection))
+        end = _index(migrations, target)
+        op = Operations(connection, batch_size, progress)
+        done = []
+        for i in range(start, end, -1):
+            migration = migrations[i]
+            if echo is not None:
+                echo('Downgrading %s: %s' % (migration.revision, migration.message))
+            migration.module.downgrade(op)
+            _set_revision(connection, migration.down_revision)
+            connection.commit()
+            done.append(migration)
+    return done
+
+
+def stamp(revision):
+    """
+    只记录版本号，不执行迁移（用于 create_all 创建的新数据库）
+    """
+    migrations = load_migrations()
+    if revision == 'head':
+        revision = migrations[-1].revision if migrations else None
+    _index(migrations, revision)
+    with db.engine.connect() as connection:
+        _set_revision(connection, revision)
+        connection.commit()
+
+
+class ClickProgress(Progress):
+    """
+    在终端显示进度条
+    """
+
+    def __init__(self, label, total):
+        super(ClickProgress, self).__init__(label, total)
+        self.bar = click.progressbar(length=total, label=label, show_pos=True, file=click.get_text_stream('stderr'))
+        self.started = time.perf_counter()
+
+    def update(self, count):
+        self.bar.update(count)
+
+    def __enter__(self):
+        self.bar.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.bar.__exit__(*exc_info)
+        elapsed = time.perf_counter() - self.started
+        click.echo('%s: %d rows in %.2fs.' % (self.label, self.total, elapsed), err=True)
+        return False
+
+
+TEMPLATE = '''"""
+{message}
+"""
+
+revision = '{revision}'
+down_revision = {down_revision!r}
+
+
+def upgrade(op):
+    pass
+
+
+def downgrade(op):
+    pass
+'''
+
+
+@click.group('db')
+def db_cli():
+    """
+    Database schema migrations.
+    """
+
+
+@db_cli.command('upgrade')
+@click.argument('revision', default='head')
+@click.option('--batch-size', default=5000, show_default=True, help='Rows per transaction when copying data.')
+@with_appcontext
+def upgrade_command(revision, batch_size):
+    """
+    Upgrade the database to a revision, the latest by default.
+    """
+    done = upgrade(revision, batch_size, ClickProgress, click.echo)
+    click.echo('Database is at %s.' % current_revision() if done else 'Database is up to date.')
+
+
+@db_cli.command('downgrade')
+@click.argument('revision', required=False)
+@click.option('--batch-size', default=5000, show_default=True, help='Rows per transaction when copying data.')
+@with_appcontext
+def downgrade_command(revision, batch_size):
+    """
+    Downgrade the database to a revision, the previous one by default.
+    """
+    if revision is None:
+        migrations = load_migrations()
+        current = current_revision()
+        if current is None:
+            raise click.ClickException('Nothing to downgrade.')
+        revision = migrations[_index(migrations, current)].down_revision
+    elif revision == 'base':
+        revision = None
+    downgrade(revision, batch_size, ClickProgress, click.echo)
+    click.echo('Database is at %s.' % (current_revision() or 'base'))
+
+
+@db_cli.command('current')
+@with_appcontext
+def current_command():
+    """
+    Show the current revision.
+    """
+    revision = current_revision()
+    click.echo('%s%s' % (revision or 'base', ' (head)' if revision is not None and revision == head() else ''))
+
+
+@db_cli.command('history')
+def history_command():
+    """
+    List all revisions.
+    """
+    for migration in reversed(load_migrations()):
+        click.echo('%s -> %s  %s' % (migration.down_revision or 'base', migration.revision, migration.message))
+
+
+@db_cli.command('stamp')
+@click.argument('revision')
+@with_appcontext
+def stamp_command(revision):
+    """
+    Set the revision without running migrations.
+    """
+    stamp(None if revision == 'base' else revision)
+    click.echo('Database is at %s.' % (current_revision() or 'base'))
+
+
+@db_cli.command('revision')
+@click.argument('message')
+def revision_command(message):
+    """
+    Create an empty migration module.
+    """
+    migrations = load_migrations()
+    number = '%04d' % (int(migrations[-1].revision) + 1 if migrations else 1)
+    slug = re.sub(r'\W+', '_', message.lower()).strip('_')[:40]
+    package = importlib.import_module(MIGRATIONS_PACKAGE)
+    path = os.path.join(package.__path__[0], '%s_%s.py' % (number, slug))
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(TEMPLATE.format(message=message, revision=number,
+                                down_revision=migrations[-1].revision if migrations else None))
+    click.echo('Created %s' % path)
@@ -0,0 +1,20 @@
+"""
+Initial user and movie tables
+"""
+
+revision = '0001'
+down_revision = None
+
+
+def upgrade(op):
+    # 迁移系统之前用 create_all 创建的数据库已经有这两张表
+    op.execute('CREATE TABLE IF NOT EXISTS user ('
+               'id INTEGER NOT NULL, name VARCHAR(20), username VARCHAR(20), password_hash VARCHAR(128), '
+               'PRIMARY KEY (id))')
+    op.execute('CREATE TABLE IF NOT EXISTS movie ('
+               'id INTEGER NOT NULL, title VARCHAR(60), year VARCHAR(4), PRIMARY KEY (id))')
+
+
+def downgrade(op):
+    op.execute('DROP TABLE IF EXISTS movie')
+    op.execute('DROP TABLE IF EXISTS user')
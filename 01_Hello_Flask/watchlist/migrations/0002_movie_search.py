@@ -0,0 +1,35 @@
+"""
+Index movie titles and add the full-text search table
+"""
+
+revision = '0002'
+down_revision = '0001'
+
+FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS movie_fts USING fts5("
+    "title, year, content='movie', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS movie_fts_ai AFTER INSERT ON movie BEGIN "
+    "INSERT INTO movie_fts(rowid, title, year) VALUES (new.id, new.title, new.year); END",
+    "CREATE TRIGGER IF NOT EXISTS movie_fts_ad AFTER DELETE ON movie BEGIN "
+    "INSERT INTO movie_fts(movie_fts, rowid, title, year) VALUES ('delete', old.id, old.title, old.year); END",
+    "CREATE TRIGGER IF NOT EXISTS movie_fts_au AFTER UPDATE ON movie BEGIN "
+    "INSERT INTO movie_fts(movie_fts, rowid, title, year) VALUES ('delete', old.id, old.title, old.year); "
+    "INSERT INTO movie_fts(rowid, title, year) VALUES (new.id, new.title, new.year); END",
+]
+
+
+def upgrade(op):
+    op.create_index('ix_movie_title', 'movie', ['title'])
+    created = not op.has_table('movie_fts')
+    for statement in FTS_DDL:
+        op.execute(statement)
+    if created:
+        # 已有的电影需要重建一次索引
+        op.execute("INSERT INTO movie_fts(movie_fts) VALUES ('rebuild')")
+
+
+def downgrade(op):
+    for name in ('movie_fts_ai', 'movie_fts_ad', 'movie_fts_au'):
+        op.execute('DROP TRIGGER IF EXISTS %s' % name)
+    op.execute('DROP TABLE IF EXISTS movie_fts')
+    op.drop_index('ix_movie_title')
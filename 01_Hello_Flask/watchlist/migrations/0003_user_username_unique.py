@@ -0,0 +1,20 @@
+"""
+Unique index on user.username
+"""
+
+from watchlist.migrate import MigrationError
+
+revision = '0003'
+down_revision = '0002'
+
+
+def upgrade(op):
+    duplicates = [row[0] for row in op.execute(
+        'SELECT username FROM user WHERE username IS NOT NULL GROUP BY username HAVING count(*) > 1')]
+    if duplicates:
+        raise MigrationError('Duplicate usernames, rename them first: %s' % ', '.join(duplicates))
+    op.create_index('ix_user_username', 'user', ['username'], unique=True)
+
+
+def downgrade(op):
+    op.drop_index('ix_user_username')
@@ -0,0 +1,40 @@
+"""
+Add movie.user_id and the (user_id, id) index
+"""
+
+import importlib
+
+search = importlib.import_module('watchlist.migrations.0002_movie_search')
+
+revision = '0004'
+down_revision = '0003'
+
+# 全文索引的 UPDATE 触发器只在标题或年份变化时执行，回填 user_id 时不必重建每一行的索引
+FTS_UPDATE_TRIGGER = (
+    "CREATE TRIGGER movie_fts_au AFTER UPDATE OF title, year ON movie BEGIN "
+    "INSERT INTO movie_fts(movie_fts, rowid, title, year) VALUES ('delete', old.id, old.title, old.year); "
+    "INSERT INTO movie_fts(rowid, title, year) VALUES (new.id, new.title, new.year); END"
+)
+
+
+def upgrade(op):
+    op.execute('DROP TRIGGER IF EXISTS movie_fts_au')
+    op.execute(FTS_UPDATE_TRIGGER)
+    op.add_column('movie', 'user_id INTEGER REFERENCES user (id)')
+    op.commit()
+    # 已有的电影都属于站点所有者（第一个用户）
+    owner = op.scalar('SELECT min(id) FROM user')
+    if owner is not None:
+        op.backfill('movie', 'user_id = :owner', 'user_id IS NULL', owner=owner)
+    op.create_index('ix_movie_user_id_id', 'movie', ['user_id', 'id'])
+
+
+def downgrade(op):
+    # 外键列不能用 DROP COLUMN 删除，需要重建表
+    op.rebuild_table(
+        'movie',
+        'CREATE TABLE {table} (id INTEGER NOT NULL, title VARCHAR(60), year VARCHAR(4), PRIMARY KEY (id))',
+        {'id': 'id', 'title': 'title', 'year': 'year'},
+        # 旧表的触发器随表一起删除，这里恢复为 0003 时的定义
+        after=['CREATE INDEX ix_movie_title ON movie (title)'] + search.FTS_DDL[1:],
+    )
@@ -0,0 +1,72 @@
+"""
+Store movie.year as an integer, add sort indexes and decade counts
+"""
+
+import importlib
+
+from watchlist.migrate import MigrationError
+
+owners = importlib.import_module('watchlist.migrations.0004_movie_user_id')
+search = importlib.import_module('watchlist.migrations.0002_movie_search')
+
+revision = '0005'
+down_revision = '0004'
+
+MOVIE_TABLE = ('CREATE TABLE {table} (id INTEGER NOT NULL, title VARCHAR(60), year INTEGER, user_id INTEGER, '
+               'PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES user (id))')
+OLD_MOVIE_TABLE = ('CREATE TABLE {table} (id INTEGER NOT NULL, title VARCHAR(60), year VARCHAR(4), '
+                   'user_id INTEGER REFERENCES user (id), PRIMARY KEY (id))')
+
+# 0004 时的索引和全文索引触发器，旧表删除时一并删除，重建后需要恢复
+MOVIE_INDEXES = [
+    'CREATE INDEX ix_movie_title ON movie (title)',
+    'CREATE INDEX ix_movie_user_id_id ON movie (user_id, id)',
+]
+FTS_TRIGGERS = search.FTS_DDL[1:3] + [owners.FTS_UPDATE_TRIGGER]
+
+DECADE_REMOVE = (
+    "UPDATE movie_decade SET count = count - 1 WHERE user_id = old.user_id AND decade = old.year / 10 * 10; "
+    "DELETE FROM movie_decade WHERE user_id = old.user_id AND decade = old.year / 10 * 10 AND count <= 0; "
+)
+DECADE_ADD = (
+    "INSERT INTO movie_decade (user_id, decade, count) "
+    "SELECT new.user_id, new.year / 10 * 10, 1 WHERE new.user_id IS NOT NULL AND new.year IS NOT NULL "
+    "ON CONFLICT (user_id, decade) DO UPDATE SET count = count + 1; "
+)
+DECADE_DDL = [
+    'CREATE TABLE IF NOT EXISTS movie_decade (user_id INTEGER NOT NULL, decade INTEGER NOT NULL, '
+    'count INTEGER NOT NULL, PRIMARY KEY (user_id, decade), FOREIGN KEY(user_id) REFERENCES user (id))',
+    "CREATE TRIGGER movie_decade_ai AFTER INSERT ON movie BEGIN " + DECADE_ADD + "END",
+    "CREATE TRIGGER movie_decade_ad AFTER DELETE ON movie BEGIN " + DECADE_REMOVE + "END",
+    "CREATE TRIGGER movie_decade_au AFTER UPDATE OF year, user_id ON movie "
+    "WHEN old.year / 10 IS NOT new.year / 10 OR old.user_id IS NOT new.user_id BEGIN "
+    + DECADE_REMOVE + DECADE_ADD + "END",
+    # 和新表一起在同一个事务中统计一次已有的电影
+    'DELETE FROM movie_decade',
+    'INSERT INTO movie_decade (user_id, decade, count) SELECT user_id, year / 10 * 10, count(*) FROM movie '
+    'WHERE user_id IS NOT NULL AND year IS NOT NULL GROUP BY user_id, year / 10 * 10',
+]
+
+
+def upgrade(op):
+    invalid = [row[0] for row in op.execute(
+        "SELECT DISTINCT year FROM movie WHERE year IS NOT NULL AND year NOT GLOB '[0-9][0-9][0-9][0-9]' LIMIT 20")]
+    if invalid:
+        raise MigrationError('Movies with invalid years, fix them first: %s' % ', '.join(map(str, invalid)))
+    # SQLite 不能修改列的类型，需要重建表
+    op.rebuild_table(
+        'movie', MOVIE_TABLE,
+        {'id': 'id', 'title': 'title', 'year': 'CAST(year AS INTEGER)', 'user_id': 'user_id'},
+        after=MOVIE_INDEXES + [
+            'CREATE INDEX ix_movie_user_id_title_id ON movie (user_id, title, id)',
+            'CREATE INDEX ix_movie_user_id_year_id ON movie (user_id, year, id)',
+        ] + FTS_TRIGGERS + DECADE_DDL,
+    )
+
+
+def downgrade(op):
+    op.rebuild_table(
+        'movie', OLD_MOVIE_TABLE,
+        {'id': 'id', 'title': 'title', 'year': "substr('000' || year, -4)", 'user_id': 'user_id'},
+        after=MOVIE_INDEXES + FTS_TRIGGERS + ['DROP TABLE IF EXISTS movie_decade'],
+    )
@@ -0,0 +1,16 @@
+"""
+Add the server-side session table
+"""
+
+revision = '0006'
+down_revision = '0005'
+
+
+def upgrade(op):
+    op.execute('CREATE TABLE IF NOT EXISTS server_session (id VARCHAR(64) NOT NULL, data TEXT NOT NULL, '
+               'expires FLOAT NOT NULL, PRIMARY KEY (id))')
+    op.create_index('ix_server_session_expires', 'server_session', ['expires'])
+
+
+def downgrade(op):
+    op.execute('DROP TABLE IF EXISTS server_session')
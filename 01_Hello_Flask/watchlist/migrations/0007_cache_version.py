@@ -0,0 +1,27 @@
+"""
+Add shared cache versions maintained by triggers on movie and user
+"""
+
+revision = '0007'
+down_revision = '0006'
+
+TABLES = [('Movie', 'movie'), ('User', 'user')]
+EVENTS = ['INSERT', 'UPDATE', 'DELETE']
+
+
+def upgrade(op):
+    op.execute('CREATE TABLE IF NOT EXISTS cache_version (name VARCHAR(20) NOT NULL, version INTEGER NOT NULL, '
+               'PRIMARY KEY (name))')
+    op.execute("INSERT OR IGNORE INTO cache_version (name, version) VALUES ('Movie', 0), ('User', 0)")
+    for name, table in TABLES:
+        for event in EVENTS:
+            op.execute("CREATE TRIGGER IF NOT EXISTS %s_version_a%s AFTER %s ON %s BEGIN "
+                       "UPDATE cache_version SET version = version + 1 WHERE name = '%s'; END"
+                       % (table, event[0].lower(), event, table, name))
+
+
+def downgrade(op):
+    for name, table in TABLES:
+        for event in EVENTS:
+            op.execute('DROP TRIGGER IF EXISTS %s_version_a%s' % (table, event[0].lower()))
+    op.execute('DROP TABLE IF EXISTS cache_version')
@@ -0,0 +1 @@
+# 迁移模块，文件名为 四位版本号_说明.py，用 flask db revision 生成
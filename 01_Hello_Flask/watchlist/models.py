@@ -2,10 +2,14 @@
 # from werkzeug.security import check_password_hash, generate_password_hash
 #
 # from watchlist import db
+from flask import current_app
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import DDL, event, func, select
+from werkzeug.security import generate_password_hash
 
-from watchlist import db
+from watchlist.auth import verify_password
+from watchlist.extensions import db
+from watchlist.cache import cached, cached_instance, cached_record
 
 
 # 创建数据库模型
@@ -15,18 +19,191 @@ class User(db.Model, UserMixin):
     """
     id = db.Column(db.Integer, primary_key=True)  # Primary key
     name = db.Column(db.String(20))  # Name
-    username = db.Column(db.String(20))  # Username
+    username = db.Column(db.String(20), unique=True, index=True)  # Username，登录时按用户名查询
     password_hash = db.Column(db.String(128))  # Password hash
+    movies = db.relationship('Movie', back_populates='user')  # 用户的电影
+
+    @classmethod
+    def cached_get(cls, user_id):
+        """
+        按主键读取用户，使用缓存
+        """
+        return cached_instance(cls, (user_id,), cls.id == user_id)
+
+    @classmethod
+    def cached_owner(cls):
+        """
+        读取站点所有者（第一个用户），使用缓存
+        """
+        return cached_instance(cls, ('owner',), order_by=cls.id)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(password, method=current_app.config['PASSWORD_HASH_METHOD'])
 
     def validate_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        # 在有界线程池中校验，队列已满时抛出 HashPoolBusy
+        return verify_password(self.password_hash, password)
 
 
 # 创建数据库模型
 class Movie(db.Model):
+    # 按用户列出电影时 WHERE user_id = ? AND id > ? ORDER BY id 直接走这个索引，
+    # 查询代价只与每页条数有关，与所有用户的电影总数无关
+    # 按标题、年份排序或按年份筛选时同理，游标分页使用 (排序列, id) 作为游标
+    __table_args__ = (
+        db.Index('ix_movie_user_id_id', 'user_id', 'id'),
+        db.Index('ix_movie_user_id_title_id', 'user_id', 'title', 'id'),
+        db.Index('ix_movie_user_id_year_id', 'user_id', 'year', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)  # Primary key
-    title = db.Column(db.String(60))  # Title
-    year = db.Column(db.String(4))  # Year
+    title = db.Column(db.String(60), index=True)  # Title
+    year = db.Column(db.Integer)  # Year
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))  # 所属用户
+    user = db.relationship('User', back_populates='movies')
+
+    @staticmethod
+    def parse_year(year):
+        """
+        把表单或 API 提交的年份（四位数字的字符串或整数）转换为整数，格式不对时返回 None
+        """
+        if isinstance(year, str) and len(year) == 4 and year.isascii() and year.isdigit():
+            return int(year)
+        if isinstance(year, int) and not isinstance(year, bool) and 0 <= year <= 9999:
+            return year
+        return None
+
+    @staticmethod
+    def validate_input(title, year):
+        """
+        检查表单或 API 提交的电影数据
+        """
+        return bool(title) and len(title) <= 60 and Movie.parse_year(year) is not None
+
+    @classmethod
+    def cached_get(cls, movie_id):
+        """
+        按主键读取电影，使用记录缓存，不存在时返回 None
+        """
+        return cached_record(cls, movie_id)
+
+    @classmethod
+    def of_user(cls, user_id):
+        """
+        某个用户的电影
+        """
+        return cls.query.filter(cls.user_id == user_id)
+
+    @classmethod
+    def cached_count(cls, user_id):
+        """
+        用户的电影总数，缓存到下一次修改电影表的提交为止
+        """
+        return cached(('Movie', 'count', user_id),
+                      lambda: db.session.query(func.count(cls.id)).filter(cls.user_id == user_id).scalar())
+
+    @classmethod
+    def decade_counts(cls, user_id):
+        """
+        用户每个年代的电影数 [(年代, 数量)]，读取触发器维护的 movie_decade 表，不需要对电影表 GROUP BY
+        """
+        stmt = (select(MovieDecade.decade, MovieDecade.count)
+                .where(MovieDecade.user_id == user_id, MovieDecade.count > 0)
+                .order_by(MovieDecade.decade))
+        return cached(('Movie', 'decades', user_id), lambda: [tuple(row) for row in db.session.execute(stmt)])
+
+
+# 服务端会话（WATCHLIST_SESSION_BACKEND=sqlite），见 watchlist/sessions.py
+session_table = db.Table(
+    'server_session',
+    db.Column('id', db.String(64), primary_key=True),  # cookie 中的随机会话 id
+    db.Column('data', db.Text, nullable=False),  # 序列化后的会话数据
+    db.Column('expires', db.Float, nullable=False, index=True),  # 过期时间（Unix 时间戳），清理时按它查找
+)
+
+
+# 各模型的共享版本号，由触发器在每次修改 movie、user 表时加一，见 watchlist/cache.py
+# 多个 worker 进程共用一个数据库时，进程内缓存通过它发现其他进程提交的修改
+cache_version_table = db.Table(
+    'cache_version',
+    db.Column('name', db.String(20), primary_key=True),  # 模型名
+    db.Column('version', db.Integer, nullable=False),
+)
+
+
+def format_year(year):
+    """
+    年份的四位数字形式，API 和导出文件中的年份仍然是字符串
+    """
+    return None if year is None else '%04d' % year
+
+
+class MovieDecade(db.Model):
+    """
+    每个用户每个年代（1990 表示 1990-1999）的电影数，用于主页的年代筛选
+
+    由 movie 表上的触发器在插入、修改、删除时增减，批量写入也能覆盖到。
+    """
+    __tablename__ = 'movie_decade'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    decade = db.Column(db.Integer, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+# 电影标题的全文索引（SQLite FTS5 外部内容表）
+# 由触发器与 movie 表保持同步，批量写入也能覆盖到
+MOVIE_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS movie_fts USING fts5("
+    "title, year, content='movie', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS movie_fts_ai AFTER INSERT ON movie BEGIN "
+    "INSERT INTO movie_fts(rowid, title, year) VALUES (new.id, new.title, new.year); END",
+    "CREATE TRIGGER IF NOT EXISTS movie_fts_ad AFTER DELETE ON movie BEGIN "
+    "INSERT INTO movie_fts(movie_fts, rowid, title, year) VALUES ('delete', old.id, old.title, old.year); END",
+    # 只有标题和年份变化时才更新索引，修改 user_id 等其他列不触发
+    "CREATE TRIGGER IF NOT EXISTS movie_fts_au AFTER UPDATE OF title, year ON movie BEGIN "
+    "INSERT INTO movie_fts(movie_fts, rowid, title, year) VALUES ('delete', old.id, old.title, old.year); "
+    "INSERT INTO movie_fts(rowid, title, year) VALUES (new.id, new.title, new.year); END",
+]
+
+# 年代计数：旧的年代减一（减到 0 时删除），新的年代加一；user_id 或 year 为空的电影不计入
+_DECADE_REMOVE = (
+    "UPDATE movie_decade SET count = count - 1 WHERE user_id = old.user_id AND decade = old.year / 10 * 10; "
+    "DELETE FROM movie_decade WHERE user_id = old.user_id AND decade = old.year / 10 * 10 AND count <= 0; "
+)
+_DECADE_ADD = (
+    "INSERT INTO movie_decade (user_id, decade, count) "
+    "SELECT new.user_id, new.year / 10 * 10, 1 WHERE new.user_id IS NOT NULL AND new.year IS NOT NULL "
+    "ON CONFLICT (user_id, decade) DO UPDATE SET count = count + 1; "
+)
+MOVIE_DECADE_DDL = [
+    "CREATE TRIGGER IF NOT EXISTS movie_decade_ai AFTER INSERT ON movie BEGIN " + _DECADE_ADD + "END",
+    "CREATE TRIGGER IF NOT EXISTS movie_decade_ad AFTER DELETE ON movie BEGIN " + _DECADE_REMOVE + "END",
+    # 年代和用户都没变时（例如只改了标题或同一年代内的年份）不执行
+    "CREATE TRIGGER IF NOT EXISTS movie_decade_au AFTER UPDATE OF year, user_id ON movie "
+    "WHEN old.year / 10 IS NOT new.year / 10 OR old.user_id IS NOT new.user_id BEGIN "
+    + _DECADE_REMOVE + _DECADE_ADD + "END",
+]
+
+# 按电影表重新统计年代计数
+MOVIE_DECADE_REBUILD = [
+    "DELETE FROM movie_decade",
+    "INSERT INTO movie_decade (user_id, decade, count) SELECT user_id, year / 10 * 10, count(*) FROM movie "
+    "WHERE user_id IS NOT NULL AND year IS NOT NULL GROUP BY user_id, year / 10 * 10",
+]
+
+# 每行修改都执行一次，只更新一行，不用 UPSERT
+CACHE_VERSION_DDL = [
+    "INSERT OR IGNORE INTO cache_version (name, version) VALUES ('Movie', 0), ('User', 0)",
+] + [
+    "CREATE TRIGGER IF NOT EXISTS %s_version_a%s AFTER %s ON %s BEGIN "
+    "UPDATE cache_version SET version = version + 1 WHERE name = '%s'; END" % (table, op[0].lower(), op, table, name)
+    for name, table in (('Movie', 'movie'), ('User', 'user')) for op in ('INSERT', 'UPDATE', 'DELETE')
+]
+
+for statement in MOVIE_FTS_DDL + MOVIE_DECADE_DDL:
+    event.listen(Movie.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+event.listen(Movie.__table__, 'before_drop', DDL('DROP TABLE IF EXISTS movie_fts').execute_if(dialect='sqlite'))
+# 触发器建在 movie 和 user 表上，等所有表都创建之后再创建
+for statement in CACHE_VERSION_DDL:
+    event.listen(db.metadata, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
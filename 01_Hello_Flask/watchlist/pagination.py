@@ -0,0 +1,76 @@
+from sqlalchemy import select, tuple_
+
+
+class KeysetPage(object):
+    """
+    游标（keyset）分页的一页结果
+
+    通过 WHERE id > 游标 + LIMIT 定位，不使用 OFFSET，
+    所以无论翻到第几页，查询代价都只与每页条数有关。
+    """
+
+    def __init__(self, items, has_prev, has_next):
+        self.items = items
+        self.has_prev = has_prev
+        self.has_next = has_next
+
+    @property
+    def prev_cursor(self):
+        return self.items[0].id if self.items else None
+
+    @property
+    def next_cursor(self):
+        return self.items[-1].id if self.items else None
+
+
+def _cursor(column, order, value):
+    """
+    游标条件比较的值：只按 column 排序时就是游标本身，
+    先按 order 排序时为游标所在行的 (order, column)，在同一条语句里用子查询取出
+    """
+    if order is None:
+        return value
+    return select(order, column).where(column == value).correlate(None).scalar_subquery()
+
+
+def keyset_query(query, column, after=None, before=None, per_page=20, order=None, descending=False):
+    """
+    给 query（Query 或 select()）加上游标条件、排序和 LIMIT，多取一条用来判断是否还有下一页
+
+    order：先按这一列排序，值相同时再按 column 排序，需要有 (order, column) 的索引；
+    游标仍然是 column 的值，所以分页链接不受排序方式影响。
+    descending：整体倒序。
+    """
+    key = column if order is None else tuple_(order, column)
+    columns = [column] if order is None else [order, column]
+    forward = [c.desc() if descending else c.asc() for c in columns]
+    backward = [c.asc() if descending else c.desc() for c in columns]
+    if before is not None:
+        cursor = _cursor(column, order, before)
+        condition = key > cursor if descending else key < cursor
+        return query.filter(condition).order_by(*backward).limit(per_page + 1)
+    if after is not None:
+        cursor = _cursor(column, order, after)
+        query = query.filter(key < cursor if descending else key > cursor)
+    return query.order_by(*forward).limit(per_page + 1)
+
+
+def keyset_page(rows, after=None, before=None, per_page=20):
+    """
+    把 keyset_query 的查询结果整理成 KeysetPage
+    """
+    if before is not None:
+        return KeysetPage(rows[:per_page][::-1], has_prev=len(rows) > per_page, has_next=True)
+    return KeysetPage(rows[:per_page], has_prev=after is not None, has_next=len(rows) > per_page)
+
+
+def keyset_paginate(query, column, after=None, before=None, per_page=20, order=None, descending=False):
+    """
+    对 query 按 column（需有索引，通常为主键）做游标分页
+
+    after：返回游标之后的下一页
+    before：返回游标之前的上一页
+    order、descending 见 keyset_query
+    """
+    rows = keyset_query(query, column, after, before, per_page, order, descending).all()
+    return keyset_page(rows, after, before, per_page)
@@ -0,0 +1,251 @@
+import functools
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from urllib.parse import quote
+
+from flask import current_app, g, has_app_context, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+
+from watchlist.cache import get_versions
+
+# 读写分离
+# 主页、搜索和列表 API 只读取数据。开启 WATCHLIST_READ_REPLICA 后，这些视图的 GET 请求中的 SELECT
+# 改用单独的只读连接池，写操作（包括 flush）仍然使用主库：
+# readonly：以只读模式（mode=ro）打开同一个数据库文件，总能读到最新提交的数据
+# snapshot：每 WATCHLIST_SNAPSHOT_INTERVAL 秒用 SQLite backup API 把主库复制为本进程的快照文件，
+#           读请求不与写事务争用同一个文件的锁；刚写入过数据的用户在下一次快照之前仍然读主库（读己之写）
+
+logger = logging.getLogger(__name__)
+
+
+class RoutingSession(Session):
+    """
+    g.watchlist_replica 中有只读引擎时，把 SELECT 发到只读引擎，其余语句和 flush 使用主库
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            if not self._flushing and getattr(clause, 'is_select', False):
+                engine = g.get('watchlist_replica')
+                if engine is not None:
+                    return engine
+            elif self._flushing or getattr(clause, 'is_dml', False):
+                self.info['watchlist_wrote'] = True
+        return super(RoutingSession, self).get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _mark_on_commit(db_session):
+    if db_session.info.pop('watchlist_wrote', False) and has_request_context():
+        mark_written()
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _discard_on_rollback(db_session):
+    db_session.info.pop('watchlist_wrote', None)
+
+
+def _replica_uri(path):
+    return 'sqlite:///file:%s?mode=ro&uri=true' % quote(path)
+
+
+def _replica_engine(app, path):
+    from watchlist.database import SQLITE_PROFILES, apply_pragmas, engine_options
+
+    uri = _replica_uri(path)
+    profile = SQLITE_PROFILES[app.config['WATCHLIST_DB_PROFILE']]
+    engine = create_engine(uri, **engine_options(app.config['WATCHLIST_DB_PROFILE'], uri))
+    # 只读连接不能修改日志模式，其余 PRAGMA 与主库相同
+    apply_pragmas(engine, {name: value for name, value in profile['pragmas'].items() if name != 'journal_mode'})
+    return engine
+
+
+class ReadOnlyReplica(object):
+    """
+    以只读模式打开主库文件的连接池
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def reader(self):
+        return self.engine
+
+    def release(self, engine):
+        pass
+
+    def close(self):
+        self.engine.dispose()
+
+
+class Snapshot(object):
+    """
+    定期刷新的主库快照
+
+    每次刷新复制到一个新的临时文件再切换引擎。reader() 返回的引擎在 release() 之前不会被释放，
+    切换后旧快照等到所有拿到它的请求都结束才释放引擎、删除文件，正在读旧快照的请求不受影响；
+    interval 为 0 时不启动后台线程，只能调用 refresh() 手动刷新。
+    快照开始复制之后有提交修改了数据（缓存版本号变了，包括通过共享版本号发现的其他进程的提交）时，
+    到下一次快照之前都读主库，这样进程内的缓存不会保存比已提交的修改更旧的数据。
+    """
+
+    def __init__(self, app, primary, interval=5):
+        self.app = app
+        self.primary = primary
+        self.interval = interval
+        self.current = None  # (引擎, 快照文件, 开始复制的时间, 开始复制时各模型的缓存版本号)
+        self.readers = {}  # 引擎 -> 正在使用它的请求数
+        self.retired = {}  # 已被替换、还有请求在使用的快照，引擎 -> 快照
+        self.lock = threading.Lock()
+        self.refresher = None
+        self.stopped = threading.Event()
+
+    def refresh(self):
+        """
+        复制主库到新的快照文件，返回复制用的秒数
+        """
+        with self.app.app_context():
+            versions = get_versions()
+        started = time.time()
+        fd, path = tempfile.mkstemp(prefix='watchlist-snapshot-', suffix='.db')
+        os.close(fd)
+        target = sqlite3.connect(path)
+        try:
+            source = self.primary.raw_connection()
+            try:
+                source.driver_connection.backup(target)
+            finally:
+                source.close()
+            # 主库是 WAL 模式时复制出的文件也是，改回默认模式才能以只读方式打开
+            target.execute('PRAGMA journal_mode = DELETE')
+        finally:
+            target.close()
+        self._replace((_replica_engine(self.app, path), path, started, versions))
+        return time.time() - started
+
+    def reader(self):
+        """
+        返回可以使用的快照引擎，用完后调用 release()；
+        还没有快照，或本进程、当前用户在快照之后写入过数据时返回 None
+        """
+        self._start()
+        with self.lock:
+            current = self.current
+            if current is None:
+                return None
+            self.readers[current[0]] = self.readers.get(current[0], 0) + 1
+        if session.get('_wrote_at', 0) >= current[2] or get_versions() != current[3]:
+            self.release(current[0])
+            return None
+        return current[0]
+
+    def release(self, engine):
+        """
+        请求不再使用 reader() 返回的引擎，最后一个请求释放已被替换的快照
+        """
+        with self.lock:
+            self.readers[engine] -= 1
+            if self.readers[engine]:
+                return
+            del self.readers[engine]
+            snapshot = self.retired.pop(engine, None)
+        if snapshot is not None:
+            self._discard(snapshot)
+
+    def close(self):
+        self.stopped.set()
+        self._replace(None)
+
+    def _replace(self, snapshot):
+        with self.lock:
+            previous, self.current = self.current, snapshot
+            if previous is not None and self.readers.get(previous[0]):
+                # 还有请求拿着旧快照的引擎，由最后一个请求的 release() 释放
+                self.retired[previous[0]] = previous
+                previous = None
+        if previous is not None:
+            self._discard(previous)
+
+    def _discard(self, snapshot):
+        # 请求结束前已取出的连接归还后随连接池一起释放，已打开的文件删除后仍可读取
+        snapshot[0].dispose()
+        try:
+            os.remove(snapshot[1])
+        except OSError:
+            pass
+
+    def _start(self):
+        if self.refresher is not None or not self.interval:
+            return
+        with self.lock:
+            if self.refresher is None:
+                self.refresher = threading.Thread(target=self._refresh_loop, name='watchlist-snapshot', daemon=True)
+                self.refresher.start()
+
+    def _refresh_loop(self):
+        while not self.stopped.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                # 刷新失败时继续使用旧快照，下一轮再试
+                logger.exception('Failed to refresh the database snapshot')
+            self.stopped.wait(self.interval)
+
+
+def mark_written():
+    """
+    记录当前用户写入数据的时间，之后的读请求在下一次快照之前使用主库
+    """
+    if isinstance(current_app.extensions.get('watchlist_replica'), Snapshot):
+        session['_wrote_at'] = time.time()
+
+
+def replica_reads(f):
+    """
+    只读视图的 GET 请求从只读副本读取
+
+    整个请求使用同一个只读引擎，快照刷新不会让一个页面读到两个版本的数据。
+    """
+
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+        replica = current_app.extensions.get('watchlist_replica')
+        engine = replica.reader() if replica is not None and request.method == 'GET' else None
+        if engine is None:
+            return f(*args, **kwargs)
+        g.watchlist_replica = engine
+        try:
+            return f(*args, **kwargs)
+        finally:
+            g.pop('watchlist_replica', None)
+            replica.release(engine)
+
+    return wrapper
+
+
+def init_app(app):
+    """
+    按 WATCHLIST_READ_REPLICA 创建只读副本，为空时所有语句都使用主库
+    """
+    mode = app.config['WATCHLIST_READ_REPLICA']
+    if not mode:
+        return
+    from watchlist.extensions import db
+
+    with app.app_context():
+        primary = db.engine
+    path = primary.url.database
+    if not path or path == ':memory:' or path.startswith('file:'):
+        raise ValueError('Read replicas need a database file')
+    if mode == 'readonly':
+        replica = ReadOnlyReplica(_replica_engine(app, path))
+    elif mode == 'snapshot':
+        replica = Snapshot(app, primary, app.config['WATCHLIST_SNAPSHOT_INTERVAL'])
+    else:
+        raise ValueError('Unknown read replica mode: %s' % mode)
+    app.extensions['watchlist_replica'] = replica
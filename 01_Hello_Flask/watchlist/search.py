@@ -0,0 +1,40 @@
+import re
+
+from sqlalchemy import column, select, table, text
+
+from watchlist.extensions import db
+from watchlist.models import Movie
+
+movie_fts = table('movie_fts', column('rowid'), column('rank'))
+
+
+def build_match_query(q):
+    """
+    把用户输入转换为 FTS5 查询：每个词做前缀匹配，词之间为 AND 关系
+    """
+    terms = re.findall(r'\w+', q)
+    return ' '.join('"%s"*' % term for term in terms)
+
+
+def search_statement(q, user_id, limit=50):
+    """
+    在用户的电影中全文搜索的查询语句，按 bm25 相关度排序；没有可搜索的词时返回 None
+    """
+    match = build_match_query(q)
+    if not match:
+        return None
+    return (select(Movie)
+            .join(movie_fts, movie_fts.c.rowid == Movie.id)
+            .where(text('movie_fts MATCH :match').bindparams(match=match), Movie.user_id == user_id)
+            .order_by(movie_fts.c.rank)
+            .limit(limit))
+
+
+def search_movies(q, user_id, limit=50):
+    """
+    在用户的电影中全文搜索
+    """
+    stmt = search_statement(q, user_id, limit)
+    if stmt is None:
+        return []
+    return db.session.execute(stmt).scalars().all()
@@ -0,0 +1,271 @@
+import logging
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from flask_login import user_logged_in
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.sqlite import insert
+from werkzeug.datastructures import CallbackDict
+
+# 服务端会话
+# 默认的会话把全部数据签名后放在 cookie 里，每个修改了会话的响应都要重新序列化和签名，
+# 每个请求也要验证签名。开启服务端会话后 cookie 中只有一个随机 id，数据保存在内存或 SQLite 中。
+# WATCHLIST_SESSION_BACKEND：cookie（Flask 默认）、memory（单进程）、sqlite（多个 worker 共享）
+
+logger = logging.getLogger(__name__)
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """
+    服务端保存的会话，sid 为 None 表示还没有保存过
+    """
+
+    def __init__(self, initial=None, sid=None, expires=None):
+        def on_update(self):
+            self.modified = True
+            self.accessed = True
+
+        super(ServerSession, self).__init__(initial, on_update)
+        self.sid = sid
+        self.expires = expires
+        self.modified = False
+        self.accessed = False
+        self.regenerated = False
+
+    def __getitem__(self, key):
+        self.accessed = True
+        return super(ServerSession, self).__getitem__(key)
+
+    def get(self, key, default=None):
+        self.accessed = True
+        return super(ServerSession, self).get(key, default)
+
+    def setdefault(self, key, default=None):
+        self.accessed = True
+        return super(ServerSession, self).setdefault(key, default)
+
+    def regenerate(self):
+        """
+        保存时换一个新的会话 id，并删除旧的数据（登录后调用，防止会话固定攻击）
+        """
+        self.regenerated = True
+        self.modified = True
+
+
+class MemoryStore(object):
+    """
+    进程内的 LRU 会话存储，超过 max_entries 时淘汰最久未使用的会话
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.items = OrderedDict()  # 会话 id -> (过期时间, 数据)
+
+    def get(self, sid, now):
+        with self.lock:
+            item = self.items.get(sid)
+            if item is None:
+                return None
+            if item[0] <= now:
+                del self.items[sid]
+                return None
+            self.items.move_to_end(sid)
+            return item[1], item[0]
+
+    def set(self, sid, data, expires):
+        with self.lock:
+            self.items[sid] = (expires, data)
+            self.items.move_to_end(sid)
+            while len(self.items) > self.max_entries:
+                self.items.popitem(last=False)
+
+    def touch(self, sid, expires):
+        with self.lock:
+            item = self.items.get(sid)
+            if item is not None:
+                self.items[sid] = (expires, item[1])
+
+    def delete(self, sid):
+        with self.lock:
+            self.items.pop(sid, None)
+
+    def sweep(self, now):
+        with self.lock:
+            expired = [sid for sid, item in self.items.items() if item[0] <= now]
+            for sid in expired:
+                del self.items[sid]
+        return len(expired)
+
+
+class SQLiteStore(object):
+    """
+    保存在 server_session 表中的会话，多个 worker 进程共享
+
+    使用自己的连接和短事务，不影响请求中 db.session 的事务。
+    """
+
+    def __init__(self, engine, table, batch_size=1000):
+        self.engine = engine
+        self.table = table
+        self.batch_size = batch_size
+
+    def get(self, sid, now):
+        t = self.table
+        with self.engine.connect() as connection:
+            row = connection.execute(select(t.c.data, t.c.expires).where(t.c.id == sid, t.c.expires > now)).first()
+        return tuple(row) if row is not None else None
+
+    def set(self, sid, data, expires):
+        stmt = insert(self.table).values(id=sid, data=data, expires=expires)
+        stmt = stmt.on_conflict_do_update(index_elements=['id'], set_={'data': data, 'expires': expires})
+        with self.engine.begin() as connection:
+            connection.execute(stmt)
+
+    def touch(self, sid, expires):
+        with self.engine.begin() as connection:
+            connection.execute(update(self.table).where(self.table.c.id == sid).values(expires=expires))
+
+    def delete(self, sid):
+        with self.engine.begin() as connection:
+            connection.execute(delete(self.table).where(self.table.c.id == sid))
+
+    def sweep(self, now):
+        """
+        分批删除过期的会话，每批一个短事务，不长时间占用写锁
+        """
+        t = self.table
+        expired = select(t.c.id).where(t.c.expires <= now).limit(self.batch_size)
+        total = 0
+        while True:
+            with self.engine.begin() as connection:
+                count = connection.execute(delete(t).where(t.c.id.in_(expired))).rowcount
+            total += count
+            if count < self.batch_size:
+                return total
+
+
+class ServerSessionInterface(SessionInterface):
+    """
+    cookie 中只保存会话 id 的会话接口
+
+    只有会话内容改变时才写存储；没有改变的请求不设置 cookie，
+    剩余有效期不到一半时才延长有效期（滑动过期）。
+    sweep_interval 大于 0 时，第一次写入后启动后台线程定期删除过期的会话，close() 停止这个线程。
+    """
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store, sweep_interval=300):
+        self.store = store
+        self.sweep_interval = sweep_interval
+        self.sweeper = None
+        self.sweeper_lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            record = self.store.get(sid, time.time())
+            if record is not None:
+                data, expires = record
+                return ServerSession(self.serializer.loads(data), sid=sid, expires=expires)
+        # 没有 cookie 或会话已过期；不沿用客户端提供的 id，保存时生成新的
+        return ServerSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if not session:
+            # 会话被清空（例如读取了最后一条闪现消息），删除存储的数据和 cookie
+            if session.sid is not None and session.modified:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path, secure=secure, samesite=samesite,
+                                       httponly=httponly)
+            return
+
+        now = time.time()
+        ttl = app.permanent_session_lifetime.total_seconds()
+        sid = session.sid
+        if session.modified:
+            if session.regenerated and sid is not None:
+                self.store.delete(sid)
+                sid = None
+            if sid is None:
+                sid = secrets.token_urlsafe(32)
+            self.store.set(sid, self.serializer.dumps(dict(session)), now + ttl)
+            self._start_sweeper()
+        elif session.expires - now < ttl / 2:
+            self.store.touch(sid, now + ttl)
+        else:
+            return
+
+        if sid != session.sid or session.permanent:
+            response.set_cookie(name, sid, expires=self.get_expiration_time(app, session), httponly=httponly,
+                                domain=domain, path=path, secure=secure, samesite=samesite)
+
+    def close(self):
+        """
+        停止并等待清理线程，之后写入会话也不再启动
+        """
+        self.stopped.set()
+        with self.sweeper_lock:
+            sweeper = self.sweeper
+        if sweeper is not None:
+            sweeper.join()
+
+    def _start_sweeper(self):
+        if self.sweeper is not None or not self.sweep_interval or self.stopped.is_set():
+            return
+        with self.sweeper_lock:
+            if self.sweeper is None:
+                self.sweeper = threading.Thread(target=self._sweep_loop, name='watchlist-session-sweeper',
+                                                daemon=True)
+                self.sweeper.start()
+
+    def _sweep_loop(self):
+        while not self.stopped.wait(self.sweep_interval):
+            try:
+                self.store.sweep(time.time())
+            except Exception:
+                # 下一轮再试，不让清理线程退出
+                logger.exception('Failed to sweep expired sessions')
+
+
+def _regenerate_on_login(sender, **extra):
+    from flask import session
+
+    if isinstance(session, ServerSession):
+        session.regenerate()
+
+
+def init_app(app):
+    """
+    按 WATCHLIST_SESSION_BACKEND 替换会话接口，cookie 时保持 Flask 默认的签名 cookie
+    """
+    backend = app.config['WATCHLIST_SESSION_BACKEND']
+    if backend == 'cookie':
+        return
+    if backend == 'memory':
+        store = MemoryStore(app.config['WATCHLIST_SESSION_MAX_ENTRIES'])
+    elif backend == 'sqlite':
+        from watchlist.extensions import db
+        from watchlist.models import session_table
+
+        with app.app_context():
+            store = SQLiteStore(db.engine, session_table)
+    else:
+        raise ValueError('Unknown session backend: %s' % backend)
+    app.session_interface = ServerSessionInterface(store, app.config['WATCHLIST_SESSION_SWEEP_INTERVAL'])
+    user_logged_in.connect(_regenerate_on_login, app)
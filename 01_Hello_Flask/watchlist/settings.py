@@ -0,0 +1,93 @@
+import os
+import sys
+
+# 系统平台判断
+WIN = sys.platform.startswith('win')
+if WIN:
+    prefix = 'sqlite:///'
+else:
+    prefix = 'sqlite:////'
+
+# 项目根目录（watchlist 包的上一级）
+basedir = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+
+
+# 配置数据库的连接信息
+# 对于SQLite, [sqlite:////数据库文件的绝对路径]
+class BaseConfig(object):
+    SQLALCHEMY_DATABASE_URI = prefix + os.path.join(basedir, os.getenv('DATABASE_FILE', 'data.db'))
+    SQLALCHEMY_TRACK_MODIFICATIONS = False  # 关闭对模型修改的监控
+    # 密钥这种敏感信息，保存到环境变量中要比直接写在代码中更加安全。
+    SECRET_KEY = os.getenv('SECRET_KEY', 'dev')
+    WATCHLIST_PER_PAGE = int(os.getenv('WATCHLIST_PER_PAGE', 20))  # 主页每页显示的电影数
+    WATCHLIST_STREAM_BATCH = int(os.getenv('WATCHLIST_STREAM_BATCH', 1000))  # 显示全部电影时每次读取的记录数
+    WATCHLIST_SEARCH_LIMIT = int(os.getenv('WATCHLIST_SEARCH_LIMIT', 50))  # 搜索结果的最大条数
+    WATCHLIST_API_MAX_PAGE = int(os.getenv('WATCHLIST_API_MAX_PAGE', 100))  # API 每页最多返回的电影数
+    WATCHLIST_API_MAX_BATCH = int(os.getenv('WATCHLIST_API_MAX_BATCH', 1000))  # API 一次请求最多提交的电影数
+    WATCHLIST_CACHE_TTL = int(os.getenv('WATCHLIST_CACHE_TTL', 60))  # 进程内缓存的最长有效期（秒）
+    WATCHLIST_PAGE_CACHE_SIZE = int(os.getenv('WATCHLIST_PAGE_CACHE_SIZE', 256))  # 页面缓存的最大条数，0 表示关闭
+    # 请求计时与 SQL 统计，开启后响应带 Server-Timing 头，并提供 /metrics
+    WATCHLIST_INSTRUMENT = os.getenv('WATCHLIST_INSTRUMENT', '0') == '1'
+    # 耗时超过该阈值（秒）的请求保存 cProfile 结果，0 表示不做性能剖析
+    WATCHLIST_PROFILE_THRESHOLD = float(os.getenv('WATCHLIST_PROFILE_THRESHOLD', 0))
+    WATCHLIST_PROFILE_DIR = os.getenv('WATCHLIST_PROFILE_DIR', os.path.join(basedir, 'profiles'))
+    # API 读接口使用 async 视图和 aiosqlite，需要安装 requirements-async.txt
+    WATCHLIST_ASYNC = os.getenv('WATCHLIST_ASYNC', '0') == '1'
+    # 密码哈希算法，例如 scrypt:32768:8:1 或 pbkdf2:sha256:600000
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt')
+    WATCHLIST_HASH_WORKERS = int(os.getenv('WATCHLIST_HASH_WORKERS', 2))  # 同时进行的密码校验数
+    WATCHLIST_HASH_QUEUE = int(os.getenv('WATCHLIST_HASH_QUEUE', 8))  # 排队等待校验的最大数量
+    WATCHLIST_HASH_TIMEOUT = float(os.getenv('WATCHLIST_HASH_TIMEOUT', 5))  # 等待校验结果的最长时间（秒）
+    # 登录限流：每个 IP、每个用户名在 WINDOW 秒内最多尝试 LIMIT 次
+    WATCHLIST_LOGIN_LIMIT = int(os.getenv('WATCHLIST_LOGIN_LIMIT', 10))
+    WATCHLIST_LOGIN_WINDOW = int(os.getenv('WATCHLIST_LOGIN_WINDOW', 60))
+    # Jinja 模板字节码缓存目录，多个 worker 共用，为空时不使用；可以用 flask compile-templates 预先编译
+    WATCHLIST_TEMPLATE_CACHE_DIR = os.getenv('WATCHLIST_TEMPLATE_CACHE_DIR', '')
+    WATCHLIST_FRAGMENT_CACHE_SIZE = int(os.getenv('WATCHLIST_FRAGMENT_CACHE_SIZE', 4096))  # 电影列表行片段缓存的条数
+    WATCHLIST_RECORD_CACHE_SIZE = int(os.getenv('WATCHLIST_RECORD_CACHE_SIZE', 1024))  # 按主键读取的电影记录缓存条数，0 表示关闭
+    # 使用 flask build-assets 构建的静态资源（带哈希的文件名、预压缩、长期缓存）
+    WATCHLIST_ASSETS = os.getenv('WATCHLIST_ASSETS', '0') == '1'
+    # 按 Accept-Encoding 压缩 HTML、JSON 等响应，见 watchlist/compress.py
+    WATCHLIST_COMPRESS = os.getenv('WATCHLIST_COMPRESS', '1') == '1'
+    WATCHLIST_COMPRESS_MIN_SIZE = int(os.getenv('WATCHLIST_COMPRESS_MIN_SIZE', 500))  # 小于该字节数的响应不压缩
+    WATCHLIST_COMPRESS_LEVEL = int(os.getenv('WATCHLIST_COMPRESS_LEVEL', 6))  # gzip 压缩级别 1-9
+    WATCHLIST_BROTLI_QUALITY = int(os.getenv('WATCHLIST_BROTLI_QUALITY', 5))  # brotli 压缩质量 0-11
+    # 会话保存位置：cookie（签名 cookie）、memory（进程内，单进程部署）、sqlite（多个 worker 共享），见 watchlist/sessions.py
+    WATCHLIST_SESSION_BACKEND = os.getenv('WATCHLIST_SESSION_BACKEND', 'cookie')
+    WATCHLIST_SESSION_MAX_ENTRIES = int(os.getenv('WATCHLIST_SESSION_MAX_ENTRIES', 10000))  # memory 最多保存的会话数
+    WATCHLIST_SESSION_SWEEP_INTERVAL = int(os.getenv('WATCHLIST_SESSION_SWEEP_INTERVAL', 300))  # 清理过期会话的间隔（秒），0 表示不清理
+    # 合并写入：添加、编辑、删除电影由后台写线程在一个事务中批量提交，见 watchlist/writes.py
+    WATCHLIST_WRITE_BATCH = os.getenv('WATCHLIST_WRITE_BATCH', '0') == '1'
+    # 每批额外等待后续写操作的时间（毫秒），0 表示只合并上一批提交期间到达的写操作
+    WATCHLIST_WRITE_WINDOW = float(os.getenv('WATCHLIST_WRITE_WINDOW', 0))
+    WATCHLIST_WRITE_MAX_BATCH = int(os.getenv('WATCHLIST_WRITE_MAX_BATCH', 100))  # 每批最多的写操作数
+    # 读写分离：readonly（只读连接池）、snapshot（定期刷新的快照），为空时不使用，见 watchlist/replica.py
+    WATCHLIST_READ_REPLICA = os.getenv('WATCHLIST_READ_REPLICA', '')
+    WATCHLIST_SNAPSHOT_INTERVAL = float(os.getenv('WATCHLIST_SNAPSHOT_INTERVAL', 5))  # 刷新快照的间隔（秒）
+    # SQLite 连接配置，多进程部署时使用 production（WAL 等），见 watchlist/database.py
+    WATCHLIST_DB_PROFILE = os.getenv('WATCHLIST_DB_PROFILE', 'default')
+
+
+class DevelopmentConfig(BaseConfig):
+    pass
+
+
+class TestingConfig(BaseConfig):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'  # 内存型数据库
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'  # 测试时使用较快的哈希参数
+
+
+class ProductionConfig(BaseConfig):
+    WATCHLIST_DB_PROFILE = os.getenv('WATCHLIST_DB_PROFILE', 'production')
+    WATCHLIST_TEMPLATE_CACHE_DIR = os.getenv('WATCHLIST_TEMPLATE_CACHE_DIR', os.path.join(basedir, '.jinja-cache'))
+    # 即使 .flaskenv 开启了调试模式，也不检查模板文件是否修改
+    TEMPLATES_AUTO_RELOAD = False
+    WATCHLIST_ASSETS = os.getenv('WATCHLIST_ASSETS', '1') == '1'
+
+
+config = {
+    'development': DevelopmentConfig,
+    'testing': TestingConfig,
+    'production': ProductionConfig,
+}
@@ -1,13 +1,50 @@
-from flask import render_template, request, url_for, redirect, flash
+from flask import Blueprint, abort, current_app, render_template, request, url_for, redirect, flash, stream_template
 from flask_login import login_user, login_required, logout_user, current_user
+from markupsafe import Markup, escape
+from sqlalchemy import select
 
-from watchlist import app, db
+from watchlist.auth import HashPoolBusy, current_owner_id, login_allowed, login_succeeded, reject_password
+from watchlist.cache import cached_fragment, cached_page
+from watchlist.extensions import db
+from watchlist.listing import SORT_LABELS, filter_years, list_options, list_params, sort_args
 from watchlist.models import User, Movie
+from watchlist.pagination import keyset_paginate
+from watchlist.replica import replica_reads
+from watchlist.search import search_movies
+from watchlist.writes import create_movie, delete_movie, update_movie, write
+
+
+main_bp = Blueprint('main', __name__)
+
+
+@main_bp.app_context_processor
+def inject_user():
+    # 登录后显示自己的清单，未登录时显示站点所有者的清单
+    if current_user.is_authenticated:
+        return dict(user=current_user)
+    from watchlist.models import User
+    user = User.cached_owner()
+    return dict(user=user)
+
+
+@main_bp.app_template_global()
+def movie_row(movie):
+    """
+    渲染电影列表中的一行，使用片段缓存
+
+    行的内容只取决于电影的 id、标题、年份和是否登录，所以用它们作为缓存键。
+    """
+    authenticated = current_user.is_authenticated
+    key = ('movie_row', movie.id, movie.title, movie.year, authenticated)
+    return cached_fragment(key, lambda: Markup(current_app.jinja_env.get_template('_movie_row.html').render(
+        movie=movie, authenticated=authenticated)))
 
 
 # 路由和视图函数
-@app.route('/', methods=['GET', 'POST'])
-# @app.route('/index')
+@main_bp.route('/', methods=['GET', 'POST'])
+# @main_bp.route('/index')
+@replica_reads
+@cached_page('Movie', 'User')
 def index():
     """
     主页视图函数
@@ -17,99 +54,173 @@ def index():
     # return render_template('index.html', movies=movies)
     if request.method == 'POST':
         if not current_user.is_authenticated:
-            return redirect(url_for('index'))
+            return redirect(url_for('.index'))
         # 获取表单数据
         title = request.form.get('title')
         year = request.form.get('year')
         # 验证数据
-        if not title or not year or len(year) != 4 or len(title) > 60:
+        if not Movie.validate_input(title, year):
             flash('Invalid input.')  # 显示错误提示
             # 重定向返回主页
-            return redirect(url_for('index'))
-        # 保存表单数据
-        movie = Movie(title=title, year=year)
-        db.session.add(movie)
-        db.session.commit()
+            return redirect(url_for('.index'))
+        # 保存表单数据（开启合并写入时与其他请求的写操作一起提交）
+        write(create_movie, current_user.id, title, Movie.parse_year(year))
         flash('Item created.')
-        return redirect(url_for('index'))
+        return redirect(url_for('.index'))
+
+    # 游标分页，每次只读取一页电影记录（使用 (user_id, 排序列, id) 索引）
+    user_id = current_owner_id()
+    options = list_options(request.args)
+    page = keyset_paginate(filter_years(Movie.of_user(user_id), options), Movie.id,
+                           after=request.args.get('after', type=int),
+                           before=request.args.get('before', type=int),
+                           per_page=current_app.config['WATCHLIST_PER_PAGE'],
+                           **sort_args(options))
+    return render_template('index.html', **index_context(user_id, options, page))
+
+
+def index_context(user_id, options, page):
+    """
+    主页模板需要的变量，基准测试渲染主页时也使用
+    """
+    decades = Movie.decade_counts(user_id)
+    # 按年代筛选时的电影数直接取自年代计数
+    filtered = dict(decades).get(options['decade'], 0) if options['decade'] is not None else None
+    return dict(movies=page.items, page=page, total=Movie.cached_count(user_id), filtered=filtered,
+                decades=decades, options=options, params=list_params(options), sorts=SORT_LABELS)
+
+
+@main_bp.route('/all')
+@replica_reads
+def all_movies():
+    """
+    显示全部电影，流式输出
+
+    逐批读取电影（yield_per），边渲染边发送，不会把所有记录和整个页面都放进内存，
+    第一个字节的等待时间与电影数量无关。
+    """
+    user_id = current_owner_id()
+    stmt = (select(Movie.id, Movie.title, Movie.year).where(Movie.user_id == user_id).order_by(Movie.id)
+            .execution_options(yield_per=current_app.config['WATCHLIST_STREAM_BATCH']))
+    movies = db.session.execute(stmt)
+    chunks = stream_template('all.html', movies=movies, total=Movie.cached_count(user_id))
+    return current_app.response_class(_buffered(chunks, STREAM_BUFFER_SIZE), mimetype='text/html')
+
+
+# 模板每输出一小段就产生一个块，合并到这个大小（字符数）再发送，减少写入次数并提高压缩率
+STREAM_BUFFER_SIZE = 16384
+
+
+def _buffered(chunks, size):
+    buffer = []
+    length = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer = []
+            length = 0
+    if buffer:
+        yield ''.join(buffer)
 
-    movies = Movie.query.all()
-    return render_template('index.html', movies=movies)
 
+@main_bp.route('/search')
+@replica_reads
+@cached_page('Movie', 'User')
+def search():
+    """
+    搜索视图函数
+    """
+    q = request.args.get('q', '').strip()
+    movies = search_movies(q, current_owner_id(), limit=current_app.config['WATCHLIST_SEARCH_LIMIT']) if q else []
+    return render_template('search.html', movies=movies, q=q)
 
-@app.route('/movie/edit/<int:movie_id>', methods=['GET', 'POST'])
+
+@main_bp.route('/movie/edit/<int:movie_id>', methods=['GET', 'POST'])
 @login_required
 def edit(movie_id):
     """
     编辑视图函数
     """
-    movie = Movie.query.get_or_404(movie_id)
-
     if request.method == 'POST':
         title = request.form['title']
         year = request.form['year']
 
-        if not title or not year or len(year) != 4 or len(title) > 60:
+        if not Movie.validate_input(title, year):
             flash('Invalid input.')
-            return redirect(url_for('edit', movie_id=movie_id))
+            return redirect(url_for('.edit', movie_id=movie_id))
 
-        movie.title = title
-        movie.year = year
-        db.session.commit()
+        # 只能编辑自己的电影，没有修改任何行说明电影不存在或属于其他用户
+        if not write(update_movie, current_user.id, movie_id, title, Movie.parse_year(year)):
+            abort(404)
         flash('Item updated.')
-        return redirect(url_for('index'))
+        return redirect(url_for('.index'))
+
+    # 只能编辑自己的电影，其他用户的电影返回 404
+    movie = Movie.cached_get(movie_id)
+    if movie is None or movie.user_id != current_user.id:
+        abort(404)
     return render_template('edit.html', movie=movie)
 
 
-@app.route('/movie/delete/<int:movie_id>', methods=['POST'])
+@main_bp.route('/movie/delete/<int:movie_id>', methods=['POST'])
 @login_required
 def delete(movie_id):
     """
     删除视图函数
     """
-    movie = Movie.query.get_or_404(movie_id)  # 获取电影记录
-    db.session.delete(movie)
-    db.session.commit()
+    # 只能删除自己的电影，没有删除任何行时返回 404
+    if not write(delete_movie, current_user.id, movie_id):
+        abort(404)
 
     flash('Item deleted.')
-    return redirect(url_for('index'))
+    return redirect(url_for('.index'))
 
 
-@app.route('/login', methods=['GET', 'POST'])
+@main_bp.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
-        user = User.query.filter_by(username=username).first()
-        # if user is None:
-        #     flash('User doesn\'t exist.')
-        #     return redirect(url_for('login'))
+        if not login_allowed(request.remote_addr, username):
+            flash('Too many login attempts, please try again later.')
+            return render_template('login.html'), 429
 
-        if not user or not username or not password:
+        if not username or not password:
             flash('Invalid input.')
-            return redirect(url_for('login'))
+            return redirect(url_for('.login'))
 
-        user = User.query.first()
-        # 验证用户名和密码是否一致
-        if username == user.username and user.validate_password(password):
+        # username 有唯一索引，每次登录只查询一次
+        user = User.query.filter_by(username=username).first()
+        try:
+            if user is None:
+                valid = reject_password(password)
+            else:
+                valid = user.validate_password(password)
+        except HashPoolBusy:
+            flash('Server is busy, please try again later.')
+            return render_template('login.html'), 503, {'Retry-After': '5'}
+        if valid:
             login_user(user)  # 登入用户
+            login_succeeded(username)
             flash('Login success.')
-            return redirect(url_for('index'))
+            return redirect(url_for('.index'))
 
         flash('Invalid username or password.')
-        return redirect(url_for('login'))
+        return redirect(url_for('.login'))
     return render_template('login.html')
 
 
-@app.route('/logout')
+@main_bp.route('/logout')
 @login_required
 def logout():
     logout_user()
     flash('Goodbye~')
-    return redirect(url_for('index'))
+    return redirect(url_for('.index'))
 
 
-@app.route('/settings', methods=['GET', 'POST'])
+@main_bp.route('/settings', methods=['GET', 'POST'])
 @login_required
 def settings():
     if request.method == 'POST':
@@ -117,7 +228,7 @@ def settings():
 
         if not name or len(name) > 20:
             flash('Invalid input.')
-            return redirect(url_for('settings'))
+            return redirect(url_for('.settings'))
 
         current_user.name = name
         # current_user 会返回当前登录用户的数据库记录对象
@@ -126,12 +237,12 @@ def settings():
         # user.name = name
         db.session.commit()
         flash('Settings updated.')
-        return redirect(url_for('index'))
+        return redirect(url_for('.index'))
 
     return render_template('settings.html')
 
 
-@app.route('/hello')
+@main_bp.route('/hello')
 def hello():
     """
     测试函数
@@ -141,7 +252,7 @@ def hello():
             "<img src='https://helloflask.com/totoro.gif'>")
 
 
-@app.route('/user/<name>')
+@main_bp.route('/user/<name>')
 def user_page(name):
     """
     用户页面
@@ -149,18 +260,18 @@ def user_page(name):
     return f"Hello, {escape(name)}!"
 
 
-@app.route('/test')
+@main_bp.route('/test')
 def test_url_for():
     """
     测试url_for函数
     """
-    print(url_for('hello'))
-    print(url_for('user_page', name='hyoung'))
-    print(url_for('user_page', name='yzlevol'))
-    print(url_for('test_url_for'))
-    print(url_for('test_url_for', num=2))
+    print(url_for('.hello'))
+    print(url_for('.user_page', name='hyoung'))
+    print(url_for('.user_page', name='yzlevol'))
+    print(url_for('.test_url_for'))
+    print(url_for('.test_url_for', num=2))
     return 'Test page'
 
-# @app.route('/index')
+# @main_bp.route('/index')
 # def index():
 #     return render_template('index.html', name=name, movies=movies)
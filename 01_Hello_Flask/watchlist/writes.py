@@ -0,0 +1,199 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from flask import current_app
+from sqlalchemy import delete, insert, update
+
+from watchlist.cache import invalidate
+from watchlist.extensions import db
+from watchlist.models import Movie
+from watchlist.replica import mark_written
+
+# 合并写入（group commit）
+# 默认每次添加、编辑、删除电影都单独提交一个事务，并发的写请求逐个等待写锁、逐个 fsync。
+# 开启 WATCHLIST_WRITE_BATCH 后写操作交给后台写线程，排队中的写操作在一个事务中提交。
+# 发起请求的线程等待所在的批次提交后才返回，所以重定向后的页面一定能读到刚写入的数据。
+
+logger = logging.getLogger(__name__)
+
+
+def operation(*models, identities=None):
+    """
+    声明写操作修改的模型，提交后使这些模型的缓存失效
+
+    写操作是普通函数，第一个参数是数据库连接，返回值交给发起请求的线程。
+    identities 根据写操作的参数返回修改的记录 [(模型名, 主键)]，记录缓存中只删除这些记录；
+    不提供时删除这些模型的所有记录。
+    """
+
+    def decorator(f):
+        f.models = models
+        f.identities = identities
+        return f
+
+    return decorator
+
+
+def _invalidate(func, args):
+    invalidate(*func.models, identities=func.identities(*args) if func.identities else None)
+
+
+@operation('Movie', identities=lambda user_id, title, year: [])
+def create_movie(connection, user_id, title, year):
+    result = connection.execute(insert(Movie.__table__).values(title=title, year=year, user_id=user_id))
+    return result.inserted_primary_key[0]
+
+
+@operation('Movie', identities=lambda user_id, movie_id, title, year: [('Movie', movie_id)])
+def update_movie(connection, user_id, movie_id, title, year):
+    """
+    返回修改的行数，电影不存在或属于其他用户时为 0
+    """
+    stmt = update(Movie.__table__).where(Movie.id == movie_id, Movie.user_id == user_id)
+    return connection.execute(stmt.values(title=title, year=year)).rowcount
+
+
+@operation('Movie', identities=lambda user_id, movie_id: [('Movie', movie_id)])
+def delete_movie(connection, user_id, movie_id):
+    """
+    返回删除的行数，电影不存在或属于其他用户时为 0
+    """
+    stmt = delete(Movie.__table__).where(Movie.id == movie_id, Movie.user_id == user_id)
+    return connection.execute(stmt).rowcount
+
+
+class WriteBatcher(object):
+    """
+    后台写线程，把排队的写操作（最多 max_batch 个）放在一个事务中提交
+
+    上一批提交期间到达的写操作自然会合并到下一批，所以并发越高每批越大，没有并发时也不增加延迟；
+    window 大于 0 时每批再多等 window 秒，收集更多写操作。批中有写操作失败时整批回滚，
+    再逐个单独提交，只有失败的请求收到异常。
+    """
+
+    def __init__(self, app, engine, window=0, max_batch=100):
+        self.app = app
+        self.engine = engine
+        self.window = window
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.batches = 0  # 提交的事务数
+        self.writes = 0  # 提交的写操作数
+
+    def submit(self, func, *args):
+        """
+        提交一个写操作，返回 Future，结果为写操作的返回值
+        """
+        future = Future()
+        self._start()
+        self.queue.put((func, args, future))
+        return future
+
+    def close(self):
+        """
+        提交队列中剩余的写操作后停止写线程
+        """
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is not None:
+            self.queue.put(None)
+            thread.join()
+
+    def _start(self):
+        if self.thread is not None:
+            return
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='watchlist-writer', daemon=True)
+                self.thread.start()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            self._commit(self._collect(item))
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            try:
+                item = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if item is None:
+                # 先提交这一批，再由 _run 退出
+                self.queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _commit(self, batch):
+        batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            with self.engine.begin() as connection:
+                results = [func(connection, *args) for func, args, future in batch]
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][2].set_exception(e)
+                return
+            for func, args, future in batch:
+                self._commit_one(func, args, future)
+            return
+        self._committed(batch, results)
+
+    def _commit_one(self, func, args, future):
+        try:
+            with self.engine.begin() as connection:
+                result = func(connection, *args)
+        except Exception as e:
+            future.set_exception(e)
+        else:
+            self._committed([(func, args, future)], [result])
+
+    def _committed(self, batch, results):
+        self.batches += 1
+        self.writes += len(batch)
+        # 先使缓存失效再通知请求线程，保证请求返回后读到的是新数据
+        try:
+            with self.app.app_context():
+                for func, args, future in batch:
+                    _invalidate(func, args)
+        except Exception:
+            logger.exception('Failed to invalidate caches after a batched write')
+        for (func, args, future), result in zip(batch, results):
+            future.set_result(result)
+
+
+def write(func, *args):
+    """
+    执行一个写操作并等待提交，返回写操作的返回值
+
+    开启合并写入时交给写线程，和其他请求的写操作一起提交；否则在当前会话中执行并提交。
+    """
+    batcher = current_app.extensions.get('watchlist_writes')
+    if batcher is not None:
+        result = batcher.submit(func, *args).result()
+    else:
+        result = func(db.session.connection(), *args)
+        db.session.commit()
+        _invalidate(func, args)
+    mark_written()
+    return result
+
+
+def init_app(app):
+    if not app.config['WATCHLIST_WRITE_BATCH']:
+        return
+    with app.app_context():
+        engine = db.engine
+    app.extensions['watchlist_writes'] = WriteBatcher(app, engine, app.config['WATCHLIST_WRITE_WINDOW'] / 1000.0,
+                                                      app.config['WATCHLIST_WRITE_MAX_BATCH'])